@@ -0,0 +1,150 @@
+import os
+import json
+import math
+import faiss
+
+INDEX_TYPES = ('flat', 'ivf', 'hnsw', 'ivfpq', 'sq8', 'sqfp16')
+
+DEFAULT_PARAMS = {
+    'flat': {},
+    'ivf': {'nlist': 1024, 'nprobe': 16},
+    'hnsw': {'M': 32, 'efConstruction': 200, 'efSearch': 64},
+    'ivfpq': {'nlist': 1024, 'nprobe': 16, 'm': 48, 'nbits': 8, 'rerank': 0},
+    'sq8': {'rerank': 0},
+    'sqfp16': {'rerank': 0},
+}
+
+# Parameters that only affect search and can change without a rebuild.
+# rerank=r fetches r * top_k candidates and rescores them exactly against
+# the full-precision vector store (0 = off).
+SEARCH_PARAMS = ('nprobe', 'efSearch', 'rerank')
+
+# Lossy index types; a full-precision copy of the vectors is kept next to them
+COMPRESSED_TYPES = ('ivfpq', 'sq8', 'sqfp16')
+
+CONFIG_FILE = "index_config.json"
+
+
+def resolve_config(index_type='flat', params=None):
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
+    merged = dict(DEFAULT_PARAMS[index_type])
+    for key, value in (params or {}).items():
+        if key not in merged:
+            raise ValueError(f"Unknown parameter '{key}' for index type '{index_type}'")
+        merged[key] = int(value)
+    return {'index_type': index_type, 'params': merged}
+
+
+def parse_spec(spec):
+    # "ivf:nlist=1024,nprobe=16" -> resolved config
+    index_type, _, rest = spec.partition(':')
+    params = {}
+    for item in filter(None, rest.split(',')):
+        key, _, value = item.partition('=')
+        params[key.strip()] = value.strip()
+    return resolve_config(index_type.strip(), params)
+
+
+def describe(config):
+    params = ','.join(f"{k}={v}" for k, v in config['params'].items())
+    return f"{config['index_type']}:{params}" if params else config['index_type']
+
+
+def _build_params(config):
+    return {k: v for k, v in config['params'].items() if k not in SEARCH_PARAMS}
+
+
+def needs_rebuild(built, wanted):
+    if built is None or built['index_type'] != wanted['index_type']:
+        return True
+    return _build_params(built) != _build_params(wanted)
+
+
+def supports_remove(config):
+    # HNSW graphs cannot drop vectors, so changed/deleted pages force a rebuild
+    return config['index_type'] != 'hnsw'
+
+
+def keeps_full_vectors(config):
+    return config['index_type'] in COMPRESSED_TYPES
+
+
+def rerank_factor(config):
+    return config['params'].get('rerank', 0)
+
+
+def build_index(config, d, train_vectors=None):
+    kind = config['index_type']
+    params = config['params']
+    trained = {}
+
+    if kind == 'flat':
+        index = faiss.IndexIDMap2(faiss.IndexFlatIP(d))
+    elif kind == 'hnsw':
+        base = faiss.IndexHNSWFlat(d, params['M'], faiss.METRIC_INNER_PRODUCT)
+        base.hnsw.efConstruction = params['efConstruction']
+        index = faiss.IndexIDMap2(base)
+    elif kind in ('sq8', 'sqfp16'):
+        # sq8 learns a per-dimension value range (4x smaller than float32);
+        # fp16 needs no training (2x smaller)
+        qtype = faiss.ScalarQuantizer.QT_8bit if kind == 'sq8' else faiss.ScalarQuantizer.QT_fp16
+        base = faiss.IndexScalarQuantizer(d, qtype, faiss.METRIC_INNER_PRODUCT)
+        if kind == 'sq8':
+            if train_vectors is None or len(train_vectors) == 0:
+                raise ValueError("Index type 'sq8' needs training vectors")
+            base.train(train_vectors)
+        index = faiss.IndexIDMap2(base)
+    else:
+        n_train = len(train_vectors) if train_vectors is not None else 0
+        if n_train == 0:
+            raise ValueError(f"Index type '{kind}' needs training vectors")
+        # Small corpora cannot fill the requested number of clusters / codes
+        nlist = max(1, min(params['nlist'], n_train))
+        trained['nlist'] = nlist
+        if kind == 'ivf':
+            factory = f"IVF{nlist},Flat"
+        else:
+            if d % params['m'] != 0:
+                raise ValueError(f"PQ m={params['m']} must divide the embedding size {d}")
+            nbits = max(1, min(params['nbits'], int(math.log2(n_train))))
+            trained['nbits'] = nbits
+            factory = f"IVF{nlist},PQ{params['m']}x{nbits}"
+        # IVF indexes store external IDs themselves, no IDMap wrapper needed
+        index = faiss.index_factory(d, factory, faiss.METRIC_INNER_PRODUCT)
+        index.train(train_vectors)
+
+    apply_search_params(index, config)
+    return index, trained
+
+
+def apply_search_params(index, config):
+    params = config['params']
+    space = faiss.ParameterSpace()
+    if config['index_type'] in ('ivf', 'ivfpq'):
+        space.set_index_parameter(index, 'nprobe', params['nprobe'])
+    elif config['index_type'] == 'hnsw':
+        space.set_index_parameter(index, 'efSearch', params['efSearch'])
+
+
+def read_index(path, mmap=False):
+    # mmap=True maps the stored vectors/codes from the file instead of reading
+    # them into memory: near-instant loads and page-cache sharing between
+    # processes, but the index must not be modified afterwards
+    if mmap:
+        return faiss.read_index(path, faiss.IO_FLAG_MMAP_IFC if hasattr(faiss, 'IO_FLAG_MMAP_IFC') else faiss.IO_FLAG_MMAP)
+    return faiss.read_index(path)
+
+
+def load_config(cache_dir):
+    path = os.path.join(cache_dir, CONFIG_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_config(cache_dir, config, trained=None):
+    path = os.path.join(cache_dir, CONFIG_FILE)
+    with open(path, "w") as f:
+        json.dump({**config, 'trained': trained or {}}, f, indent=2)
@@ -0,0 +1,169 @@
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+from ingest import PipelineStats
+
+# Offline replay of many queries (evaluation, cache warming):
+#   python batch_search.py queries.jsonl results.jsonl --batch-size 512 --workers 8
+#
+# Input lines: {"query": "...", "ranker": "hybrid", "top_k": 10, "id": ...}
+# ("ranker", "top_k" and "id" are optional). Each batch is encoded in one call
+# and searched with one multi-query index.search; the link rankers then run
+# in worker processes while the next batch is encoded. Output lines are
+# written in input order: {"id", "query", "ranker", "results"}.
+
+RANKERS = ("vector", "pagerank", "hits", "hybrid")
+BATCH_SIZE = 256
+
+_engine = None
+
+
+def candidate_depth(ranker, top_k):
+    # The link rankers re-rank a deeper vector candidate list
+    return top_k * 3 if ranker in ("pagerank", "hits") else top_k
+
+
+def _init_worker():
+    global _engine
+    if _engine is None:
+        # Workers only re-rank given candidates; they never need the encoder
+        from link_model import SearchEngine
+        _engine = SearchEngine(None)
+
+
+def rank(items):
+    # items: (ranker, query, candidates, top_k) -> ranked results
+    _init_worker()
+    ranked = []
+    for ranker, query, candidates, top_k in items:
+        if ranker == "vector":
+            ranked.append(candidates[:top_k])
+        elif ranker == "hybrid":
+            ranked.append(_engine.hybrid_model(query, candidates, top_k))
+        elif ranker == "pagerank":
+            ranked.append(_engine.pagerank_model(query, candidates, top_k))
+        else:
+            ranked.append(_engine.hits_model(query, candidates, top_k))
+    return ranked
+
+
+def read_requests(path, default_ranker, default_top_k):
+    with (sys.stdin if path == "-" else open(path, encoding="utf-8")) as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            ranker = request.get("ranker", default_ranker)
+            if ranker not in RANKERS:
+                raise ValueError(f"line {line_no}: unknown ranker {ranker!r}, expected one of {RANKERS}")
+            yield {
+                "id": request.get("id", line_no),
+                "query": request["query"],
+                "ranker": ranker,
+                "top_k": int(request.get("top_k", default_top_k)),
+            }
+
+
+def batches(requests, size):
+    batch = []
+    for request in requests:
+        batch.append(request)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def run(vector_model, requests, out, batch_size=BATCH_SIZE, workers=None):
+    global _engine
+    from link_model import SearchEngine
+
+    stats = PipelineStats()
+    # Built (and the link graph compiled if needed) before forking, so the
+    # workers inherit the memory-mapped graph instead of rebuilding it
+    _engine = SearchEngine(vector_model)
+    workers = os.cpu_count() if workers is None else workers
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) if workers > 1 else None
+
+    def write(batch, ranked):
+        with stats.stage("write", len(batch)):
+            for request, results in zip(batch, ranked):
+                out.write(json.dumps({**{k: request[k] for k in ("id", "query", "ranker")}, "results": results}) + "\n")
+
+    def collect(batch, futures):
+        with stats.stage("rank_wait", len(batch)):
+            ranked = [results for future in futures for results in future.result()]
+        write(batch, ranked)
+
+    pending = None
+    try:
+        for batch in stats.timed("read", batches(requests, batch_size)):
+            depths = [candidate_depth(r["ranker"], r["top_k"]) for r in batch]
+            with stats.stage("encode", len(batch)):
+                embeddings = vector_model.encode_queries([r["query"] for r in batch])
+            with stats.stage("search", len(batch)):
+                distances, indices = vector_model.search_vectors(embeddings, max(depths))
+                candidates = [vector_model.hydrate(distances[i][:k], indices[i][:k]) for i, k in enumerate(depths)]
+
+            items = [(r["ranker"], r["query"], c, r["top_k"]) for r, c in zip(batch, candidates)]
+            if pool is None:
+                with stats.stage("rank", len(batch)):
+                    write(batch, rank(items))
+                continue
+
+            # The workers rank this batch while the previous one is written
+            # and the next one is encoded
+            chunk = -(-len(items) // workers)
+            futures = [pool.submit(rank, items[i:i + chunk]) for i in range(0, len(items), chunk)]
+            if pending is not None:
+                collect(*pending)
+            pending = (batch, futures)
+        if pending is not None:
+            collect(*pending)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return stats
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Run a JSONL file of queries through the vector index and link rankers")
+    parser.add_argument("input", help="JSONL queries, '-' for stdin")
+    parser.add_argument("output", nargs="?", default="-", help="JSONL results, '-' for stdout")
+    parser.add_argument("--cache-dir", default=os.getenv("CACHE_PATH", "faiss"))
+    parser.add_argument("--data-path", default=os.getenv("COMBINED_DATA_PATH", "combined_data_new.csv"))
+    parser.add_argument("--ranker", default="vector", choices=RANKERS, help="ranker for lines without one")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=None, help="ranking processes (default: all cores, 1 = in-process)")
+    args = parser.parse_args()
+
+    # SearchEngine locates the link graph through COMBINED_DATA_PATH
+    os.environ["COMBINED_DATA_PATH"] = os.path.abspath(args.data_path)
+    from vector_model import BertFaissVectorModel
+    vector_model = BertFaissVectorModel(args.data_path, args.cache_dir)
+    requests = read_requests(args.input, args.ranker, args.top_k)
+
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    start = time.perf_counter()
+    try:
+        stats = run(vector_model, requests, out, args.batch_size, args.workers)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    # Stage times overlap when ranking runs in the workers; the total is wall-clock
+    total = time.perf_counter() - start
+    queries = stats.stages.get("read", (0, 0))[1]
+    print(f"{queries} queries in {total:.2f} s ({queries / total if total else 0:.1f} queries/s)", file=sys.stderr)
+    stats.report(file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
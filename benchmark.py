@@ -0,0 +1,239 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import numpy as np
+import pandas as pd
+from synthetic_corpus import CorpusGenerator
+
+# Reproducible end-to-end performance benchmark on a synthetic crawl:
+#   python benchmark.py --pages 20000 --queries 500 --encoder hashing --save-baseline bench_baseline.json
+#   python benchmark.py --pages 20000 --queries 500 --encoder hashing --baseline bench_baseline.json
+#
+# Every stage is timed on its own: ingest/clean, embed, index build, link
+# graph build, FAISS search, metadata hydration, the link rankers and the
+# HTTP endpoints (in-process through the FastAPI test client). Per-query
+# stages report p50/p95/p99 latency and throughput; bulk stages report
+# throughput. Peak RSS is recorded once for the whole run: ru_maxrss never
+# goes down, so a per-stage reading would repeat the peak of the heaviest
+# stage so far. With --baseline the run fails (exit 1) when a stage is
+# slower, or the run uses more memory, than the stored baseline by more
+# than --tolerance.
+
+ENDPOINT_RANKERS = ("vector", "pagerank", "hits", "hybrid")
+EMBED_BATCH_SIZE = 1024
+# Unmeasured calls before each per-call stage (lazy loads, cold page cache)
+WARMUP_CALLS = 10
+# Absolute slack on top of the relative tolerance, so sub-millisecond
+# stages do not fail on timer noise
+LATENCY_SLACK_MS = 0.05
+# Gated latency percentiles; p99 of a few hundred calls is too noisy to gate on
+GATED_PERCENTILES = ("p50_ms", "p95_ms")
+# Stages that time the harness itself, not the code under test
+UNGATED_STAGES = ("generate",)
+
+
+def peak_rss_mb():
+    # Peak RSS of the process so far; ru_maxrss is in KiB on Linux (bytes on macOS)
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2**20 if sys.platform == "darwin" else rss / 2**10
+
+
+class Benchmark:
+    def __init__(self):
+        self.stages = {}
+
+    def bulk(self, name, rows, seconds):
+        self.stages[name] = {
+            "count": int(rows),
+            "seconds": round(seconds, 4),
+            "throughput": round(rows / seconds, 2) if seconds > 0 else None,
+        }
+        print(f"  {name:<18} {rows:>9} items  {seconds:9.3f} s  {self.stages[name]['throughput'] or 0:>12.1f} /s",
+              file=sys.stderr)
+
+    def per_call(self, name, fn, inputs):
+        # Calls fn once per input and records the latency distribution
+        for item in inputs[:WARMUP_CALLS]:
+            fn(item)
+        latencies = []
+        outputs = []
+        for item in inputs:
+            start = time.perf_counter()
+            outputs.append(fn(item))
+            latencies.append((time.perf_counter() - start) * 1000)
+        latencies = np.array(latencies)
+        total = latencies.sum() / 1000
+        self.stages[name] = {
+            "count": len(latencies),
+            "seconds": round(total, 4),
+            "throughput": round(len(latencies) / total, 2) if total > 0 else None,
+            "p50_ms": round(float(np.percentile(latencies, 50)), 4),
+            "p95_ms": round(float(np.percentile(latencies, 95)), 4),
+            "p99_ms": round(float(np.percentile(latencies, 99)), 4),
+        }
+        stage = self.stages[name]
+        print(f"  {name:<18} {len(latencies):>9} calls  p50 {stage['p50_ms']:8.3f}  p95 {stage['p95_ms']:8.3f}  "
+              f"p99 {stage['p99_ms']:8.3f} ms  {stage['throughput'] or 0:>10.1f} /s", file=sys.stderr)
+        return outputs
+
+
+def run(args):
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="ir_bench_")
+    os.makedirs(work_dir, exist_ok=True)
+    combined_path = os.path.join(work_dir, "combined.csv")
+    cache_dir = os.path.join(work_dir, "faiss")
+    bench = Benchmark()
+
+    generator = CorpusGenerator(args.pages, sites=args.sites, mirror_rate=args.mirror_rate, seed=args.seed)
+    start = time.perf_counter()
+    csv_files = generator.write(os.path.join(work_dir, "crawl"), files=args.files)
+    bench.bulk("generate", args.pages, time.perf_counter() - start)
+
+    import ingest
+    start = time.perf_counter()
+    ingest.run(csv_files, combined_path, vector_model=None, chunk_size=args.chunk_size,
+               near_dup_threshold=args.near_dup_threshold or None)
+    bench.bulk("ingest_clean", args.pages, time.perf_counter() - start)
+
+    from vector_model import BertFaissVectorModel
+    vector_model = BertFaissVectorModel(combined_path, cache_dir, model_name=args.encoder,
+                                        index_type=args.index_type, index_params=args.index_params,
+                                        shards=args.shards, shard_by=args.shard_by)
+    embed_seconds = index_seconds = 0.0
+    documents = 0
+    vector_model.start_bulk_index(expected_documents=len(pd.read_csv(combined_path, usecols=["url"])))
+    for chunk in pd.read_csv(combined_path, chunksize=EMBED_BATCH_SIZE):
+        start = time.perf_counter()
+        embeddings = vector_model.embed_documents(chunk)
+        embed_seconds += time.perf_counter() - start
+        start = time.perf_counter()
+        vector_model.append_documents(chunk, embeddings)
+        index_seconds += time.perf_counter() - start
+        documents += len(chunk)
+    start = time.perf_counter()
+    vector_model.finish_bulk_index()
+    index_seconds += time.perf_counter() - start
+    bench.bulk("embed", documents, embed_seconds)
+    bench.bulk("index_build", documents, index_seconds)
+
+    from link_graph import LinkGraph, SOURCE_COLUMNS
+    start = time.perf_counter()
+    LinkGraph.build(pd.read_csv(combined_path, usecols=SOURCE_COLUMNS),
+                    os.path.join(work_dir, "link_graph"), combined_path)
+    bench.bulk("link_graph_build", documents, time.perf_counter() - start)
+
+    queries = generator.queries(args.queries, seed=args.seed + 1)
+    k = args.top_k
+    embeddings = bench.per_call("encode_query", lambda q: vector_model.encode_queries([q]), queries)
+    hits = bench.per_call("faiss_search", lambda e: vector_model.search_vectors(e, k * 3), embeddings)
+    candidates = bench.per_call("hydrate", lambda h: vector_model.hydrate(h[0][0], h[1][0]), hits)
+
+    os.environ["COMBINED_DATA_PATH"] = combined_path
+    from link_model import SearchEngine
+    engine = SearchEngine(vector_model)
+    pairs = list(zip(queries, candidates))
+    bench.per_call("rank_pagerank", lambda p: engine.pagerank_model(p[0], p[1], k), pairs)
+    bench.per_call("rank_hits", lambda p: engine.hits_model(p[0], p[1], k), pairs)
+    bench.per_call("rank_hybrid", lambda p: engine.hybrid_model(p[0], p[1][:k], k), pairs)
+
+    # The server reads its configuration from the environment at import;
+    # caches are disabled so every request does the full work
+    os.environ.update({
+        "FAISS_CACHE_PATH": cache_dir,
+        "ENCODER_MODEL": args.encoder,
+        "TFIDF_CACHE_PATH": os.path.join(work_dir, "tfidf"),
+        "RESULT_CACHE_SIZE": "0",
+        "EMBEDDING_CACHE_SIZE": "0",
+    })
+    from fastapi.testclient import TestClient
+    import faiss_server
+    with TestClient(faiss_server.app) as client:
+        for ranker in ENDPOINT_RANKERS:
+            bench.per_call(f"endpoint_{ranker}",
+                           lambda q: client.post(f"/search/{ranker}", json={"query": q, "top_k": k}).raise_for_status(),
+                           queries)
+
+    if not args.work_dir:
+        shutil.rmtree(work_dir)
+    return {
+        "config": {
+            "pages": args.pages, "files": args.files, "sites": args.sites, "queries": args.queries,
+            "top_k": k, "seed": args.seed, "encoder": args.encoder, "index_type": args.index_type,
+            "index_params": args.index_params, "shards": args.shards, "shard_by": args.shard_by,
+            "mirror_rate": args.mirror_rate, "near_dup_threshold": args.near_dup_threshold,
+        },
+        "stages": bench.stages,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def compare(report, baseline, tolerance):
+    # Regressions of the current report against the baseline, as messages
+    if report["config"] != baseline["config"]:
+        return [f"baseline was recorded with a different configuration: {baseline['config']}"]
+    regressions = []
+    for name, stage in report["stages"].items():
+        base = baseline["stages"].get(name)
+        if base is None or name in UNGATED_STAGES:
+            continue
+        for metric in GATED_PERCENTILES:
+            if metric in stage and stage[metric] > base[metric] * (1 + tolerance) + LATENCY_SLACK_MS:
+                regressions.append(f"{name} {metric}: {stage[metric]:.3f} vs baseline {base[metric]:.3f}")
+        if stage.get("throughput") and base.get("throughput") and \
+                stage["throughput"] < base["throughput"] / (1 + tolerance):
+            regressions.append(f"{name} throughput: {stage['throughput']:.1f}/s vs baseline {base['throughput']:.1f}/s")
+    if report["peak_rss_mb"] > baseline["peak_rss_mb"] * (1 + tolerance):
+        regressions.append(f"peak RSS: {report['peak_rss_mb']:.1f} MB vs baseline {baseline['peak_rss_mb']:.1f} MB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic-corpus performance benchmark")
+    parser.add_argument("--pages", type=int, default=10000)
+    parser.add_argument("--files", type=int, default=4)
+    parser.add_argument("--sites", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--encoder", default="hashing", help="'hashing' (offline stub) or a SentenceTransformer model")
+    parser.add_argument("--index-spec", default="flat", help="ann_index spec, e.g. ivf:nlist=256,nprobe=16")
+    parser.add_argument("--shards", type=int, default=1, help="index shards searched in parallel")
+    parser.add_argument("--shard-by", default="range", choices=("range", "hash"))
+    parser.add_argument("--mirror-rate", type=float, default=0.0, help="share of pages with near-duplicate copies")
+    parser.add_argument("--near-dup-threshold", type=float, default=0.8, help="0 keeps near-duplicate pages")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="ingestion chunk size")
+    parser.add_argument("--work-dir", help="write (and keep) the corpus and indexes here instead of a temp dir")
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--baseline", help="fail if results regress against this report")
+    parser.add_argument("--save-baseline", help="write the report as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    args = parser.parse_args()
+
+    import ann_index
+    config = ann_index.parse_spec(args.index_spec)
+    args.index_type, args.index_params = config["index_type"], config["params"]
+
+    report = run(args)
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+    print(f"Peak RSS: {report['peak_rss_mb']:.1f} MB", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print("Regressions beyond the baseline:", file=sys.stderr)
+            for message in regressions:
+                print(f"  {message}", file=sys.stderr)
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} of the baseline.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,93 +1,121 @@
 import sys
 import json
 import os
-import pandas as pd
-from urllib.parse import urlparse
+import socket
+import socketserver
+import contextlib
+import signal
 from dotenv import load_dotenv
-from vector_model import BertKNNVectorModel
-from link_model import SearchEngine
-import nltk
-import re
-from nltk.corpus import stopwords
-from nltk.stem import WordNetLemmatizer
 
 
-# Download NLTK resources
-nltk.download('stopwords')
-nltk.download('wordnet')
-nltk.download('omw-1.4')
-
 load_dotenv()
 
-# Text cleaning setup
-stop_words = set(stopwords.words('english'))
-lemmatizer = WordNetLemmatizer()
-
-def clean_text(text):
-    if pd.isna(text):
-        return ""
-    text = text.lower()
-    text = re.sub(r'[^a-z\s]', '', text)  
-    words = text.split()
-    words = [lemmatizer.lemmatize(w) for w in words if w not in stop_words]
-    return ' '.join(words)
-
-def resolve_description(row):
-    desc = row['meta_description']
-    if (
-        pd.isna(desc) or 
-        not desc or 
-        desc.strip().lower() == 'no description' or 
-        re.match(r'^https?://', str(desc).strip())
-    ):
-        tokens = row['body_text'].split()
-        return ' '.join(tokens[:30])
-    return desc
-
-
-def get_directory_and_slug(url):
-    path = urlparse(url).path.rstrip('/')
-    if not path:
-        return '', ''
-    parts = path.split('/')
-    return ('/'.join(parts[:-1]), parts[-1]) if len(parts) > 1 else ('', parts[0])
-
-def get_url_key(url):
-    parsed = urlparse(url)
-    directory, slug = get_directory_and_slug(url)
-    return (parsed.netloc.lower(), directory, slug)
-
-if __name__ == "__main__":    
+# Long-lived query daemon; `python clean_data.py "<query>" <model>` forwards to
+# it when it is running and only falls back to loading the models itself.
+SOCKET_PATH = os.getenv("QUERY_DAEMON_SOCKET", "/tmp/ir_query_daemon.sock")
+
+
+def load_models():
+    from vector_model import BertFaissVectorModel
+    from link_model import SearchEngine
+
     combined_data_path = os.getenv("COMBINED_DATA_PATH")
     current_dir = os.path.dirname(os.path.abspath(__file__))
     combined_data_path = os.path.join(current_dir, combined_data_path)
 
     cache_path = os.getenv("CACHE_PATH")
 
-    vector_model = BertKNNVectorModel(combined_data_path, cache_path)
-    # vector_model.preprocess_and_index()
+    # Model loading logs must not end up in the JSON printed on stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        vector_model = BertFaissVectorModel(combined_data_path, cache_path)
+        # vector_model.preprocess_and_index()
+        link_engine = SearchEngine(vector_model)
+    return vector_model, link_engine
 
-    query = sys.argv[1]
-    model = sys.argv[2]
-    
-    link_engine = SearchEngine(vector_model)
-    
+def run_query(vector_model, link_engine, query, model):
     if(model == 'page_rank'):
         #For PageRank
-        results = link_engine.pagerank_model(query)
-        print(json.dumps(results))
+        return link_engine.pagerank_model(query)
 
     elif(model == 'hits'):
         #For HITS
-        results = link_engine.hits_model(query)
-        print(json.dumps(results))
+        return link_engine.hits_model(query)
 
     elif(model == 'hybrid'):
         #For Hybrid
-        results = link_engine.hybrid_model(query)
-        print(json.dumps(results))
-    
+        return link_engine.hybrid_model(query)
+
     else:
         #For asking a Question:
-        results = vector_model.search(query)
-        print(json.dumps(results))
\ No newline at end of file
+        return vector_model.search(query)
+
+def handle_request(models, line):
+    # One JSON-lines request: {"query": "...", "model": "hybrid"} -> {"results": [...]}
+    try:
+        request = json.loads(line)
+        with contextlib.redirect_stdout(sys.stderr):
+            results = run_query(*models, request['query'], request.get('model', ''))
+        return json.dumps({"results": results})
+    except Exception as e:
+        return json.dumps({"error": f"{type(e).__name__}: {e}"})
+
+def serve_socket(path):
+    models = load_models()
+
+    class QueryHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                if line.strip():
+                    self.wfile.write((handle_request(models, line) + "\n").encode('utf-8'))
+                    self.wfile.flush()
+
+    if os.path.exists(path):
+        os.remove(path)
+    # Exit through the finally below (removing the socket file) on SIGTERM too
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    # Requests are served one at a time; the models stay resident between them
+    with socketserver.UnixStreamServer(path, QueryHandler) as server:
+        print(f"✅ Query daemon listening on {path}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        finally:
+            os.remove(path)
+
+def serve_stdio():
+    models = load_models()
+    for line in sys.stdin:
+        if line.strip():
+            sys.stdout.write(handle_request(models, line) + "\n")
+            sys.stdout.flush()
+
+def query_daemon(path, query, model):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        sock.sendall((json.dumps({"query": query, "model": model}) + "\n").encode('utf-8'))
+        with sock.makefile('r', encoding='utf-8') as f:
+            response = json.loads(f.readline())
+    if "error" in response:
+        raise RuntimeError(response["error"])
+    return response["results"]
+
+if __name__ == "__main__":
+    # python clean_data.py --serve [socket_path]   keep models warm behind a Unix socket
+    # python clean_data.py --stdio                 JSON-lines requests on stdin/stdout
+    # python clean_data.py "<query>" <model>       one query (via the daemon if it is up)
+    if sys.argv[1] == '--serve':
+        serve_socket(sys.argv[2] if len(sys.argv) > 2 else SOCKET_PATH)
+
+    elif sys.argv[1] == '--stdio':
+        serve_stdio()
+
+    else:
+        query = sys.argv[1]
+        model = sys.argv[2]
+
+        try:
+            results = query_daemon(SOCKET_PATH, query, model)
+        except (FileNotFoundError, ConnectionRefusedError):
+            models = load_models()
+            with contextlib.redirect_stdout(sys.stderr):
+                results = run_query(*models, query, model)
+        print(json.dumps(results))
@@ -0,0 +1,151 @@
+import os
+import json
+import shutil
+import hashlib
+import multiprocessing
+import numpy as np
+from encoders import load_encoder
+
+# Resumable corpus embedding into a preallocated memory-mapped float32 array.
+#
+#   <path>/job.json          corpus fingerprint, shape, model, finished shards
+#   <path>/embeddings.f32    (n, d) row-major float32, row i <-> texts[i]
+#
+# Texts are sorted by length and cut into shards of similar-length texts, so
+# batches carry little padding. Shards are encoded by a pool of worker
+# processes (each with its own encoder and a capped thread count) and
+# written straight into the memmap. Each finished shard is recorded in
+# job.json, so a restarted job only encodes the shards that are missing.
+
+SHARD_SIZE = 4096
+BATCH_SIZE = 64
+
+_encoder = None
+_batch_size = BATCH_SIZE
+
+
+def _fingerprint(texts, model_name, shard_size):
+    digest = hashlib.md5(f"{model_name}:{shard_size}".encode('utf-8'))
+    for text in texts:
+        digest.update(hashlib.md5(text.encode('utf-8')).digest())
+    return digest.hexdigest()
+
+
+def _init_worker(model_name, batch_size, threads):
+    # Pool initializer, run in spawned worker processes only: the thread
+    # limits below apply to the whole process
+    global _encoder, _batch_size
+    # Keep workers x threads within the machine instead of every worker
+    # spawning one BLAS/OpenMP thread per core
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    _encoder = load_encoder(model_name, threads)
+    _batch_size = batch_size
+
+
+def _encode_shard(path, shape, shard_id, rows, texts, encoder=None, batch_size=None):
+    encoder = encoder or _encoder
+    embeddings = encoder.encode(texts, batch_size=batch_size or _batch_size, convert_to_numpy=True, show_progress_bar=False)
+    embeddings = np.asarray(embeddings, dtype='float32')
+    # L2-normalize in place, as faiss.normalize_L2 does for the single-process encode
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    embeddings /= np.maximum(norms, np.finfo('float32').tiny)
+
+    out = np.memmap(path, dtype='float32', mode='r+', shape=shape)
+    out[rows] = embeddings
+    out.flush()
+    del out
+    return shard_id
+
+
+class EmbeddingJob:
+    def __init__(self, path, model_name, dim, shard_size=SHARD_SIZE, batch_size=BATCH_SIZE):
+        self.path = path
+        self.model_name = model_name
+        self.dim = dim
+        self.shard_size = shard_size
+        self.batch_size = batch_size
+        self.job_path = os.path.join(path, "job.json")
+        self.embeddings_path = os.path.join(path, "embeddings.f32")
+
+    def _load_state(self, fingerprint, n):
+        if not os.path.exists(self.job_path) or not os.path.exists(self.embeddings_path):
+            return None
+        with open(self.job_path) as f:
+            state = json.load(f)
+        if state.get("fingerprint") != fingerprint or state.get("shape") != [n, self.dim]:
+            return None
+        return state
+
+    def _save_state(self, state):
+        tmp_path = self.job_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.job_path)
+
+    def _start(self, fingerprint, n):
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
+        os.makedirs(self.path)
+        # Preallocate the whole output; pages are only written as shards finish
+        with open(self.embeddings_path, "wb") as f:
+            f.truncate(n * self.dim * 4)
+        state = {"fingerprint": fingerprint, "shape": [n, self.dim], "model_name": self.model_name, "done": []}
+        self._save_state(state)
+        return state
+
+    def shards(self, texts):
+        # Row numbers of every shard, longest texts first, ties in corpus order
+        lengths = np.fromiter((len(t) for t in texts), dtype='int64', count=len(texts))
+        order = np.lexsort((np.arange(len(texts)), -lengths))
+        return [np.sort(order[i:i + self.shard_size]) for i in range(0, len(order), self.shard_size)]
+
+    def run(self, texts, workers=1, threads_per_worker=None, encoder=None):
+        # Returns the (n, d) read-only memmap of the embeddings. With
+        # workers=1 the shards are encoded in this process with `encoder`
+        # (or a freshly loaded one), leaving its thread settings alone;
+        # threads_per_worker only applies to worker processes.
+        texts = list(texts)
+        n = len(texts)
+        fingerprint = _fingerprint(texts, self.model_name, self.shard_size)
+        state = self._load_state(fingerprint, n)
+        if state is None:
+            state = self._start(fingerprint, n)
+        elif state["done"]:
+            print(f"Resuming embedding job: {len(state['done'])} shards already encoded.")
+
+        done = set(state["done"])
+        shards = self.shards(texts)
+        pending = [i for i in range(len(shards)) if i not in done]
+        shape = (n, self.dim)
+
+        def finished(shard_id):
+            done.add(shard_id)
+            state["done"] = sorted(done)
+            self._save_state(state)
+            print(f"Embedded shard {len(done)}/{len(shards)}")
+
+        if pending and workers <= 1:
+            encoder = encoder or load_encoder(self.model_name)
+            for i in pending:
+                finished(_encode_shard(self.embeddings_path, shape, i, shards[i],
+                                       [texts[r] for r in shards[i]], encoder, self.batch_size))
+        elif pending:
+            threads = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+            # spawn: torch thread pools do not survive fork()
+            context = multiprocessing.get_context("spawn")
+            with context.Pool(workers, initializer=_init_worker,
+                              initargs=(self.model_name, self.batch_size, threads)) as pool:
+                jobs = [pool.apply_async(_encode_shard, (self.embeddings_path, shape, i, shards[i],
+                                                         [texts[r] for r in shards[i]]))
+                        for i in pending]
+                for job in jobs:
+                    finished(job.get())
+
+        if n == 0:
+            return np.zeros(shape, dtype='float32')
+        return np.memmap(self.embeddings_path, dtype='float32', mode='r', shape=shape)
+
+    def cleanup(self):
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
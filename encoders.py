@@ -0,0 +1,40 @@
+import numpy as np
+
+# Text encoders behind BertFaissVectorModel. Model names are passed to
+# SentenceTransformer, except "hashing" / "hashing:<dim>", which selects a
+# dependency-free feature-hashing encoder. It has no semantic quality but
+# the same interface and output shape, so benchmarks and tests run offline
+# and deterministically without downloading a model.
+
+HASHING_PREFIX = "hashing"
+HASHING_DIM = 384
+
+
+class HashingEncoder:
+    def __init__(self, dim=HASHING_DIM):
+        from sklearn.feature_extraction.text import HashingVectorizer
+        self.dim = dim
+        self.vectorizer = HashingVectorizer(n_features=dim, alternate_sign=True, norm='l2')
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def encode(self, sentences, batch_size=32, convert_to_numpy=True, show_progress_bar=False, **kwargs):
+        if isinstance(sentences, str):
+            return self.encode([sentences])[0]
+        embeddings = np.zeros((len(sentences), self.dim), dtype='float32')
+        for start in range(0, len(sentences), max(batch_size, 1)):
+            batch = sentences[start:start + batch_size]
+            embeddings[start:start + len(batch)] = self.vectorizer.transform(batch).toarray()
+        return embeddings
+
+
+def load_encoder(model_name, threads=None):
+    if model_name == HASHING_PREFIX or model_name.startswith(HASHING_PREFIX + ":"):
+        _, _, dim = model_name.partition(":")
+        return HashingEncoder(int(dim) if dim else HASHING_DIM)
+    import torch
+    from sentence_transformers import SentenceTransformer
+    if threads:
+        torch.set_num_threads(threads)
+    return SentenceTransformer(model_name)
@@ -0,0 +1,114 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import faiss
+import ann_index
+from vector_store import VectorStore, rerank
+
+# Compare ANN index settings against exact search on the indexed corpus:
+#   python evaluate_index.py --cache-dir faiss --queries queries.txt \
+#       --spec ivf:nlist=1024,nprobe=16 --spec hnsw:M=32,efSearch=64 --spec ivfpq:nlist=1024,m=48 \
+#       --spec sq8 --spec sq8:rerank=4 --spec sqfp16
+#
+# Memory is the serialized index size (what every server replica holds in
+# RAM); the full-precision vectors used by rerank are memory-mapped from disk.
+
+
+def load_corpus_vectors(cache_dir, embeddings_path=None):
+    if embeddings_path:
+        vectors = np.load(embeddings_path).astype('float32')
+        faiss.normalize_L2(vectors)
+        return vectors
+
+    vectors_path = os.path.join(cache_dir, "vectors")
+    if VectorStore.exists(vectors_path):
+        return np.array(VectorStore(vectors_path).vectors)
+
+    index = faiss.read_index(os.path.join(cache_dir, "faiss.index"))
+    flat = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    if not isinstance(flat, faiss.IndexFlat):
+        sys.exit("The cached index is not flat; pass --embeddings with the corpus vectors instead.")
+    return flat.reconstruct_n(0, flat.ntotal)
+
+
+def load_queries(args, base):
+    if args.queries:
+        from encoders import load_encoder
+        with open(args.queries) as f:
+            queries = [line.strip() for line in f if line.strip()]
+        model = load_encoder(args.model_name)
+        query_vectors = model.encode(queries, convert_to_numpy=True).astype('float32')
+        faiss.normalize_L2(query_vectors)
+        return base, query_vectors
+
+    # Hold out a sample of the corpus as queries so they are not in the index
+    rng = np.random.default_rng(args.seed)
+    held_out = rng.choice(len(base), size=min(args.holdout, len(base) // 10 or 1), replace=False)
+    mask = np.ones(len(base), dtype=bool)
+    mask[held_out] = False
+    return base[mask], base[held_out]
+
+
+def measure(index, queries, k, factor=0, base=None):
+    latencies = []
+    found = np.empty((len(queries), k), dtype='int64')
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        if factor >= 1:
+            _, candidates = index.search(queries[i:i + 1], k * factor)
+            _, ids = rerank(queries[i:i + 1], candidates, lambda c: (base[c], c >= 0), k)
+        else:
+            _, ids = index.search(queries[i:i + 1], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found[i] = ids[0]
+    return found, np.array(latencies)
+
+
+def recall_at_k(found, truth):
+    hits = [len(set(f[f >= 0]) & set(t[t >= 0])) for f, t in zip(found, truth)]
+    return float(np.mean(hits)) / truth.shape[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall@k vs latency report for FAISS index types")
+    parser.add_argument("--cache-dir", default="faiss")
+    parser.add_argument("--embeddings", help=".npy corpus embeddings (if the cached index is not flat)")
+    parser.add_argument("--queries", help="text file with one held-out query per line")
+    parser.add_argument("--holdout", type=int, default=1000, help="corpus vectors used as queries without --queries")
+    parser.add_argument("--model-name", default="all-MiniLM-L6-v2")
+    parser.add_argument("--spec", action="append", default=[], help="index spec, e.g. ivf:nlist=1024,nprobe=16")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(args.threads)
+    base, queries = load_queries(args, load_corpus_vectors(args.cache_dir, args.embeddings))
+    ids = np.arange(len(base), dtype='int64')
+    d = base.shape[1]
+    print(f"Corpus: {len(base)} vectors (d={d}), queries: {len(queries)}, k={args.k}")
+
+    specs = [ann_index.resolve_config('flat')] + [ann_index.parse_spec(s) for s in args.spec]
+    truth = flat_memory = flat_p50 = None
+    print(f"{'index':<40} {'build s':>8} {'MB':>8} {'saved':>7} {'recall@k':>9} "
+          f"{'p50 ms':>8} {'p99 ms':>8} {'mean ms':>8} {'p50 chg':>8}")
+    for config in specs:
+        start = time.perf_counter()
+        index, _ = ann_index.build_index(config, d, train_vectors=base)
+        index.add_with_ids(base, ids)
+        build_time = time.perf_counter() - start
+        memory = len(faiss.serialize_index(index)) / 2**20
+
+        found, latencies = measure(index, queries, args.k, ann_index.rerank_factor(config), base)
+        p50 = np.percentile(latencies, 50)
+        if truth is None:
+            truth, flat_memory, flat_p50 = found, memory, p50
+        print(f"{ann_index.describe(config):<40} {build_time:>8.2f} {memory:>8.1f} {1 - memory / flat_memory:>7.1%} "
+              f"{recall_at_k(found, truth):>9.4f} {p50:>8.3f} {np.percentile(latencies, 99):>8.3f} "
+              f"{latencies.mean():>8.3f} {p50 / flat_p50 - 1:>+8.1%}")
+
+
+if __name__ == "__main__":
+    main()
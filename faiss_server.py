@@ -57,109 +57,414 @@
 # #     return {"results": results}
 
 
-from fastapi import FastAPI
+import asyncio
+import itertools
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import Response
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from sentence_transformers import SentenceTransformer
+from typing import List, Literal, Optional
+from datetime import datetime
+from dotenv import load_dotenv
+from encoders import load_encoder
+from vector_model import BertFaissVectorModel
 from link_model import SearchEngine
+from tf_idf import TfidfSearchEngine
+from retrieval import FusedRetriever
+from query_batcher import QueryBatcher, QueueFullError
+from query_cache import EmbeddingCache, ResultCache, decode_cursor, encode_cursor, normalize_query
+from metrics import CONTENT_TYPE, MetricsMiddleware, SearchMetrics, SlowRequestProfiler
+import snapshot
+import id_filters
 import faiss
-import pickle
-import numpy as np
+import os
+import sys
+
+load_dotenv()
 
 app = FastAPI()
 
-model = SentenceTransformer('all-MiniLM-L6-v2')  
-index = faiss.read_index("faiss/faiss.index")    
-with open("faiss/metadata.pkl", "rb") as f:
-    id_to_metadata = pickle.load(f)    
-    
-search_engine = SearchEngine(model, "combined_data_new.csv") 
-    
+metrics = SearchMetrics()
+# Sampled stack profiles of requests slower than SLOW_REQUEST_MS (off when unset)
+slow_request_ms = float(os.getenv("SLOW_REQUEST_MS", "0"))
+profiler = SlowRequestProfiler(
+    slow_request_ms,
+    sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", "0.01")),
+    out_dir=os.getenv("PROFILE_DIR", "profiles"),
+) if slow_request_ms > 0 else None
+app.add_middleware(MetricsMiddleware, metrics=metrics, profiler=profiler)
+
+combined_data_path = os.getenv("COMBINED_DATA_PATH", "combined_data_new.csv")
+model_name = os.getenv("ENCODER_MODEL", "all-MiniLM-L6-v2")
+# With SNAPSHOT_DIR the server serves the snapshot named in SNAPSHOT_DIR/CURRENT
+# (see snapshot.py) from memory-mapped files and swaps to a new one when
+# CURRENT changes. Without it, it serves the build directories directly.
+snapshot_dir = os.getenv("SNAPSHOT_DIR")
+snapshot_poll = float(os.getenv("SNAPSHOT_POLL_SECONDS", "10"))
+
+# Per-process thread pools of torch (query encoding) and FAISS (search), so
+# that several server processes on one box do not oversubscribe its cores
+torch_threads = int(os.getenv("TORCH_THREADS", "0")) or None
+faiss_threads = int(os.getenv("FAISS_THREADS", "0")) or None
+
+def apply_thread_limits():
+    # Called again by serve.py workers after fork
+    if faiss_threads:
+        faiss.omp_set_num_threads(faiss_threads)
+    if torch_threads and "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(torch_threads)
+
+apply_thread_limits()
+
+# Shared by every snapshot: query embeddings do not depend on the index
+encoder = load_encoder(model_name, threads=torch_threads)
+embedding_cache = EmbeddingCache(max_size=int(os.getenv("EMBEDDING_CACHE_SIZE", "10000")))
+
+result_cache = ResultCache(
+    max_size=int(os.getenv("RESULT_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("RESULT_CACHE_TTL", "300")),
+)
+
+# Paginated search (/search/page) ranks PAGE_DEPTH results once per query
+# and serves every page as a slice of that list
+page_depth = int(os.getenv("PAGE_DEPTH", "100"))
+page_cache = ResultCache(
+    max_size=int(os.getenv("PAGE_CACHE_SIZE", "1000")),
+    ttl=float(os.getenv("PAGE_CACHE_TTL", "600")),
+)
+
+class Services:
+    # Everything that answers queries from one index snapshot
+    def __init__(self, name, faiss_dir, tfidf_dir, graph_dir=None, mmap=False):
+        self.name = name
+        # Loads the FAISS index (with its persisted search params) and the
+        # memory-mapped metadata store; the CSV is not read here.
+        self.vector_model = BertFaissVectorModel(combined_data_path, faiss_dir, model_name=model_name,
+                                                 encoder=encoder, mmap=mmap)
+        self.vector_model.embedding_cache = embedding_cache
+        self.vector_model.exact_scan_max = int(os.getenv("FILTER_EXACT_SCAN_MAX", id_filters.EXACT_SCAN_MAX))
+        self.search_engine = SearchEngine(self.vector_model, graph_dir=graph_dir)
+        self.tfidf_engine = TfidfSearchEngine(combined_data_path, tfidf_dir)
+        self.fused_retriever = FusedRetriever(
+            self.vector_model,
+            self.tfidf_engine,
+            budget_ms=float(os.getenv("RETRIEVAL_BUDGET_MS", "200")),
+            max_workers=int(os.getenv("RETRIEVAL_WORKERS", "4")),
+        )
+        self.batcher = QueryBatcher(
+            self.vector_model,
+            window_ms=float(os.getenv("BATCH_WINDOW_MS", "2")),
+            max_batch=int(os.getenv("BATCH_MAX_SIZE", "32")),
+            max_queue=int(os.getenv("BATCH_MAX_QUEUE", "1024")),
+            metrics=metrics,
+        )
+        # Normalized link scores are computed at load, not on the first hybrid
+        # request, so that serve.py workers share the parent's copy
+        link_graph = self.search_engine.link_model.link_graph
+        for score in ("pagerank", "authorities"):
+            link_graph.normalized(score)
+
+    async def close(self):
+        await self.batcher.stop()
+        self.fused_retriever.close()
+        self.vector_model.close()
+
+def load_snapshot(name):
+    path = os.path.join(snapshot_dir, name)
+    manifest = snapshot.verify(path)
+    built_with = manifest["info"].get("model_name", model_name)
+    if built_with != model_name:
+        raise ValueError(f"Snapshot {name} was embedded with {built_with}, this server encodes with {model_name}")
+    return Services(name, os.path.join(path, "faiss"), os.path.join(path, "tfidf"),
+                    graph_dir=os.path.join(path, "link_graph"), mmap=True)
+
+live_generations = itertools.count(1)
+
+def load_services():
+    if snapshot_dir:
+        name = snapshot.current(snapshot_dir)
+        if name is None:
+            raise RuntimeError(f"No current snapshot in {snapshot_dir}; publish one with snapshot.py")
+        return load_snapshot(name)
+    return Services(f"live-{next(live_generations)}", os.getenv("FAISS_CACHE_PATH", "faiss"),
+                    os.getenv("TFIDF_CACHE_PATH", "cache"))
+
+live = snapshot.LiveSnapshot(load_services())
+swap_lock = asyncio.Lock()
+snapshot_watcher = None
+
+async def reload_services(name=None):
+    # Loads the given (or current) snapshot next to the one being served and
+    # swaps to it; the old one is closed after its last request. Without
+    # SNAPSHOT_DIR the build directories are reloaded.
+    async with swap_lock:
+        if snapshot_dir:
+            name = name or snapshot.current(snapshot_dir)
+            if name is None or name == live.current.name:
+                return live.current
+            services = await run_in_threadpool(load_snapshot, name)
+        else:
+            services = await run_in_threadpool(load_services)
+        services.batcher.start()
+        old = live.swap(services)
+        # Keys include the snapshot name; this only frees the memory early
+        result_cache.invalidate()
+        page_cache.invalidate()
+        if old is not None:
+            await old.close()
+        print(f"Serving snapshot {services.name}.")
+        return services
+
+@asynccontextmanager
+async def acquire_services():
+    # Pins the current snapshot for one request
+    services = live.acquire()
+    try:
+        yield services
+    finally:
+        if live.release(services):
+            await services.close()
+
+async def watch_snapshots():
+    while True:
+        await asyncio.sleep(snapshot_poll)
+        try:
+            await reload_services()
+        except Exception as e:
+            print(f"Snapshot swap failed, still serving {live.current.name}: {e!r}")
+
+def _embedding_cache_lookups():
+    stats = embedding_cache.stats()
+    return {("hit",): stats["hits"], ("miss",): stats["misses"]}
+
+def _queue_depth():
+    queue = live.current.batcher.queue
+    return queue.qsize() if queue is not None else 0
+
+metrics.registry.callback("search_embedding_cache_total", "counter", "Query embedding cache lookups by outcome.",
+                          _embedding_cache_lookups, ("result",))
+metrics.registry.callback("search_queue_depth", "gauge", "Vector searches waiting in the batcher.", _queue_depth)
+metrics.registry.callback("search_fused_retrieval_total", "counter",
+                          "Fused retrievals, and retriever timeouts and errors within them.",
+                          lambda: {(event,): count for event, count in live.current.fused_retriever.stats.items()},
+                          ("event",))
+metrics.registry.callback("search_snapshots_loaded", "gauge",
+                          "Index snapshots in memory (the served one plus replaced ones still in use).", live.loaded)
+
+@app.on_event("startup")
+async def start_services():
+    global snapshot_watcher
+    live.current.batcher.start()
+    if snapshot_dir and snapshot_poll > 0:
+        snapshot_watcher = asyncio.create_task(watch_snapshots())
+
+@app.on_event("shutdown")
+async def stop_services():
+    if snapshot_watcher is not None:
+        snapshot_watcher.cancel()
+    await live.current.close()
+
 # Request format
+class SearchFilters(BaseModel):
+    # Site host (a leading "www." is ignored), maximum crawl depth, and crawl
+    # time range (after inclusive, before exclusive)
+    domain: Optional[str] = None
+    max_depth: Optional[int] = None
+    crawled_after: Optional[datetime] = None
+    crawled_before: Optional[datetime] = None
+
 class QueryRequest(BaseModel):
     query: str
     top_k: int = 10
+    # Candidate source: dense (FAISS), lexical (TF-IDF) or both fused with RRF
+    retriever: Literal["vector", "tfidf", "fused"] = "vector"
+    # Pushed into the vector search (vector retriever only)
+    filters: Optional[SearchFilters] = None
 
-@app.post("/search/vector")
-def search_query(req: QueryRequest):
-    query_embedding = model.encode([req.query], convert_to_numpy=True)
-    faiss.normalize_L2(query_embedding)
-
-    distances, indices = index.search(query_embedding, req.top_k)
-
-    results = []
-    for dist, idx in zip(distances[0], indices[0]):
-        if idx == -1:
-            continue
-        meta = id_to_metadata.get(idx, {})
-        results.append({
-            "url": meta.get("url", ""),
-            "title": meta.get("title", ""),
-            "meta_description": meta.get("meta_description", ""),
-            "score": float(dist)
-        })
+class BatchQuery(QueryRequest):
+    ranker: Literal["vector", "pagerank", "hits", "hybrid"] = "vector"
+
+class BatchRequest(BaseModel):
+    queries: List[BatchQuery]
+
+class PageRequest(BaseModel):
+    # The first page names the query; later pages pass the returned cursor
+    query: Optional[str] = None
+    ranker: Literal["vector", "pagerank", "hits", "hybrid"] = "vector"
+    retriever: Literal["vector", "tfidf", "fused"] = "vector"
+    page_size: Optional[int] = None
+    cursor: Optional[str] = None
+    filters: Optional[SearchFilters] = None
+
+class ActivateRequest(BaseModel):
+    name: str
+
+async def vector_search(services, query, top_k):
+    try:
+        return await services.batcher.search(query, top_k)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+def search_filter(filters):
+    if filters is None:
+        return None
+    return id_filters.SearchFilter(**filters.model_dump()) or None
+
+async def filtered_search(services, retriever, query, depth, search_filter):
+    # Filtered searches bypass the batcher: each one has its own ID selector
+    if retriever != "vector":
+        raise HTTPException(status_code=400, detail="Filters are only supported with the vector retriever")
+    try:
+        with metrics.stage("filtered_search"):
+            return await run_in_threadpool(services.vector_model.search, query, depth, False, search_filter)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def retrieve(services, retriever, query, depth, search_filter=None):
+    if search_filter is not None:
+        return await filtered_search(services, retriever, query, depth, search_filter)
+    if retriever == "vector":
+        return await vector_search(services, query, depth)
+    if retriever == "tfidf":
+        with metrics.stage("tfidf_search"):
+            return await run_in_threadpool(services.tfidf_engine.search, query, depth)
+    with metrics.stage("fused_retrieval"):
+        return await services.fused_retriever.search_async(query, depth, services.batcher.search)
+
+async def ranked_search(services, ranker, query, top_k, retriever="vector", cache=result_cache, search_filter=None):
+    key = (services.name, normalize_query(query), top_k, ranker, retriever,
+           search_filter.key() if search_filter is not None else None)
+    results = cache.get(key)
+    if results is not None:
+        metrics.cache.inc(ranker, "hit")
+        return results
+    metrics.cache.inc(ranker, "miss")
+
+    # pagerank and hits re-rank a deeper candidate list
+    depth = top_k * 3 if ranker in ("pagerank", "hits") else top_k
+    results = await retrieve(services, retriever, query, depth, search_filter)
+    metrics.candidates.observe(len(results), ranker)
+    if ranker != "vector":
+        engine = services.search_engine
+        rank = {
+            "hybrid": engine.hybrid_model,
+            "pagerank": engine.pagerank_model,
+            "hits": engine.hits_model,
+        }[ranker]
+        with metrics.stage(f"rank_{ranker}"):
+            results = await run_in_threadpool(rank, query, results, top_k)
 
+    cache.put(key, results)
+    return results
+
+@app.post("/search/vector")
+async def search_query(req: QueryRequest):
+    async with acquire_services() as services:
+        results = await ranked_search(services, "vector", req.query, req.top_k, req.retriever,
+                                      search_filter=search_filter(req.filters))
     return {"results": results}
 
 @app.post("/search/pagerank")
-def search_pagerank(req: QueryRequest):
-    query_embedding = model.encode([req.query], convert_to_numpy=True)
-    faiss.normalize_L2(query_embedding)
-
-    distances, indices = index.search(query_embedding, req.top_k)
-
-    results = []
-    for dist, idx in zip(distances[0], indices[0]):
-        if idx == -1:
-            continue
-        meta = id_to_metadata.get(idx, {})
-        results.append({
-            "url": meta.get("url", ""),
-            "title": meta.get("title", ""),
-            "meta_description": meta.get("meta_description", ""),
-            "score": float(dist)
-        })
-    results = search_engine.pagerank_model(req.query, results,top_k=req.top_k)
+async def search_pagerank(req: QueryRequest):
+    async with acquire_services() as services:
+        results = await ranked_search(services, "pagerank", req.query, req.top_k, req.retriever,
+                                      search_filter=search_filter(req.filters))
     return {"results": results}
 
 @app.post("/search/hits")
-def search_hits(req: QueryRequest):
-    query_embedding = model.encode([req.query], convert_to_numpy=True)
-    faiss.normalize_L2(query_embedding)
-
-    distances, indices = index.search(query_embedding, req.top_k)
-
-    results = []
-    for dist, idx in zip(distances[0], indices[0]):
-        if idx == -1:
-            continue
-        meta = id_to_metadata.get(idx, {})
-        results.append({
-            "url": meta.get("url", ""),
-            "title": meta.get("title", ""),
-            "meta_description": meta.get("meta_description", ""),
-            "score": float(dist)
-        })
-    results = search_engine.hits_model(req.query, results, top_k=req.top_k)
+async def search_hits(req: QueryRequest):
+    async with acquire_services() as services:
+        results = await ranked_search(services, "hits", req.query, req.top_k, req.retriever,
+                                      search_filter=search_filter(req.filters))
     return {"results": results}
 
 @app.post("/search/hybrid")
-def search_hybrid(req: QueryRequest):
-    query_embedding = model.encode([req.query], convert_to_numpy=True)
-    faiss.normalize_L2(query_embedding)
-
-    distances, indices = index.search(query_embedding, req.top_k)
-
-    results = []
-    for dist, idx in zip(distances[0], indices[0]):
-        if idx == -1:
-            continue
-        meta = id_to_metadata.get(idx, {})
-        results.append({
-            "url": meta.get("url", ""),
-            "title": meta.get("title", ""),
-            "meta_description": meta.get("meta_description", ""),
-            "score": float(dist)
-        })
-    results = search_engine.hybrid_model(req.query, results, top_k=req.top_k)
-    # results = search_engine.hybrid_model(req.query, top_k=req.top_k)
-    return {"results": results}
\ No newline at end of file
+async def search_hybrid(req: QueryRequest):
+    async with acquire_services() as services:
+        results = await ranked_search(services, "hybrid", req.query, req.top_k, req.retriever,
+                                      search_filter=search_filter(req.filters))
+    return {"results": results}
+
+@app.post("/search/batch")
+async def search_batch(req: BatchRequest):
+    # Submitted together, the vector searches coalesce in the batcher into
+    # multi-query index searches; rankers run on the threadpool. The whole
+    # batch is answered from one snapshot.
+    async with acquire_services() as services:
+        if len(req.queries) > services.batcher.max_queue:
+            raise HTTPException(status_code=413, detail=f"At most {services.batcher.max_queue} queries per batch")
+        results = await asyncio.gather(
+            *(ranked_search(services, q.ranker, q.query, q.top_k, q.retriever, search_filter=search_filter(q.filters))
+              for q in req.queries))
+    return {"results": [{"query": q.query, "ranker": q.ranker, "results": r} for q, r in zip(req.queries, results)]}
+
+@app.post("/search/page")
+async def search_page(req: PageRequest):
+    # Pages of one deep ranked list. The list is cached per snapshot, query,
+    # ranker, retriever and filters; when it has expired (or the snapshot changed)
+    # it is recomputed from the cursor, so later pages keep working.
+    if req.cursor is not None:
+        try:
+            state = decode_cursor(req.cursor)
+            # Validated like a first-page request
+            first = PageRequest(query=state["q"], ranker=state["r"], retriever=state["t"], filters=state.get("f"))
+            offset, page_size = int(state["o"]), int(req.page_size or state["s"])
+        except (ValueError, KeyError, TypeError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    elif req.query is not None:
+        first, offset, page_size = req, 0, req.page_size or 10
+    else:
+        raise HTTPException(status_code=400, detail="Either query or cursor is required")
+    if not 1 <= page_size <= page_depth or offset < 0:
+        raise HTTPException(status_code=400, detail=f"page_size must be between 1 and {page_depth}")
+
+    async with acquire_services() as services:
+        results = await ranked_search(services, first.ranker, first.query, page_depth, first.retriever,
+                                      cache=page_cache, search_filter=search_filter(first.filters))
+    end = offset + page_size
+    state = {"q": first.query, "r": first.ranker, "t": first.retriever, "o": end, "s": page_size}
+    if first.filters is not None:
+        state["f"] = first.filters.model_dump(mode="json", exclude_none=True)
+    next_cursor = encode_cursor(state) if end < len(results) else None
+    return {"results": results[offset:end], "offset": offset, "next_cursor": next_cursor}
+
+@app.get("/cache/stats")
+def cache_stats():
+    return {
+        "embeddings": embedding_cache.stats(),
+        "results": result_cache.stats(),
+        "pages": page_cache.stats(),
+        "retrieval": dict(live.current.fused_retriever.stats),
+    }
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return Response(metrics.render(), media_type=CONTENT_TYPE)
+
+@app.get("/admin/snapshots")
+def snapshots_info():
+    return {
+        "serving": live.current.name,
+        "loaded": live.loaded(),
+        "current": snapshot.current(snapshot_dir) if snapshot_dir else None,
+        "available": snapshot.list_snapshots(snapshot_dir) if snapshot_dir else [],
+    }
+
+@app.post("/admin/reload")
+async def reload_index():
+    # Swaps to the snapshot in CURRENT (or re-reads the build directories);
+    # requests already running finish on the old index.
+    services = await reload_services()
+    return {"status": "reloaded", "snapshot": services.name, "documents": services.vector_model.index.ntotal}
+
+@app.post("/admin/activate")
+async def activate_snapshot(req: ActivateRequest):
+    # Points CURRENT at a published snapshot (e.g. to roll back) and serves it
+    if not snapshot_dir:
+        raise HTTPException(status_code=400, detail="SNAPSHOT_DIR is not configured")
+    if req.name not in snapshot.list_snapshots(snapshot_dir):
+        raise HTTPException(status_code=404, detail=f"No snapshot named {req.name}")
+    await run_in_threadpool(snapshot.set_current, snapshot_dir, req.name)
+    services = await reload_services(req.name)
+    return {"status": "activated", "snapshot": services.name, "documents": services.vector_model.index.ntotal}
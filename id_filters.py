@@ -0,0 +1,257 @@
+import os
+import json
+import math
+import shutil
+from urllib.parse import urlparse
+import numpy as np
+import pandas as pd
+import faiss
+
+# Attribute filters for vector search (site, crawl depth, crawl date),
+# precomputed at index time from the metadata store:
+#
+#   <path>/manifest.json                       version, row count, ID bound, domain names
+#   <path>/ids.npy                             sorted document IDs (row i <-> ids[i])
+#   <path>/domain.npy, depth.npy, crawled.npy  value of each row
+#   <path>/domain_order.npy, domain_offsets.npy  rows grouped by domain (CSR)
+#   <path>/depth_order.npy, depth_values.npy   rows sorted by depth, and the sorted depths
+#   <path>/crawled_order.npy, crawled_values.npy  rows sorted by crawl time, and the sorted times
+#
+# A filter is resolved to a sorted ID array. The sorted orders give the
+# exact number of rows matching each predicate, and the predicate with the
+# fewest rows is read as a range. Only those rows are checked against the
+# other predicates. Small subsets are then scanned exactly; larger ones go to
+# FAISS as an IDSelector, so the index itself only returns matching IDs.
+
+FILTER_VERSION = 1
+FILTER_FIELDS = ("url", "depth", "last_crawled")
+NOT_CRAWLED = np.iinfo('int64').max
+# Filtered subsets up to this size are searched exactly instead of through the index
+EXACT_SCAN_MAX = 10000
+# Subsets denser than 1 / BITMAP_DENSITY of the ID space use a bitmap selector
+BITMAP_DENSITY = 64
+# Upper bound for the efSearch of a selective HNSW search
+MAX_EF_SEARCH = 1024
+
+
+def normalize_domain(host):
+    # "WWW.Example.com" and "example.com" are the same site
+    host = host.strip().lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def url_domain(url):
+    return normalize_domain(urlparse(url).netloc)
+
+
+def parse_time(value):
+    # Nanoseconds since the epoch, naive times taken as they are (like the crawl)
+    stamp = pd.Timestamp(value)
+    if stamp.tzinfo is not None:
+        stamp = stamp.tz_convert("UTC").tz_localize(None)
+    return stamp.value
+
+
+class SearchFilter:
+    def __init__(self, domain=None, max_depth=None, crawled_after=None, crawled_before=None):
+        self.domain = normalize_domain(domain) if domain else None
+        self.max_depth = max_depth
+        # crawled_after is inclusive, crawled_before exclusive
+        self.crawled_after = parse_time(crawled_after) if crawled_after is not None else None
+        self.crawled_before = parse_time(crawled_before) if crawled_before is not None else None
+
+    def __bool__(self):
+        return any(v is not None for v in self.key())
+
+    def key(self):
+        # Hashable, for result cache keys
+        return (self.domain, self.max_depth, self.crawled_after, self.crawled_before)
+
+
+class FilterIndex:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "manifest.json")) as f:
+            manifest = json.load(f)
+        if manifest["version"] != FILTER_VERSION:
+            raise ValueError(f"Unsupported filter index version {manifest['version']} in {path}")
+        self.count = manifest["count"]
+        # Every ID is below id_bound (the bitmap size)
+        self.id_bound = manifest["id_bound"]
+        self.domain_codes = {name: code for code, name in enumerate(manifest["domains"])}
+        for name in ("ids", "domain", "depth", "crawled", "domain_order", "domain_offsets",
+                     "depth_order", "depth_values", "crawled_order", "crawled_values"):
+            setattr(self, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r"))
+
+    def __len__(self):
+        return self.count
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, "manifest.json"))
+
+    @staticmethod
+    def _columns(ids, urls, depths, crawled):
+        # Filter columns of documents given as parallel sequences
+        ids = np.asarray(ids, dtype='int64')
+        domains = np.array([url_domain(u) if isinstance(u, str) else "" for u in urls], dtype=object)
+        depth = pd.to_numeric(pd.Series(depths, dtype=object), errors='coerce').fillna(-1).to_numpy(dtype='int64')
+        times = pd.to_datetime(pd.Series(crawled, dtype=object), format='mixed', errors='coerce')
+        crawled = np.where(times.isna(), NOT_CRAWLED, times.to_numpy(dtype='datetime64[ns]').astype('int64'))
+        return ids, domains, depth, crawled
+
+    @classmethod
+    def build(cls, path, ids, urls, depths, crawled):
+        # Filter data of the whole corpus, one entry per document in ID order
+        ids, domains, depth, crawled = cls._columns(ids, urls, depths, crawled)
+        codes, names = pd.factorize(domains)
+        return cls._write(path, ids, codes.astype('int32'), list(names), depth, crawled)
+
+    @classmethod
+    def from_records(cls, path, records):
+        # records: iterable of (doc_id, {url, depth, last_crawled}) in ID order
+        ids, urls, depths, crawled = [], [], [], []
+        for doc_id, record in records:
+            ids.append(doc_id)
+            urls.append(record.get("url", ""))
+            depths.append(record.get("depth", -1))
+            crawled.append(record.get("last_crawled", ""))
+        return cls.build(path, ids, urls, depths, crawled)
+
+    def update(self, drop_ids, ids, urls, depths, crawled):
+        # New filter data with the documents drop_ids removed and the given
+        # ones added. Only the changed documents are parsed; the existing
+        # columns are carried over as arrays.
+        new_ids, new_domains, new_depth, new_crawled = self._columns(ids, urls, depths, crawled)
+        keep = ~np.isin(self.ids, np.union1d(np.asarray(drop_ids, dtype='int64'), new_ids))
+        names = list(self.domain_codes)
+        codes = dict(self.domain_codes)
+        for name in new_domains:
+            if name not in codes:
+                codes[name] = len(names)
+                names.append(name)
+        new_codes = np.array([codes[name] for name in new_domains], dtype='int32')
+
+        ids = np.concatenate([self.ids[keep], new_ids])
+        order = np.argsort(ids, kind='stable')
+        return self._write(self.path, ids[order],
+                           np.concatenate([self.domain[keep], new_codes])[order], names,
+                           np.concatenate([self.depth[keep], new_depth])[order],
+                           np.concatenate([self.crawled[keep], new_crawled])[order])
+
+    @classmethod
+    def _write(cls, path, ids, domain, domains, depth, crawled):
+        domain_order = np.argsort(domain, kind='stable')
+        domain_offsets = np.zeros(len(domains) + 1, dtype='int64')
+        np.cumsum(np.bincount(domain, minlength=len(domains)), out=domain_offsets[1:])
+        depth_order = np.argsort(depth, kind='stable')
+        crawled_order = np.argsort(crawled, kind='stable')
+        arrays = {
+            "ids": ids, "domain": domain, "depth": depth, "crawled": crawled,
+            "domain_order": domain_order, "domain_offsets": domain_offsets,
+            "depth_order": depth_order, "depth_values": depth[depth_order],
+            "crawled_order": crawled_order, "crawled_values": crawled[crawled_order],
+        }
+
+        tmp_path = path.rstrip(os.sep) + ".tmp"
+        if os.path.exists(tmp_path):
+            shutil.rmtree(tmp_path)
+        os.makedirs(tmp_path)
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_path, f"{name}.npy"), array)
+        manifest = {"version": FILTER_VERSION, "count": len(ids), "id_bound": int(ids[-1]) + 1 if len(ids) else 0,
+                    "domains": list(domains)}
+        with open(os.path.join(tmp_path, "manifest.json"), "w") as f:
+            json.dump(manifest, f)
+        # Readers that still map the old files keep them until they reload
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.replace(tmp_path, path)
+        return cls(path)
+
+    def _ranges(self, search_filter):
+        # (order, lo, hi, check) per predicate: order[lo:hi] are its rows, and
+        # check(rows) tests it on any rows
+        ranges = []
+        f = search_filter
+        if f.domain is not None:
+            code = self.domain_codes.get(f.domain, -1)
+            lo, hi = (self.domain_offsets[code], self.domain_offsets[code + 1]) if code >= 0 else (0, 0)
+            ranges.append((self.domain_order, lo, hi, lambda rows: self.domain[rows] == code))
+        if f.max_depth is not None:
+            # Pages of unknown depth (-1) never match
+            lo = np.searchsorted(self.depth_values, 0, side='left')
+            hi = np.searchsorted(self.depth_values, f.max_depth, side='right')
+            ranges.append((self.depth_order, lo, hi,
+                           lambda rows: (self.depth[rows] >= 0) & (self.depth[rows] <= f.max_depth)))
+        if f.crawled_after is not None or f.crawled_before is not None:
+            after = f.crawled_after if f.crawled_after is not None else np.iinfo('int64').min
+            # Pages without a crawl time never match
+            before = f.crawled_before if f.crawled_before is not None else NOT_CRAWLED
+            lo, hi = np.searchsorted(self.crawled_values, [after, before], side='left')
+            ranges.append((self.crawled_order, lo, hi,
+                           lambda rows: (self.crawled[rows] >= after) & (self.crawled[rows] < before)))
+        return ranges
+
+    def select(self, search_filter):
+        # Sorted IDs of the documents matching every predicate
+        ranges = self._ranges(search_filter)
+        if not ranges:
+            return np.asarray(self.ids)
+        driver = min(ranges, key=lambda r: r[2] - r[1])
+        order, lo, hi, _ = driver
+        rows = np.asarray(order[lo:hi])
+        for other in ranges:
+            if other is not driver and len(rows):
+                rows = rows[other[3](rows)]
+        return np.sort(self.ids[rows])
+
+
+def empty_result(nq, k):
+    return np.full((nq, k), -np.inf, dtype='float32'), np.full((nq, k), -1, dtype='int64')
+
+
+def exact_search(queries, ids, vectors, k):
+    # Inner-product top-k of every query over the given vectors, padded with -1
+    distances, indices = empty_result(len(queries), k)
+    if not len(ids):
+        return distances, indices
+    scores = queries @ vectors.T
+    kk = min(k, len(ids))
+    top = np.argpartition(-scores, kk - 1, axis=1)[:, :kk]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind='stable')
+    distances[:, :kk] = np.take_along_axis(top_scores, order, axis=1)
+    indices[:, :kk] = ids[np.take_along_axis(top, order, axis=1)]
+    return distances, indices
+
+
+def selector(ids, id_bound):
+    # IDSelector over sorted `ids`: a bitmap when they are dense in the ID
+    # space, else a hash set. The arrays must outlive the selector, so they
+    # are attached to it.
+    if len(ids) * BITMAP_DENSITY >= id_bound:
+        mask = np.zeros(id_bound, dtype=bool)
+        mask[ids] = True
+        bits = np.packbits(mask, bitorder='little')
+        sel = faiss.IDSelectorBitmap(id_bound, faiss.swig_ptr(bits))
+        sel.referenced_objects = [bits]
+        return sel
+    ids = np.ascontiguousarray(ids, dtype='int64')
+    sel = faiss.IDSelectorBatch(len(ids), faiss.swig_ptr(ids))
+    sel.referenced_objects = [ids]
+    return sel
+
+
+def search_parameters(config, sel, selectivity, k):
+    # FAISS search parameters restricted to `sel`. IVF probes and the HNSW
+    # beam are widened by 1 / selectivity, so a selective filter still
+    # finds k matches instead of a handful.
+    params = config['params']
+    widen = 1.0 / max(selectivity, 1e-9)
+    if config['index_type'] in ('ivf', 'ivfpq'):
+        return faiss.SearchParametersIVF(sel=sel, nprobe=min(params['nlist'], math.ceil(params['nprobe'] * widen)))
+    if config['index_type'] == 'hnsw':
+        ef = min(MAX_EF_SEARCH, max(k, math.ceil(params['efSearch'] * widen)))
+        return faiss.SearchParametersHNSW(sel=sel, efSearch=ef)
+    return faiss.SearchParameters(sel=sel)
@@ -1,61 +1,15 @@
 import os
-import pandas as pd
-from urllib.parse import urlparse
 from dotenv import load_dotenv
-from vector_model import BertKNNVectorModel
-from link_model import SearchEngine
-# from tf_idf import TfidfSearchEngine
-
-import nltk
-import re
-from nltk.corpus import stopwords
-from nltk.stem import WordNetLemmatizer
-from datetime import datetime, timedelta
-
-# Download NLTK resources
-nltk.download('stopwords')
-nltk.download('wordnet')
-nltk.download('omw-1.4')
+from vector_model import BertFaissVectorModel
+from tf_idf import TfidfSearchEngine
+from link_model import LinkAnalysisModel
+import ann_index
+import snapshot
+import ingest
+import near_dup
 
 load_dotenv()
 
-# Text cleaning setup
-stop_words = set(stopwords.words('english'))
-lemmatizer = WordNetLemmatizer()
-
-def clean_text(text):
-    if pd.isna(text):
-        return ""
-    text = text.lower()
-    text = re.sub(r'[^a-z\s]', '', text)  
-    words = text.split()
-    words = [lemmatizer.lemmatize(w) for w in words if w not in stop_words]
-    return ' '.join(words)
-
-def resolve_description(row):
-    desc = row['meta_description']
-    if (
-        pd.isna(desc) or 
-        not desc or 
-        desc.strip().lower() == 'no description' or 
-        re.match(r'^https?://', str(desc).strip())
-    ):
-        tokens = row['body_text'].split()
-        return ' '.join(tokens[:30])
-    return desc
-
-def get_directory_and_slug(url):
-    path = urlparse(url).path.rstrip('/')
-    if not path:
-        return '', ''
-    parts = path.split('/')
-    return ('/'.join(parts[:-1]), parts[-1]) if len(parts) > 1 else ('', parts[0])
-
-def get_url_key(url):
-    parsed = urlparse(url)
-    directory, slug = get_directory_and_slug(url)
-    return (parsed.netloc.lower(), directory, slug)
-
 if __name__ == "__main__":
     combined_data_path = os.getenv("COMBINED_DATA_PATH")
     cache_path = os.getenv("CACHE_PATH")
@@ -67,49 +21,42 @@ if __name__ == "__main__":
         "datasets/data4.csv"
     ]
 
-    required_cols = [
-        'url', 
-        'title', 
-        'meta_description', 
-        'body_text', 
-        'depth', 
-        'last_crawled', 
-        'out_links', 
-        'anchor_texts'
-    ]
-
-    dfs = []
-    for file in csv_files:
-        temp_df = pd.read_csv(file, escapechar='\\', low_memory=False)
-        print(file)
-
-        if len(temp_df.columns) == 6:
-            temp_df['depth'] = 1
-            start_time = datetime.now()
-            temp_df['last_crawled'] = [start_time + timedelta(seconds=i) for i in range(len(temp_df))]
-            temp_df['last_crawled'] = temp_df['last_crawled'].astype(str)
-        else:
-            temp_df.columns = required_cols
-
-        dfs.append(temp_df)
-
-    df = pd.concat(dfs, ignore_index=True)
-
-    df.columns = required_cols
-    df.dropna(subset=['url', 'body_text'], inplace=True)
-    print("Start 1")
-    df['meta_description'] = df.apply(resolve_description, axis=1)
-    df['body_text'] = df['body_text'].apply(clean_text)
-    df = df.sort_values("last_crawled").drop_duplicates(subset="url", keep="first")
-    df = df.drop_duplicates(subset='url_key').drop(columns='url_key')
-
-    urls = set(df['url'])
-
-    df.to_csv(combined_data_path, index=False, escapechar='\\')
-
-
-    # vector_model = BertKNNVectorModel(combined_data_path, cache_path)
-    # vector_model.preprocess_and_index()
+    # Rows held in memory at once by every stage of the pipeline
+    chunk_size = int(os.getenv("INGEST_CHUNK_SIZE", ingest.CHUNK_SIZE))
+    workers = int(os.getenv("NORMALIZE_WORKERS", "0")) or None
+    # Pages whose body text is at least this similar (estimated Jaccard of
+    # 5-word shingles) to another page are dropped; 0 keeps them all
+    near_dup_threshold = float(os.getenv("NEAR_DUP_THRESHOLD", near_dup.THRESHOLD)) or None
+    # Which page of a near-duplicate cluster is kept: earliest, shortest_url or shallowest
+    canonical_rule = os.getenv("CANONICAL_RULE", "earliest")
+    # Re-embed only new and changed pages when the existing index allows it;
+    # INCREMENTAL_INDEX=0 forces a full rebuild
+    incremental = os.getenv("INCREMENTAL_INDEX", "1") != "0"
+
+    vector_model = BertFaissVectorModel(combined_data_path, cache_path)
+    ingest.run(csv_files, combined_data_path, vector_model, chunk_size=chunk_size, workers=workers,
+               near_dup_threshold=near_dup_threshold, canonical_rule=canonical_rule, incremental=incremental)
+
+    # Lexical index for the TF-IDF / fused retrievers in faiss_server.py
+    TfidfSearchEngine(combined_data_path, os.getenv("TFIDF_CACHE_PATH", "cache")).preprocess_and_index()
+
+    # Publish the build as an immutable snapshot that faiss_server.py picks up
+    # without a restart (SNAPSHOT_DIR on both sides)
+    snapshot_dir = os.getenv("SNAPSHOT_DIR")
+    if snapshot_dir:
+        link_model = LinkAnalysisModel(combined_data_path)
+        name = snapshot.publish(
+            snapshot_dir,
+            {"faiss": cache_path, "link_graph": link_model.graph_dir, "tfidf": os.getenv("TFIDF_CACHE_PATH", "cache")},
+            info={
+                "model_name": vector_model.model_name,
+                "documents": vector_model.index.ntotal,
+                "index": ann_index.describe(vector_model.index_config),
+                "shards": vector_model.shards,
+            },
+            keep=int(os.getenv("SNAPSHOT_KEEP", "3")),
+        )
+        print(f"Published snapshot {name} to {snapshot_dir}.")
 
     # query = 'Africa Politics'
-    # results = vector_model.search(query)
\ No newline at end of file
+    # results = vector_model.search(query)
@@ -0,0 +1,261 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+import numpy as np
+import pandas as pd
+import near_dup
+from link_graph import url_hash
+from text_normalize import clean_texts, resolve_descriptions
+
+# Streaming ingestion from the raw crawl CSVs to the combined CSV and the
+# FAISS index. Memory is bounded by the chunk size, not by the crawl size:
+#
+#   pass 1  read chunks -> (URL key hash, last_crawled, row, MinHash signature) arrays
+#           -> keep-earliest winner per URL key -> one canonical page per near-duplicate cluster
+#   pass 2  read chunks -> keep winners -> normalize -> append to CSV -> embed -> append to index
+#
+# Pass 1 keeps 24 bytes per row (64-bit URL key hash, timestamp, row number),
+# plus 272 bytes with near-duplicate detection (signature, URL length, depth).
+# The dropped pages and the page each one was folded into are written to
+# <combined>.canonical.csv (see near_dup.py).
+
+REQUIRED_COLUMNS = [
+    'url',
+    'title',
+    'meta_description',
+    'body_text',
+    'depth',
+    'last_crawled',
+    'out_links',
+    'anchor_texts'
+]
+
+CHUNK_SIZE = 50_000
+NOT_CRAWLED = np.iinfo('int64').max
+# Texts per MinHash task sent to a worker process
+SIGNATURE_BATCH = 5000
+
+
+class PipelineStats:
+    # Rows and wall-clock seconds spent in each stage
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name, rows=0):
+        start = time.perf_counter()
+        yield
+        seconds, count = self.stages.get(name, (0.0, 0))
+        self.stages[name] = (seconds + time.perf_counter() - start, count + rows)
+
+    def timed(self, name, chunks):
+        # Times every step of a chunk generator under `name`
+        chunks = iter(chunks)
+        while True:
+            start = time.perf_counter()
+            chunk = next(chunks, None)
+            if chunk is None:
+                return
+            seconds, count = self.stages.get(name, (0.0, 0))
+            self.stages[name] = (seconds + time.perf_counter() - start, count + len(chunk))
+            yield chunk
+
+    def report(self, file=None):
+        for name, (seconds, rows) in self.stages.items():
+            rate = rows / seconds if seconds > 0 else float('inf')
+            print(f"  {name:<12} {rows:>10} rows  {seconds:9.2f} s  {rate:12.0f} rows/s", file=file)
+
+
+def read_chunks(path, chunk_size, start_time):
+    # Raw crawl rows with the 8 required columns. Files without depth and
+    # last_crawled (6 columns) get depth 1 and one-second-apart timestamps
+    # from start_time, so both passes see the same values.
+    offset = 0
+    for chunk in pd.read_csv(path, escapechar='\\', low_memory=False, chunksize=chunk_size):
+        if len(chunk.columns) == 6:
+            chunk['depth'] = 1
+            chunk['last_crawled'] = [str(start_time + timedelta(seconds=offset + i)) for i in range(len(chunk))]
+        else:
+            chunk.columns = REQUIRED_COLUMNS
+        offset += len(chunk)
+        yield chunk[REQUIRED_COLUMNS]
+
+
+def read_all(csv_files, chunk_size, start_times):
+    # Chunks of every file, each tagged with the global number of its first row
+    row = 0
+    for path, start_time in zip(csv_files, start_times):
+        for chunk in read_chunks(path, chunk_size, start_time):
+            chunk.index = pd.RangeIndex(row, row + len(chunk))
+            row += len(chunk)
+            yield chunk
+
+
+def get_directory_and_slug(url):
+    path = urlparse(url).path.rstrip('/')
+    if not path:
+        return '', ''
+    parts = path.split('/')
+    return ('/'.join(parts[:-1]), parts[-1]) if len(parts) > 1 else ('', parts[0])
+
+
+def get_url_key(url):
+    # Host, directory and slug: scheme, query, fragment, trailing slash and
+    # host case do not make a different page
+    parsed = urlparse(url)
+    directory, slug = get_directory_and_slug(url)
+    return (parsed.netloc.lower(), directory, slug)
+
+
+def url_key_hash(url):
+    return url_hash('\x00'.join(get_url_key(url)))
+
+
+def _valid(chunk):
+    return chunk.dropna(subset=['url', 'body_text'])
+
+
+def _timestamps(last_crawled):
+    times = pd.to_datetime(last_crawled, format='mixed', errors='coerce')
+    # Rows without a crawl time sort last, like NaN in sort_values
+    return np.where(times.isna(), NOT_CRAWLED, times.to_numpy(dtype='datetime64[ns]').astype('int64'))
+
+
+def _signatures(hasher, texts, pool):
+    if pool is None or len(texts) <= SIGNATURE_BATCH:
+        return hasher.signatures(texts)
+    batches = [texts[i:i + SIGNATURE_BATCH] for i in range(0, len(texts), SIGNATURE_BATCH)]
+    return np.concatenate(list(pool.map(hasher.signatures, batches)))
+
+
+def select_unique(chunks, stats, hasher=None, threshold=near_dup.THRESHOLD, rule='earliest', pool=None):
+    # Pass 1: sorted global row numbers of the pages to keep, and the
+    # near_dup.DuplicateMap of the rest. The earliest crawl of every URL key
+    # wins (ties go to the row read first); with a MinHasher, the winners
+    # are then reduced to one canonical page per near-duplicate cluster.
+    hashes, times, rows, url_lengths, depths, signatures = [], [], [], [], [], []
+    for chunk in chunks:
+        with stats.stage('dedupe', len(chunk)):
+            chunk = _valid(chunk)
+            urls = chunk['url'].astype(str)
+            hashes.append(np.fromiter((url_key_hash(u) for u in urls), dtype='uint64', count=len(chunk)))
+            times.append(_timestamps(chunk['last_crawled']))
+            rows.append(chunk.index.to_numpy(dtype='int64'))
+        if hasher is None:
+            continue
+        with stats.stage('minhash', len(chunk)):
+            url_lengths.append(urls.str.len().to_numpy(dtype='int64'))
+            depth = pd.to_numeric(chunk['depth'], errors='coerce')
+            depths.append(depth.fillna(NOT_CRAWLED).to_numpy(dtype='int64'))
+            signatures.append(_signatures(hasher, chunk['body_text'].tolist(), pool))
+
+    with stats.stage('dedupe'):
+        if not hashes:
+            return np.zeros(0, dtype='int64'), near_dup.DuplicateMap([], [], [], [])
+        hashes, times, rows = np.concatenate(hashes), np.concatenate(times), np.concatenate(rows)
+        order = np.lexsort((rows, times, hashes))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = hashes[order][1:] != hashes[order][:-1]
+        # Position of the winner of every position's URL key
+        winner = np.empty(len(order), dtype='int64')
+        winner[order] = order[first][np.cumsum(first) - 1]
+        keep = np.sort(order[first])
+
+    canonical = winner
+    if hasher is not None:
+        with stats.stage('near_dup', len(keep)):
+            signatures = np.concatenate(signatures)[keep]
+            labels, best = near_dup.lsh_clusters(signatures, threshold=threshold)
+            url_lengths, depths = np.concatenate(url_lengths)[keep], np.concatenate(depths)[keep]
+            chosen = keep[near_dup.choose_canonical(labels, times[keep], url_lengths, depths, rule)]
+            similarities = np.full(len(rows), np.nan)
+            similarities[keep] = best
+            # Losing crawls of a URL key follow their winner to its canonical page
+            folded = np.arange(len(rows))
+            folded[keep] = chosen
+            canonical = folded[winner]
+            keep = keep[chosen == keep]
+    else:
+        similarities = np.full(len(rows), np.nan)
+
+    dropped = np.flatnonzero(canonical != np.arange(len(rows)))
+    reasons = np.where(winner[dropped] == dropped, 'near_duplicate', 'url_key')
+    duplicates = near_dup.DuplicateMap(rows[dropped], rows[canonical[dropped]], reasons,
+                                       np.where(reasons == 'near_duplicate', similarities[dropped], np.nan))
+    return rows[keep], duplicates
+
+
+def keep_rows(chunks, winners, duplicates=None):
+    for chunk in chunks:
+        if duplicates is not None:
+            duplicates.collect(chunk)
+        lo, hi = np.searchsorted(winners, [chunk.index[0], chunk.index[-1] + 1]) if len(chunk) else (0, 0)
+        if hi > lo:
+            yield chunk.loc[winners[lo:hi]].reset_index(drop=True)
+
+
+def normalize(chunk, workers=None):
+    chunk['meta_description'] = resolve_descriptions(chunk)
+    chunk['body_text'] = clean_texts(chunk['body_text'], workers=workers)
+    return chunk
+
+
+def run(csv_files, combined_data_path, vector_model=None, chunk_size=CHUNK_SIZE, workers=None,
+        near_dup_threshold=near_dup.THRESHOLD, canonical_rule='earliest', incremental=True):
+    # Writes the deduplicated, normalized corpus to combined_data_path and,
+    # when a BertFaissVectorModel is given, indexes it. With incremental=True
+    # and an index that supports it, only new and changed pages are embedded
+    # (by content hash) and pages gone from the crawl are removed; otherwise
+    # the index is rebuilt. near_dup_threshold=None keeps near-duplicate pages.
+    if canonical_rule not in near_dup.RULES:
+        raise ValueError(f"Unknown canonical rule '{canonical_rule}', expected one of {near_dup.RULES}")
+    stats = PipelineStats()
+    start_times = [datetime.now() for _ in csv_files]
+
+    hasher = near_dup.MinHasher() if near_dup_threshold else None
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) if hasher and workers > 1 else nullcontext() as pool:
+        winners, duplicates = select_unique(stats.timed('read', read_all(csv_files, chunk_size, start_times)), stats,
+                                            hasher, near_dup_threshold, canonical_rule, pool)
+    near = int((duplicates.reasons == 'near_duplicate').sum())
+    print(f"Keeping {len(winners)} unique pages; dropped {len(duplicates) - near} repeated URLs "
+          f"and {near} near-duplicates.")
+
+    tmp_path = combined_data_path + ".tmp"
+    pd.DataFrame(columns=REQUIRED_COLUMNS).to_csv(tmp_path, index=False)
+    update = vector_model is not None and incremental and vector_model.start_update()
+    if vector_model is not None and not update:
+        vector_model.start_bulk_index(expected_documents=len(winners))
+
+    for chunk in stats.timed('read+filter', keep_rows(read_all(csv_files, chunk_size, start_times), winners, duplicates)):
+        with stats.stage('normalize', len(chunk)):
+            chunk = normalize(chunk, workers)
+        with stats.stage('write_csv', len(chunk)):
+            chunk.to_csv(tmp_path, index=False, escapechar='\\', mode='a', header=False)
+        if vector_model is None:
+            continue
+        if update:
+            chunk = vector_model.changed_documents(chunk)
+            if not len(chunk):
+                continue
+        with stats.stage('embed', len(chunk)):
+            embeddings = vector_model.embed_documents(chunk)
+        with stats.stage('index', len(chunk)):
+            if update:
+                vector_model.update_documents(chunk, embeddings)
+            else:
+                vector_model.append_documents(chunk, embeddings)
+
+    duplicates.save(near_dup.canonical_map_path(combined_data_path))
+    os.replace(tmp_path, combined_data_path)
+    if update:
+        vector_model.finish_update()
+    elif vector_model is not None:
+        vector_model.finish_bulk_index()
+
+    print("Ingestion throughput:")
+    stats.report()
+    return stats
@@ -0,0 +1,273 @@
+import os
+import sys
+import ast
+import json
+import shutil
+import hashlib
+import numpy as np
+import pandas as pd
+import graph_rank
+import near_dup
+from metadata_store import MetadataStore
+
+# Compiled crawl link graph, loaded with mmap at query time instead of being
+# rebuilt from the CSV:
+#
+#   <path>/manifest.json                 version, sizes, source CSV stamp
+#   <path>/urls/                         node id -> URL (MetadataStore string column)
+#   <path>/url_hashes.npy                sorted 64-bit URL hashes ...
+#   <path>/url_hash_nodes.npy            ... and the node id of each
+#   <path>/indptr.npy, indices.npy       out-link adjacency in CSR form
+#   <path>/in_indptr.npy, in_indices.npy in-link adjacency in CSR form
+#   <path>/pagerank.npy, hubs.npy, authorities.npy   global scores per node
+#   <path>/docs/                         node id -> url/title/description of crawled pages
+
+GRAPH_VERSION = 3
+SOURCE_COLUMNS = ['url', 'title', 'meta_description', 'body_text', 'out_links']
+DOC_COLUMNS = {'url': 'str', 'title': 'str', 'meta_description': 'str'}
+PAGERANK_ALPHA = 0.85
+HITS_MAX_ITER = 500
+
+
+def url_hash(url):
+    return int.from_bytes(hashlib.blake2b(url.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def parse_out_links(x):
+    if isinstance(x, str):
+        if x.strip() == '1':
+            return None
+        try:
+            return ast.literal_eval(x)
+        except (ValueError, SyntaxError):
+            return []
+    return []
+
+
+def resolve_description(meta_desc, body_text):
+    if pd.isna(meta_desc) or not meta_desc or meta_desc == "No Description":
+        return ' '.join(str(body_text).split()[:30])
+    return meta_desc
+
+
+def source_stamp(data_path):
+    stat = os.stat(data_path)
+    return {"path": os.path.abspath(data_path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+class LinkGraph:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "manifest.json")) as f:
+            self.manifest = json.load(f)
+        if self.manifest["version"] != GRAPH_VERSION:
+            raise ValueError(f"Unsupported link graph version {self.manifest['version']} in {path}")
+        self.n_nodes = self.manifest["n_nodes"]
+        self.indptr = self._load("indptr")
+        self.indices = self._load("indices")
+        self.in_indptr = self._load("in_indptr")
+        self.in_indices = self._load("in_indices")
+        self.url_hashes = self._load("url_hashes")
+        self.url_hash_nodes = self._load("url_hash_nodes")
+        self.pagerank = self._load("pagerank")
+        self.hubs = self._load("hubs")
+        self.authorities = self._load("authorities")
+        self.urls = MetadataStore(os.path.join(path, "urls"))
+        self.docs = MetadataStore(os.path.join(path, "docs"))
+        self._normalized = {}
+
+    def _load(self, name):
+        return np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r")
+
+    def normalized(self, name):
+        # Min-max normalized copy of a score array, computed once per load
+        if name not in self._normalized:
+            scores = np.asarray(getattr(self, name), dtype='float64')
+            low, high = (scores.min(), scores.max()) if len(scores) else (0.0, 0.0)
+            self._normalized[name] = (scores - low) / (high - low) if high > low else np.zeros_like(scores)
+        return self._normalized[name]
+
+    def normalized_scores(self, name, nodes):
+        # Normalized scores gathered for `nodes`, 0 for -1 (not in the graph)
+        nodes = np.asarray(nodes, dtype='int64')
+        scores = np.zeros(len(nodes))
+        in_graph = nodes >= 0
+        scores[in_graph] = self.normalized(name)[nodes[in_graph]]
+        return scores
+
+    @staticmethod
+    def is_current(path, data_path):
+        manifest_path = os.path.join(path, "manifest.json")
+        if not os.path.exists(manifest_path):
+            return False
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        stamp = source_stamp(data_path)
+        return manifest.get("version") == GRAPH_VERSION and manifest.get("source") == stamp
+
+    @classmethod
+    def build(cls, df, path, data_path=None):
+        # Links to pages that ingestion dropped as duplicates count for the
+        # page that was kept instead
+        canonical = near_dup.load_canonical_map(data_path) if data_path else {}
+        node_of = {}
+        src, dst = [], []
+        for url, links in zip(df['url'], df['out_links'].apply(parse_out_links)):
+            if not isinstance(url, str) or not isinstance(links, list):
+                continue
+            for link in links:
+                if isinstance(link, str) and link.strip():
+                    if link in canonical:
+                        link = canonical[link]
+                        if link == url:
+                            # A page linking to its own copy (e.g. a print view)
+                            continue
+                    src.append(node_of.setdefault(url, len(node_of)))
+                    dst.append(node_of.setdefault(link, len(node_of)))
+
+        n = len(node_of)
+        # Drop duplicate edges (the graph is a simple DiGraph) and sort by source
+        edges = np.unique(np.array(src, dtype='int64') * max(n, 1) + np.array(dst, dtype='int64'))
+        src, dst = edges // max(n, 1), edges % max(n, 1)
+        indptr = np.zeros(n + 1, dtype='int64')
+        np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+        by_target = np.lexsort((src, dst))
+        in_indptr = np.zeros(n + 1, dtype='int64')
+        np.cumsum(np.bincount(dst, minlength=n), out=in_indptr[1:])
+
+        urls = list(node_of)
+        hashes = np.array([url_hash(u) for u in urls], dtype='uint64')
+        order = np.argsort(hashes, kind='stable')
+
+        warm_start = cls._previous_scores(path, hashes)
+        pagerank, hubs, authorities = cls._compute_scores(indptr, dst, warm_start)
+
+        tmp_path = path.rstrip(os.sep) + ".tmp"
+        if os.path.exists(tmp_path):
+            shutil.rmtree(tmp_path)
+        os.makedirs(tmp_path)
+        arrays = {
+            "indptr": indptr,
+            "indices": dst.astype('int64'),
+            "in_indptr": in_indptr,
+            "in_indices": src[by_target].astype('int64'),
+            "url_hashes": hashes[order],
+            "url_hash_nodes": order.astype('int64'),
+            "pagerank": pagerank,
+            "hubs": hubs,
+            "authorities": authorities,
+        }
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_path, f"{name}.npy"), array)
+        MetadataStore.write(os.path.join(tmp_path, "urls"), ((i, {'url': u}) for i, u in enumerate(urls)), {'url': 'str'})
+        MetadataStore.write(os.path.join(tmp_path, "docs"), cls._doc_records(df, node_of), DOC_COLUMNS)
+        manifest = {
+            "version": GRAPH_VERSION,
+            "n_nodes": n,
+            "n_edges": int(len(edges)),
+            "pagerank_alpha": PAGERANK_ALPHA,
+            "folded_urls": len(canonical),
+            "source": source_stamp(data_path) if data_path else None,
+        }
+        with open(os.path.join(tmp_path, "manifest.json"), "w") as f:
+            json.dump(manifest, f, indent=2)
+
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.replace(tmp_path, path)
+        print(f"✅ Built link graph: {n} nodes, {len(edges)} edges.")
+        return cls(path)
+
+    @staticmethod
+    def _doc_records(df, node_of):
+        # First crawled row of every URL that is a graph node, in node order
+        docs = {}
+        for url, title, meta_desc, body_text in zip(df['url'], df['title'], df['meta_description'], df['body_text']):
+            node = node_of.get(url)
+            if node is not None and node not in docs:
+                docs[node] = {'url': url, 'title': title, 'meta_description': resolve_description(meta_desc, body_text)}
+        return sorted(docs.items())
+
+    @staticmethod
+    def _previous_scores(path, hashes):
+        # Scores of the last build mapped onto the new node ids by URL hash,
+        # used to warm-start the power iterations after a re-crawl.
+        if not os.path.exists(os.path.join(path, "manifest.json")) or len(hashes) == 0:
+            return None
+        try:
+            previous = LinkGraph(path)
+        except (ValueError, FileNotFoundError):
+            return None
+        if previous.n_nodes == 0:
+            return None
+        pos = np.minimum(np.searchsorted(previous.url_hashes, hashes), previous.n_nodes - 1)
+        found = previous.url_hashes[pos] == hashes
+        nodes = previous.url_hash_nodes[pos]
+        warm = {}
+        for name in ("pagerank", "hubs"):
+            scores = np.where(found, getattr(previous, name)[nodes], 0.0)
+            # Pages new to this crawl start from the average score
+            scores[~found] = scores[found].mean() if found.any() else 1.0
+            warm[name] = scores if scores.sum() > 0 else None
+        return warm
+
+    @staticmethod
+    def _compute_scores(indptr, indices, warm_start=None):
+        warm_start = warm_start or {}
+        pagerank = graph_rank.pagerank(indptr, indices, alpha=PAGERANK_ALPHA, nstart=warm_start.get("pagerank"))
+        hubs, authorities = graph_rank.hits(indptr, indices, nstart=warm_start.get("hubs"),
+                                            max_iter=HITS_MAX_ITER, normalized=True)
+        return pagerank, hubs, authorities
+
+    def node_ids(self, urls):
+        # URL -> node id via the sorted hash table (-1 for URLs not in the graph)
+        hashes = np.array([url_hash(u) for u in urls], dtype='uint64')
+        lo = np.searchsorted(self.url_hashes, hashes, side='left')
+        hi = np.searchsorted(self.url_hashes, hashes, side='right')
+        nodes = np.full(len(urls), -1, dtype='int64')
+        for i, (start, end) in enumerate(zip(lo, hi)):
+            for node in self.url_hash_nodes[start:end]:
+                if self.url(node) == urls[i]:
+                    nodes[i] = node
+                    break
+        return nodes
+
+    def url(self, node):
+        return self.urls.value(int(node), 'url')
+
+    def out_links(self, node):
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+    def in_links(self, node):
+        return self.in_indices[self.in_indptr[node]:self.in_indptr[node + 1]]
+
+    def base_set(self, roots, max_neighbors=50):
+        # Kleinberg's HITS base set: the roots plus up to max_neighbors
+        # out- and in-neighbors of each root
+        parts = [np.asarray(roots, dtype='int64')]
+        for node in roots:
+            parts.append(self.out_links(node)[:max_neighbors])
+            parts.append(self.in_links(node)[:max_neighbors])
+        return np.unique(np.concatenate(parts))
+
+    def local_graph(self, nodes):
+        # CSR adjacency of the subgraph induced by the sorted node array
+        # `nodes`, re-indexed to positions in that array
+        counts, targets = [], []
+        for node in nodes:
+            out = self.out_links(node)
+            pos = np.minimum(np.searchsorted(nodes, out), len(nodes) - 1)
+            local = pos[nodes[pos] == out]
+            counts.append(len(local))
+            targets.append(local)
+        indptr = np.zeros(len(nodes) + 1, dtype='int64')
+        np.cumsum(counts, out=indptr[1:])
+        indices = np.concatenate(targets) if targets else np.zeros(0, dtype='int64')
+        return indptr, indices
+
+
+if __name__ == "__main__":
+    # python link_graph.py <combined_data.csv> [output_dir]
+    data_path = sys.argv[1]
+    out_dir = sys.argv[2] if len(sys.argv) > 2 else os.path.join(os.path.dirname(os.path.abspath(data_path)), "link_graph")
+    LinkGraph.build(pd.read_csv(data_path, usecols=SOURCE_COLUMNS), out_dir, data_path)
@@ -1,148 +1,173 @@
 import pandas as pd
-import networkx as nx
-import re
-import ast
+import numpy as np
 import os
+from collections.abc import Mapping
+from link_graph import LinkGraph, SOURCE_COLUMNS, resolve_description
+import graph_rank
 
 # from vector_model import BertKNNVectorModel
 
-class LinkAnalysisModel:
-    def __init__(self, data_path):
-        self.df = pd.read_csv(data_path)
-        count_ones = self.df["out_links"].apply(lambda x: x == 1 or x == '1').sum()
-        self.graph = nx.DiGraph()
-        self.pagerank_scores = {}
-        self.hub_scores = {}
-        self.authority_scores = {}
-        self._build_graph()
-        self._compute_scores()
-
-    def _build_graph(self):
-        def safe_parse_links(x):
-            if isinstance(x, str):
-                if x.strip() == '1':  # <-- Skip parsing if the original is '1'
-                    return None  # Mark it as None
-                try:
-                    return ast.literal_eval(x)
-                except (ValueError, SyntaxError):
-                    return []
-            return []
+class ScoreMap(Mapping):
+    # Read-only url -> score view over a per-node score array of the link graph
+    def __init__(self, link_graph, scores):
+        self.link_graph = link_graph
+        self.scores = scores
 
-        self.df['out_links'] = self.df['out_links'].apply(safe_parse_links)
+    def __getitem__(self, url):
+        node = self.link_graph.node_ids([url])[0]
+        if node < 0:
+            raise KeyError(url)
+        return float(self.scores[node])
 
-        for _, row in self.df.iterrows():
-            src = row['url']
-            out_links = row['out_links']
-            if isinstance(out_links, list):
-                for dst in out_links:
-                    if isinstance(dst, str) and dst.strip():
-                        self.graph.add_edge(src, dst)
+    def __iter__(self):
+        return (self.link_graph.url(node) for node in range(self.link_graph.n_nodes))
 
-    def _compute_scores(self):
-        self.pagerank_scores = nx.pagerank(self.graph, alpha=0.85)
-        hubs, authorities = nx.hits(self.graph, max_iter=500, normalized=True)
-        self.hub_scores = hubs
-        self.authority_scores = authorities
+    def __len__(self):
+        return self.link_graph.n_nodes
 
-    def _get_top_documents(self, score_dict, top_k=10, score_label='score'):
-        sorted_items = sorted(score_dict.items(), key=lambda x: x[1], reverse=True)
-        results = []
+    def items(self):
+        return zip(self, map(float, self.scores))
 
-        visited = set()
-        for url, score in sorted_items:
-            if url in visited:
-                continue
-            matched = self.df[self.df['url'] == url]
-            if matched.empty:
-                continue
-            row = matched.iloc[0]
-            meta_desc = row['meta_description']
-            if pd.isna(meta_desc) or not meta_desc or meta_desc == "No Description":
-                meta_desc = ' '.join(str(row['body_text']).split()[:30])
-            results.append({
-                'url': url,
-                'title': row['title'],
-                'meta_description': meta_desc,
-                score_label: round(score, 4)
-            })
-            visited.add(url)
-            if len(results) >= top_k:
-                break
-        return results
+    def values(self):
+        return [float(v) for v in self.scores]
 
-    def query_aware_pagerank(self, query, vector_model, top_k=10):
-        vector_results = vector_model.search(query, top_k=top_k * 3)
-        relevant_urls = set(res['url'] for res in vector_results)
-        subgraph = self.graph.subgraph(relevant_urls).copy()
-        pagerank_scores = nx.pagerank(subgraph, alpha=0.85)
-        docs = self._get_top_documents(pagerank_scores, top_k=top_k, score_label='pagerank')
-        return pd.DataFrame(docs)[['url', 'title', 'meta_description']].to_dict(orient='records')
 
-    def query_aware_hits(self, query, vector_model, top_k=10):
-        vector_results = vector_model.search(query, top_k=top_k * 3)
-        relevant_urls = set(res['url'] for res in vector_results)
-        subgraph = self.graph.subgraph(relevant_urls).copy()
-        _, authorities = nx.hits(subgraph, max_iter=500, normalized=True)
-        docs = self._get_top_documents(authorities, top_k=top_k, score_label='authority')
-        return pd.DataFrame(docs)[['url', 'title', 'meta_description']].to_dict(orient='records')
+class LinkAnalysisModel:
+    def __init__(self, data_path, graph_dir=None, push_epsilon=1e-4, push_max_work=20000, hits_max_neighbors=50):
+        self.data_path = data_path
+        # Per-query work bounds for the local link rankers
+        self.push_epsilon = push_epsilon
+        self.push_max_work = push_max_work
+        self.hits_max_neighbors = hits_max_neighbors
+        self.graph_dir = graph_dir or os.path.join(os.path.dirname(os.path.abspath(data_path)), "link_graph")
+        # The compiled graph, its PageRank/HITS scores and document table are
+        # rebuilt only when the CSV changed; otherwise they are memory-mapped.
+        # Without data_path the graph in graph_dir is used as it is (a snapshot).
+        if data_path is not None and not LinkGraph.is_current(self.graph_dir, data_path):
+            LinkGraph.build(pd.read_csv(data_path, usecols=SOURCE_COLUMNS), self.graph_dir, data_path)
+        self.link_graph = LinkGraph(self.graph_dir)
+        self.pagerank_scores = ScoreMap(self.link_graph, self.link_graph.pagerank)
+        self.hub_scores = ScoreMap(self.link_graph, self.link_graph.hubs)
+        self.authority_scores = ScoreMap(self.link_graph, self.link_graph.authorities)
+
+    def _get_top_documents(self, nodes, scores, top_k=10, score_label='score'):
+        # Top-k candidate nodes by score (argpartition, then a stable sort of
+        # just those), hydrated from the graph's document table
+        nodes = np.asarray(nodes, dtype='int64')
+        scores = np.asarray(scores, dtype='float64')
+        known = self.link_graph.docs.rows_for(nodes) >= 0
+        nodes, scores = nodes[known], scores[known]
+        if len(nodes) > top_k:
+            top = np.sort(np.argpartition(-scores, top_k - 1)[:top_k])
+            nodes, scores = nodes[top], scores[top]
+        order = np.argsort(-scores, kind='stable')
+
+        results = []
+        for doc, score in zip(self.link_graph.docs.get_many(nodes[order]), scores[order]):
+            doc[score_label] = round(float(score), 4)
+            results.append(doc)
+        return results
+
+    def _candidate_nodes(self, vector_results):
+        # Graph nodes and vector scores of the distinct candidate URLs that are in the graph
+        candidates = {}
+        for res in vector_results:
+            candidates.setdefault(res['url'], float(res.get('score', 0.0)))
+        urls = list(candidates)
+        nodes = self.link_graph.node_ids(urls) if urls else np.zeros(0, dtype='int64')
+        in_graph = nodes >= 0
+        scores = np.array(list(candidates.values()), dtype='float64')
+        return nodes[in_graph], scores[in_graph]
+
+    def query_aware_pagerank(self, query, vector_model, top_k=10, vector_results=None):
+        if vector_results is None:
+            vector_results = vector_model.search(query, top_k=top_k * 3)
+        nodes, vector_scores = self._candidate_nodes(vector_results)
+        # Personalized PageRank over the whole crawl graph, teleporting to the
+        # vector hits in proportion to their similarity
+        seeds = {}
+        for node, score in zip(nodes.tolist(), vector_scores.tolist()):
+            seeds[node] = seeds.get(node, 0.0) + max(score, 0.0)
+        if sum(seeds.values()) <= 0:
+            seeds = {node: 1.0 for node in seeds}
+        ppr = graph_rank.push_pagerank(
+            self.link_graph.indptr, self.link_graph.indices, seeds,
+            alpha=0.85, epsilon=self.push_epsilon, max_work=self.push_max_work,
+        )
+        pagerank_scores = [ppr.get(node, 0.0) for node in nodes.tolist()]
+        docs = self._get_top_documents(nodes, pagerank_scores, top_k=top_k, score_label='pagerank')
+        return pd.DataFrame(docs, columns=['url', 'title', 'meta_description']).to_dict(orient='records')
+
+    def query_aware_hits(self, query, vector_model, top_k=10, vector_results=None):
+        if vector_results is None:
+            vector_results = vector_model.search(query, top_k=top_k * 3)
+        nodes, _ = self._candidate_nodes(vector_results)
+        authorities = np.zeros(len(nodes))
+        if len(nodes):
+            # HITS on the candidates plus their bounded link neighbourhood, so
+            # links leaving the candidate set still count
+            base = self.link_graph.base_set(np.unique(nodes), self.hits_max_neighbors)
+            indptr, indices = self.link_graph.local_graph(base)
+            try:
+                _, local_authority = graph_rank.hits(indptr, indices, max_iter=500, normalized=True)
+                authorities = local_authority[np.searchsorted(base, nodes)]
+            except graph_rank.ConvergenceError:
+                authorities = np.asarray(self.link_graph.authorities)[nodes]
+        docs = self._get_top_documents(nodes, authorities, top_k=top_k, score_label='authority')
+        return pd.DataFrame(docs, columns=['url', 'title', 'meta_description']).to_dict(orient='records')
 
 
 
 class SearchEngine:
     
-    def __init__(self, vector_model, cache_dir="cache"):
-        combined_data_path = os.getenv("COMBINED_DATA_PATH")
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        combined_data_path = os.path.join(current_dir, combined_data_path)
+    def __init__(self, vector_model, cache_dir="cache", graph_dir=None):
+        # graph_dir serves a prebuilt link graph (an index snapshot) instead of
+        # the one compiled next to COMBINED_DATA_PATH
+        combined_data_path = None
+        if graph_dir is None:
+            combined_data_path = os.getenv("COMBINED_DATA_PATH")
+            current_dir = os.path.dirname(os.path.abspath(__file__))
+            combined_data_path = os.path.join(current_dir, combined_data_path)
         # self.vector_model = BertKNNVectorModel(data_path, cache_dir)
         self.vector_model = vector_model
-        self.link_model = LinkAnalysisModel(combined_data_path)
-
-    def pagerank_model(self, query, top_k=10):
-        return self.link_model.query_aware_pagerank(query, self.vector_model, top_k)
+        self.combined_data_path = combined_data_path
+        self.graph_dir = graph_dir
+        self.link_model = LinkAnalysisModel(combined_data_path, graph_dir)
 
-    def hits_model(self, query, top_k=10):
-        return self.link_model.query_aware_hits(query, self.vector_model, top_k)
+    def reload_link_scores(self):
+        self.link_model = LinkAnalysisModel(self.combined_data_path, self.graph_dir)
 
-    def hybrid_model(self, query, top_k=10, alpha=0.6, beta=0.2, gamma=0.2):
-        vector_results = self.vector_model.search(query, top_k=top_k)
-        hybrid_results = []
+    # vector_results lets callers that already ran the vector search (e.g. the
+    # batched faiss_server) skip a second encode + index search.
+    def pagerank_model(self, query, vector_results=None, top_k=10):
+        return self.link_model.query_aware_pagerank(query, self.vector_model, top_k, vector_results)
 
-        norm_pagerank = self._normalize(self.link_model.pagerank_scores)
-        norm_authority = self._normalize(self.link_model.authority_scores)
+    def hits_model(self, query, vector_results=None, top_k=10):
+        return self.link_model.query_aware_hits(query, self.vector_model, top_k, vector_results)
 
-        for res in vector_results:
-            url = res['url']
-            vec_score = res['score']
-            pr_score = norm_pagerank.get(url, 0.0)
-            auth_score = norm_authority.get(url, 0.0)
+    def hybrid_model(self, query, vector_results=None, top_k=10, alpha=0.6, beta=0.2, gamma=0.2):
+        if vector_results is None:
+            vector_results = self.vector_model.search(query, top_k=top_k)
+        if not vector_results:
+            return []
 
-            combined_score = (
-                alpha * vec_score +
-                beta * auth_score +
-                gamma * pr_score
-            )
+        # Normalized global scores are computed once per link graph load; only
+        # the candidates' entries are gathered here
+        link_graph = self.link_model.link_graph
+        nodes = link_graph.node_ids([res['url'] for res in vector_results])
+        pr_scores = link_graph.normalized_scores('pagerank', nodes)
+        auth_scores = link_graph.normalized_scores('authorities', nodes)
+        vec_scores = np.array([res['score'] for res in vector_results], dtype='float64')
 
-            meta_desc = res.get('meta_description')
-            if not meta_desc or pd.isna(meta_desc) or meta_desc == "No Description":
-                meta_desc = ' '.join(str(res.get('body_text', '')).split()[:30])
+        combined_scores = np.round(alpha * vec_scores + beta * auth_scores + gamma * pr_scores, 4)
+        order = np.argsort(-combined_scores, kind='stable')[:top_k]
 
+        hybrid_results = []
+        for i in order:
+            res = vector_results[i]
             hybrid_results.append({
-                'url': url,
+                'url': res['url'],
                 'title': res['title'],
-                'meta_description': meta_desc,
-                'combined_score': round(combined_score, 4)
+                'meta_description': resolve_description(res.get('meta_description'), res.get('body_text', '')),
             })
-
-        hybrid_results.sort(key=lambda x: x['combined_score'], reverse=True)
-        
-        return pd.DataFrame(hybrid_results)[['url', 'title', 'meta_description']].to_dict(orient='records')
-
-    def _normalize(self, score_dict):
-        values = list(score_dict.values())
-        min_val, max_val = min(values), max(values)
-        return {
-            k: (v - min_val) / (max_val - min_val) if max_val > min_val else 0.0
-            for k, v in score_dict.items()
-        }
-
+        return hybrid_results
@@ -0,0 +1,183 @@
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+
+# On-disk columnar document metadata keyed by FAISS ID.
+#
+#   <path>/manifest.json           column names/types and row count
+#   <path>/ids.npy                 sorted int64 document IDs (row i <-> ids[i])
+#   <path>/<col>.offsets.npy       int64 start offsets into the string heap (n + 1)
+#   <path>/<col>.heap              concatenated UTF-8 values
+#   <path>/<col>.npy               int64 values for numeric columns
+#
+# Every file is memory-mapped on open, so only the pages touched by a lookup
+# are ever read and all server processes share the same page cache.
+
+STORE_VERSION = 1
+
+COLUMNS = {
+    "url": "str",
+    "title": "str",
+    "meta_description": "str",
+    "body_text": "str",
+    "depth": "int",
+    "last_crawled": "str",
+}
+
+RESULT_FIELDS = ("url", "title", "meta_description")
+
+
+def _as_str(value):
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return ""
+    return str(value)
+
+
+def _as_int(value):
+    if value is None or pd.isna(value):
+        return -1
+    return int(value)
+
+
+class MetadataStoreWriter:
+    def __init__(self, path, columns=None):
+        self.path = path
+        self.columns = dict(columns or COLUMNS)
+        self.tmp_path = path.rstrip(os.sep) + ".tmp"
+        if os.path.exists(self.tmp_path):
+            shutil.rmtree(self.tmp_path)
+        os.makedirs(self.tmp_path)
+
+        self.ids = []
+        self.offsets = {c: [0] for c, t in self.columns.items() if t == "str"}
+        self.values = {c: [] for c, t in self.columns.items() if t == "int"}
+        self.heaps = {c: open(os.path.join(self.tmp_path, f"{c}.heap"), "wb") for c in self.offsets}
+
+    def append(self, doc_id, record):
+        doc_id = int(doc_id)
+        if self.ids and doc_id <= self.ids[-1]:
+            raise ValueError(f"Document IDs must be written in increasing order (got {doc_id} after {self.ids[-1]})")
+        self.ids.append(doc_id)
+        for col, heap in self.heaps.items():
+            value = record.get(col)
+            data = value if isinstance(value, bytes) else _as_str(value).encode("utf-8")
+            heap.write(data)
+            self.offsets[col].append(self.offsets[col][-1] + len(data))
+        for col, values in self.values.items():
+            values.append(_as_int(record.get(col)))
+
+    def close(self):
+        for heap in self.heaps.values():
+            heap.close()
+        np.save(os.path.join(self.tmp_path, "ids.npy"), np.array(self.ids, dtype="int64"))
+        for col, offsets in self.offsets.items():
+            np.save(os.path.join(self.tmp_path, f"{col}.offsets.npy"), np.array(offsets, dtype="int64"))
+        for col, values in self.values.items():
+            np.save(os.path.join(self.tmp_path, f"{col}.npy"), np.array(values, dtype="int64"))
+        with open(os.path.join(self.tmp_path, "manifest.json"), "w") as f:
+            json.dump({"version": STORE_VERSION, "count": len(self.ids), "columns": self.columns}, f, indent=2)
+
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
+        os.replace(self.tmp_path, self.path)
+        return MetadataStore(self.path)
+
+
+class MetadataStore:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "manifest.json")) as f:
+            manifest = json.load(f)
+        if manifest["version"] != STORE_VERSION:
+            raise ValueError(f"Unsupported metadata store version {manifest['version']} in {path}")
+        self.columns = manifest["columns"]
+        self.ids = np.load(os.path.join(path, "ids.npy"), mmap_mode="r")
+        self._offsets = {}
+        self._heaps = {}
+        self._values = {}
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, "manifest.json"))
+
+    @classmethod
+    def write(cls, path, records, columns=None):
+        # records: iterable of (doc_id, dict) in increasing doc_id order
+        writer = MetadataStoreWriter(path, columns)
+        for doc_id, record in records:
+            writer.append(doc_id, record)
+        return writer.close()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, doc_id):
+        return self.rows_for([doc_id])[0] >= 0
+
+    def _column(self, col):
+        if self.columns[col] == "int":
+            if col not in self._values:
+                self._values[col] = np.load(os.path.join(self.path, f"{col}.npy"), mmap_mode="r")
+            return self._values[col]
+        if col not in self._heaps:
+            self._offsets[col] = np.load(os.path.join(self.path, f"{col}.offsets.npy"), mmap_mode="r")
+            heap_path = os.path.join(self.path, f"{col}.heap")
+            # np.memmap cannot map an empty file
+            self._heaps[col] = (np.memmap(heap_path, dtype=np.uint8, mode="r")
+                                if os.path.getsize(heap_path) else np.zeros(0, dtype=np.uint8))
+        return self._offsets[col], self._heaps[col]
+
+    def rows_for(self, doc_ids):
+        doc_ids = np.asarray(doc_ids, dtype="int64")
+        if len(self.ids) == 0:
+            return np.full(len(doc_ids), -1, dtype="int64")
+        rows = np.searchsorted(self.ids, doc_ids)
+        rows = np.minimum(rows, len(self.ids) - 1)
+        return np.where(self.ids[rows] == doc_ids, rows, -1)
+
+    def value(self, row, col, raw=False):
+        column = self._column(col)
+        if self.columns[col] == "int":
+            return int(column[row])
+        offsets, heap = column
+        data = heap[offsets[row]:offsets[row + 1]].tobytes()
+        return data if raw else data.decode("utf-8")
+
+    def get(self, doc_id, fields=RESULT_FIELDS):
+        return self.get_many([doc_id], fields)[0]
+
+    def get_many(self, doc_ids, fields=RESULT_FIELDS):
+        records = []
+        for row in self.rows_for(doc_ids):
+            if row < 0:
+                records.append({})
+            else:
+                records.append({col: self.value(row, col) for col in fields})
+        return records
+
+    def iter_records(self, fields=None, raw=False):
+        fields = fields or list(self.columns)
+        for row, doc_id in enumerate(self.ids):
+            yield int(doc_id), {col: self.value(row, col, raw=raw) for col in fields}
+
+
+def merge_records(store, drop_ids, new_records):
+    # Old rows minus drop_ids, merged with new (doc_id, record) pairs in ID order.
+    # Old values are copied as raw bytes, so nothing is decoded on the way through.
+    drop_ids = set(int(i) for i in drop_ids)
+    new_records = sorted(new_records, key=lambda item: item[0])
+    old = ((i, r) for i, r in store.iter_records(raw=True) if i not in drop_ids) if store is not None else iter(())
+
+    pending = next(old, None)
+    for doc_id, record in new_records:
+        while pending is not None and pending[0] < doc_id:
+            yield pending
+            pending = next(old, None)
+        if pending is not None and pending[0] == doc_id:
+            pending = next(old, None)
+        yield doc_id, record
+    while pending is not None:
+        yield pending
+        pending = next(old, None)
@@ -0,0 +1,334 @@
+import os
+import sys
+import time
+import bisect
+import random
+import threading
+from collections import Counter as StackCounter
+
+# In-process request metrics in the Prometheus text format (GET /metrics).
+# Recording is a bisect and a couple of additions under a per-metric lock,
+# so it stays on in production. Histograms keep per-bucket counts and are
+# only made cumulative when scraped.
+#
+# SlowRequestProfiler is an optional, sampled profiler for slow requests:
+# while a sampled request is over the threshold, a background thread samples
+# the stacks of every thread and writes them as folded stacks (flamegraph.pl
+# / speedscope input) when the request finishes.
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 5, 10, 20, 50, 100, 200, 500, 1000)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            values = list(self.values.items())
+        return [(self.name + _labels(self.labels, key), value) for key, value in values]
+
+
+class _Timer:
+    __slots__ = ("histogram", "label_values", "start")
+
+    def __init__(self, histogram, label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.label_values)
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (last one is +Inf), sum]
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        bucket = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(label_values)
+            if entry is None:
+                entry = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][bucket] += 1
+            entry[1] += value
+
+    def time(self, *label_values):
+        # with histogram.time("encode"): ... observes the elapsed seconds
+        return _Timer(self, label_values)
+
+    def samples(self):
+        with self.lock:
+            values = [(key, list(counts), total) for key, (counts, total) in self.values.items()]
+        lines = []
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                lines.append((self.name + "_bucket" + _labels(self.labels, key, f'le="{_number(float(bound))}"'),
+                              cumulative))
+            lines.append((self.name + "_sum" + _labels(self.labels, key), total))
+            lines.append((self.name + "_count" + _labels(self.labels, key), cumulative))
+        return lines
+
+
+class CallbackMetric:
+    # A counter or gauge read at scrape time from fn(), which returns a number
+    # or a {label values tuple: number} dict. Used for state other objects
+    # already track (cache hit counts, queue depth).
+
+    def __init__(self, name, kind, help, fn, labels=()):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.fn = fn
+        self.labels = tuple(labels)
+
+    def samples(self):
+        values = self.fn()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [(self.name + _labels(self.labels, key), value) for key, value in values.items()]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        if any(m.name == metric.name for m in self.metrics):
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def callback(self, name, kind, help, fn, labels=()):
+        return self.register(CallbackMetric(name, kind, help, fn, labels))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{sample} {_number(value)}" for sample, value in metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+class SearchMetrics:
+    # The metrics recorded by faiss_server. Stages are the parts of a request
+    # that can be slow on their own: queue_wait, encode, index_search and
+    # hydrate (per batcher batch), tfidf_search, fused_retrieval and
+    # rank_<ranker>.
+
+    def __init__(self, registry=None):
+        self.registry = registry or Registry()
+        r = self.registry
+        self.requests = r.counter("search_requests_total", "HTTP requests by endpoint and status code.",
+                                  ("endpoint", "status"))
+        self.errors = r.counter("search_errors_total", "Failed HTTP requests by endpoint and error.",
+                                ("endpoint", "error"))
+        self.latency = r.histogram("search_request_seconds", "HTTP request latency.", ("endpoint",))
+        self.stages = r.histogram("search_stage_seconds", "Latency of each search stage.", ("stage",))
+        self.cache = r.counter("search_result_cache_total", "Result cache lookups by ranker and outcome.",
+                               ("ranker", "result"))
+        self.candidates = r.histogram("search_candidates", "Retrieved candidates per ranked search.",
+                                      ("ranker",), buckets=COUNT_BUCKETS)
+        self.batch_size = r.histogram("search_batch_size", "Queries per batched index search.",
+                                      buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+
+    def stage(self, name):
+        return self.stages.time(name)
+
+    def render(self):
+        return self.registry.render()
+
+
+class _Profile:
+    __slots__ = ("name", "start", "stacks", "samples")
+
+    def __init__(self, name):
+        self.name = name
+        self.start = time.perf_counter()
+        self.stacks = StackCounter()
+        self.samples = 0
+
+
+class SlowRequestProfiler:
+    # begin()/end() bracket a request. A `sample_rate` share of requests is
+    # watched; once a watched request has run for `threshold_ms`, all thread
+    # stacks are sampled every `interval_ms` until it ends, and the samples
+    # are written to <out_dir>/<time>-<name>-<ms>ms.folded. The samples cover
+    # the whole process (event loop and threadpool), not only the request.
+
+    def __init__(self, threshold_ms, sample_rate=0.01, out_dir="profiles", interval_ms=5.0, max_samples=2000):
+        self.threshold = threshold_ms / 1000.0
+        self.sample_rate = sample_rate
+        self.out_dir = out_dir
+        self.interval = interval_ms / 1000.0
+        self.max_samples = max_samples
+        self.active = {}
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+        self.written = 0
+
+    def begin(self, name):
+        if random.random() >= self.sample_rate:
+            return None
+        profile = _Profile(name)
+        with self.lock:
+            self.active[id(profile)] = profile
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="slow-request-profiler", daemon=True)
+                self.thread.start()
+        self.wake.set()
+        return profile
+
+    def end(self, profile):
+        if profile is None:
+            return None
+        with self.lock:
+            self.active.pop(id(profile), None)
+        elapsed = time.perf_counter() - profile.start
+        if elapsed < self.threshold or not profile.samples:
+            return None
+        os.makedirs(self.out_dir, exist_ok=True)
+        name = profile.name.strip("/").replace("/", "_") or "root"
+        path = os.path.join(self.out_dir, f"{int(time.time() * 1000)}-{name}-{elapsed * 1000:.0f}ms.folded")
+        with open(path, "w") as f:
+            for stack, count in profile.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        self.written += 1
+        print(f"Slow request {profile.name} took {elapsed * 1000:.0f} ms; "
+              f"{profile.samples} stack samples written to {path}", file=sys.stderr)
+        return path
+
+    def _sample(self):
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        stacks = []
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            stacks.append(";".join([names.get(ident, str(ident))] + frames[::-1]))
+        return stacks
+
+    def _run(self):
+        while True:
+            with self.lock:
+                watching = bool(self.active)
+            if not watching:
+                # Idle until the next watched request
+                self.wake.wait()
+                self.wake.clear()
+                continue
+            time.sleep(self.interval)
+            now = time.perf_counter()
+            with self.lock:
+                slow = [p for p in self.active.values()
+                        if now - p.start >= self.threshold and p.samples < self.max_samples]
+            if not slow:
+                continue
+            stacks = self._sample()
+            with self.lock:
+                for profile in slow:
+                    profile.stacks.update(stacks)
+                    profile.samples += 1
+
+
+class MetricsMiddleware:
+    # ASGI middleware recording request count, status, errors and latency per
+    # endpoint. Paths that are not routes of the app are counted as "other"
+    # so that scanners cannot blow up the label set.
+
+    def __init__(self, app, metrics, profiler=None):
+        self.app = app
+        self.metrics = metrics
+        self.profiler = profiler
+        self.endpoints = None
+
+    def _endpoint(self, scope):
+        if self.endpoints is None:
+            routes = getattr(scope.get("app"), "routes", None) or []
+            self.endpoints = {getattr(route, "path", None) for route in routes} - {None}
+        path = scope["path"]
+        return path if path in self.endpoints else "other"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        endpoint = self._endpoint(scope)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        profile = self.profiler.begin(endpoint) if self.profiler is not None else None
+        start = time.perf_counter()
+        error = None
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception as e:
+            status, error = 500, type(e).__name__
+            raise
+        finally:
+            self.metrics.latency.observe(time.perf_counter() - start, endpoint)
+            self.metrics.requests.inc(endpoint, str(status))
+            if error is not None or status >= 400:
+                self.metrics.errors.inc(endpoint, error or str(status))
+            if profile is not None:
+                self.profiler.end(profile)
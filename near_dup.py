@@ -0,0 +1,225 @@
+import os
+import zlib
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
+
+# Near-duplicate detection for ingestion (mirrors, print views, paginated
+# copies): MinHash signatures over word shingles, LSH banding to find
+# candidate pairs, and one canonical page per cluster of near-identical
+# body texts.
+#
+# Signatures are computed per chunk and are independent of each other, so
+# chunks can be hashed in parallel processes. Only the low 16 bits of every
+# min-hash are kept (b-bit MinHash): 256 bytes per page with 128
+# permutations, at a negligible cost in accuracy.
+#
+# The duplicate -> canonical map is written next to the combined CSV and
+# read by LinkGraph.build to fold links to duplicates onto the canonical page.
+
+SHINGLE_SIZE = 5
+NUM_PERM = 128
+BANDS = 16
+# Estimated Jaccard similarity of the shingle sets above which two pages are duplicates
+THRESHOLD = 0.8
+RULES = ('earliest', 'shortest_url', 'shallowest')
+# Shingles hashed at once, times NUM_PERM 64-bit values in memory
+HASH_BLOCK = 65536
+MAP_COLUMNS = ['url', 'canonical_url', 'reason', 'similarity']
+# LSH buckets up to this size are compared all-pairs, larger ones only
+# between neighbours in the bucket
+BUCKET_PAIRS_MAX = 32
+
+# Per-position multipliers that combine the word hashes of a shingle
+_POSITION = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9,
+                      0xD6E8FEB86659FD93, 0xFF51AFD7ED558CCD, 0xC4CEB9FE1A85EC53,
+                      0x85EBCA77C2B2AE63, 0x27D4EB2F165667C5], dtype='uint64')
+_BAND_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+class MinHasher:
+    # Picklable, so it can be shipped to worker processes; the same seed
+    # gives the same signatures in every process.
+
+    def __init__(self, num_perm=NUM_PERM, shingle_size=SHINGLE_SIZE, seed=1):
+        if shingle_size > len(_POSITION):
+            raise ValueError(f"Shingles of at most {len(_POSITION)} words are supported")
+        rng = np.random.default_rng(seed)
+        # Multiply-shift hash family: h(x) = (a * x + b) >> 32 over 64-bit words
+        self.a = rng.integers(1, 2**63, size=num_perm, dtype='uint64') | np.uint64(1)
+        self.b = rng.integers(0, 2**63, size=num_perm, dtype='uint64')
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+
+    def _shingles(self, texts):
+        # 32-bit hashes of the word shingles of every text, concatenated, and
+        # the number of shingles of each text. A text shorter than the
+        # shingle size is one shingle.
+        tokens = [text.lower().split() if isinstance(text, str) else [] for text in texts]
+        lengths = np.array([len(t) for t in tokens], dtype='int64')
+        codes, vocabulary = pd.factorize(np.array([word for t in tokens for word in t], dtype=object))
+        # Each distinct word of the chunk is hashed once
+        word_hashes = np.fromiter((zlib.crc32(w.encode('utf-8')) for w in vocabulary), dtype='uint64',
+                                  count=len(vocabulary))[codes]
+
+        counts = np.maximum(lengths - self.shingle_size + 1, np.minimum(lengths, 1))
+        # First word and end of the text of every shingle, as flat word positions
+        text_starts = np.cumsum(lengths) - lengths
+        starts = np.repeat(text_starts, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        ends = np.repeat(text_starts + lengths, counts)
+        shingles = np.zeros(len(starts), dtype='uint64')
+        with np.errstate(over='ignore'):
+            for j in range(self.shingle_size):
+                position = np.minimum(starts + j, ends - 1)
+                shingles += np.where(starts + j < ends, word_hashes[position] * _POSITION[j], np.uint64(0))
+        return shingles >> np.uint64(32), counts
+
+    def signatures(self, texts):
+        # (len(texts), num_perm) uint16 signatures; texts without words get
+        # all zeros and never match anything (see lsh_clusters)
+        shingles, counts = self._shingles(texts)
+        signatures = np.zeros((len(counts), self.num_perm), dtype='uint16')
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        has_text = np.flatnonzero(counts)
+        # Blocks of whole texts, about HASH_BLOCK shingles each, hashed in
+        # place in one buffer
+        blocks = np.flatnonzero(np.diff(offsets[has_text] // HASH_BLOCK)) + 1
+        buffer = np.empty(self.num_perm * (HASH_BLOCK + int(counts.max(initial=0))), dtype='uint64')
+        for docs in np.split(has_text, blocks):
+            if not len(docs):
+                continue
+            lo, hi = offsets[docs[0]], offsets[docs[-1] + 1]
+            hashes = buffer[:self.num_perm * (hi - lo)].reshape(self.num_perm, hi - lo)
+            with np.errstate(over='ignore'):
+                np.multiply(self.a[:, None], shingles[None, lo:hi], out=hashes)
+            hashes += self.b[:, None]
+            hashes >>= np.uint64(32)
+            minima = np.minimum.reduceat(hashes, offsets[docs] - lo, axis=1)
+            signatures[docs] = (minima.T & np.uint64(0xFFFF)).astype('uint16')
+        return signatures
+
+
+def similarity(signatures, left, right):
+    # Estimated Jaccard similarity of the pairs (left[i], right[i])
+    return (signatures[left] == signatures[right]).mean(axis=1)
+
+
+def lsh_pairs(signatures, bands=BANDS):
+    # Candidate pairs: rows equal to another row in at least one band. Pairs
+    # are scored against the threshold afterwards, so two members of a
+    # bucket can be duplicates while neither matches a third: every pair of a
+    # small bucket is returned, and neighbouring members of a large one.
+    n, num_perm = signatures.shape
+    if num_perm % bands:
+        raise ValueError(f"{num_perm} permutations cannot be split into {bands} bands")
+    rows = num_perm // bands
+    candidates = np.flatnonzero(signatures.any(axis=1))
+    left, right = [np.zeros(0, dtype='int64')], [np.zeros(0, dtype='int64')]
+    for band in range(bands):
+        values = signatures[candidates, band * rows:(band + 1) * rows].astype('uint64')
+        keys = np.zeros(len(candidates), dtype='uint64')
+        with np.errstate(over='ignore'):
+            for column in values.T:
+                keys = (keys ^ column) * _BAND_MIX
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        new_bucket = np.ones(len(order), dtype=bool)
+        new_bucket[1:] = sorted_keys[1:] != sorted_keys[:-1]
+        bucket = np.cumsum(new_bucket) - 1
+        sizes = np.bincount(bucket)[bucket]
+        small = sizes <= BUCKET_PAIRS_MAX
+        # Members at distance d in the sorted bucket, for every d below the
+        # largest small bucket (and d = 1 in large ones)
+        reach = max(int(sizes[small].max(initial=1)), 2 if not small.all() else 1)
+        for d in range(1, reach):
+            same = (bucket[:-d] == bucket[d:]) & (small[:-d] | (d == 1))
+            # Stable sort: members of a bucket are in row order, so left < right
+            left.append(candidates[order[:-d][same]])
+            right.append(candidates[order[d:][same]])
+    pairs = np.unique(np.stack([np.concatenate(left), np.concatenate(right)], axis=1), axis=0)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def lsh_clusters(signatures, bands=BANDS, threshold=THRESHOLD):
+    # Cluster label of every row (rows without near-duplicates are alone in
+    # their cluster), and the similarity of each row to its closest match
+    left, right = lsh_pairs(signatures, bands)
+    scores = similarity(signatures, left, right)
+    keep = scores >= threshold
+    left, right, scores = left[keep], right[keep], scores[keep]
+    n = len(signatures)
+    graph = sp.coo_matrix((np.ones(len(left)), (left, right)), shape=(n, n))
+    _, labels = connected_components(graph, directed=False)
+    best = np.zeros(n)
+    np.maximum.at(best, left, scores)
+    np.maximum.at(best, right, scores)
+    return labels, best
+
+
+def choose_canonical(labels, times, url_lengths, depths, rule='earliest'):
+    # Position of the canonical member of every row's cluster. Ties go to
+    # the earlier crawl, then the row read first.
+    if rule not in RULES:
+        raise ValueError(f"Unknown canonical rule '{rule}', expected one of {RULES}")
+    positions = np.arange(len(labels))
+    primary = {'earliest': times, 'shortest_url': url_lengths, 'shallowest': depths}[rule]
+    order = np.lexsort((positions, times, primary, labels))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = labels[order][1:] != labels[order][:-1]
+    canonical = np.empty(len(labels), dtype='int64')
+    canonical[labels[order[first]]] = order[first]
+    return canonical[labels]
+
+
+def canonical_map_path(data_path):
+    return os.path.splitext(data_path)[0] + ".canonical.csv"
+
+
+class DuplicateMap:
+    # Dropped rows and the row each one was folded into, by global row
+    # number. The URLs are picked up during the second ingestion pass.
+
+    def __init__(self, rows, canonical_rows, reasons, similarities):
+        order = np.argsort(rows)
+        self.rows = np.asarray(rows, dtype='int64')[order]
+        self.canonical_rows = np.asarray(canonical_rows, dtype='int64')[order]
+        self.reasons = np.asarray(reasons, dtype=object)[order]
+        self.similarities = np.asarray(similarities, dtype='float64')[order]
+        self.wanted = np.union1d(self.rows, self.canonical_rows)
+        self.urls = {}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def collect(self, chunk):
+        # Remembers the URLs of the rows of `chunk` that take part in the map
+        if not len(chunk) or not len(self.wanted):
+            return
+        lo, hi = np.searchsorted(self.wanted, [chunk.index[0], chunk.index[-1] + 1])
+        for row in self.wanted[lo:hi]:
+            self.urls[row] = chunk.at[row, 'url']
+
+    def save(self, path):
+        frame = pd.DataFrame({
+            'url': [self.urls.get(row) for row in self.rows],
+            'canonical_url': [self.urls.get(row) for row in self.canonical_rows],
+            'reason': self.reasons,
+            'similarity': self.similarities.round(4),
+        }, columns=MAP_COLUMNS)
+        # Another crawl of the canonical URL itself is not a separate page
+        frame = frame[frame['url'] != frame['canonical_url']].drop_duplicates(subset='url')
+        tmp_path = path + ".tmp"
+        frame.to_csv(tmp_path, index=False, escapechar='\\')
+        os.replace(tmp_path, path)
+        return len(frame)
+
+
+def load_canonical_map(data_path):
+    # {duplicate URL: canonical URL} written by ingestion for data_path;
+    # empty when there is none
+    path = canonical_map_path(data_path)
+    if not os.path.exists(path):
+        return {}
+    frame = pd.read_csv(path, usecols=['url', 'canonical_url'], escapechar='\\')
+    return dict(zip(frame['url'], frame['canonical_url']))
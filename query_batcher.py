@@ -0,0 +1,95 @@
+import time
+import asyncio
+from contextlib import nullcontext
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class QueryBatcher:
+    # Coalesces concurrent vector searches: requests that arrive within
+    # `window_ms` of each other (up to `max_batch`) share one encode call and
+    # one index.search. At most `max_queue` requests may wait; beyond that
+    # search() raises QueueFullError so callers can shed load. With `metrics`
+    # (a metrics.SearchMetrics) each batch records its queue wait, encode,
+    # index search and hydrate times and its size.
+
+    def __init__(self, vector_model, window_ms=2.0, max_batch=32, max_queue=1024, metrics=None):
+        self.vector_model = vector_model
+        self.metrics = metrics
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+        self.queue = None
+        self.worker = None
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=self.max_queue)
+        self.worker = loop.create_task(self._run())
+
+    async def stop(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+            self.worker = None
+
+    async def search(self, query, top_k=10):
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((query, top_k, future, time.perf_counter()))
+        except asyncio.QueueFull:
+            raise QueueFullError(f"Search queue is full ({self.max_queue} pending requests)")
+        return await future
+
+    async def _next_batch(self):
+        batch = [await self.queue.get()]
+        # Give concurrent requests a short window to join, unless the batch is already full
+        if self.window > 0 and self.queue.qsize() < self.max_batch - 1:
+            await asyncio.sleep(self.window)
+        while len(batch) < self.max_batch and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        # Requests whose client went away don't need to be searched
+        return [item for item in batch if not item[2].done()]
+
+    def _stage(self, name):
+        return self.metrics.stage(name) if self.metrics is not None else nullcontext()
+
+    def _search_batch(self, batch):
+        # BertFaissVectorModel.search_batch, split up so each stage can be timed
+        queries = [query for query, _, _, _ in batch]
+        top_ks = [top_k for _, top_k, _, _ in batch]
+        model = self.vector_model
+        with self._stage("encode"):
+            embeddings = model.encode_queries(queries)
+        with self._stage("index_search"):
+            distances, indices = model.search_vectors(embeddings, max(top_ks))
+        with self._stage("hydrate"):
+            return [model.hydrate(distances[i][:k], indices[i][:k]) for i, k in enumerate(top_ks)]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            if not batch:
+                continue
+            if self.metrics is not None:
+                now = time.perf_counter()
+                self.metrics.batch_size.observe(len(batch))
+                for _, _, _, enqueued in batch:
+                    self.metrics.stages.observe(now - enqueued, "queue_wait")
+            try:
+                # Encoding and FAISS release the GIL; keep the event loop free meanwhile
+                results = await loop.run_in_executor(None, self._search_batch, batch)
+            except Exception as e:
+                for _, _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, _, future, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
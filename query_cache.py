@@ -0,0 +1,129 @@
+import time
+import json
+import base64
+import binascii
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+def normalize_query(query):
+    # Cache key: queries differing only in case and whitespace share entries
+    return ' '.join(query.lower().split())
+
+
+def encode_cursor(state):
+    # Opaque, URL-safe page cursor holding everything needed to serve the
+    # next page, including recomputing it when the cached list is gone
+    data = json.dumps(state, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        state = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("Malformed cursor")
+    if not isinstance(state, dict):
+        raise ValueError("Malformed cursor")
+    return state
+
+
+class EmbeddingCache:
+    # Bounded LRU of normalized query -> normalized query embedding
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            vector = self.entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, key, vector):
+        with self.lock:
+            self.entries[key] = vector
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def encode(self, queries, encode_fn, key=normalize_query):
+        # Embeddings for `queries`, cached under key(query). The raw text of
+        # the first query seen for each uncached key is passed to encode_fn,
+        # all of them in a single call.
+        keys = [key(q) for q in queries]
+        vectors = [self.get(k) for k in keys]
+        missing = {}
+        for k, q, v in zip(keys, queries, vectors):
+            if v is None:
+                missing.setdefault(k, q)
+        if missing:
+            encoded = dict(zip(missing, encode_fn(list(missing.values()))))
+            for k, v in encoded.items():
+                self.put(k, v)
+            vectors = [v if v is not None else encoded[k] for k, v in zip(keys, vectors)]
+        return np.vstack(vectors)
+
+    def stats(self):
+        return {"size": len(self.entries), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
+
+
+class ResultCache:
+    # TTL cache of ranked results keyed by (query, top_k, ranker), evicting the
+    # least recently used entry once max_size is reached. invalidate() drops
+    # everything, e.g. after the index or link scores are reloaded.
+
+    def __init__(self, max_size=10000, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self):
+        with self.lock:
+            self.entries.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
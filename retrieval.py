@@ -0,0 +1,90 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Lexical (TF-IDF) + dense (FAISS) retrieval fan-out. Both retrievers run at
+# the same time and their ranked lists are merged with reciprocal-rank
+# fusion, so a request costs about the slower of the two instead of their
+# sum. Whatever has finished by the latency budget is fused; the rest is
+# dropped for that request. If nothing has finished by then, the first
+# retriever to finish is used.
+
+RRF_K = 60
+RETRIEVERS = ("vector", "tfidf", "fused")
+
+
+def rrf_fuse(result_lists, top_k=None, k=RRF_K):
+    # Reciprocal-rank fusion of ranked result dicts (matched by URL). Scores
+    # are scaled so that a document ranked first by every list scores 1,
+    # which keeps them comparable with cosine scores in the hybrid ranker.
+    result_lists = [results for results in result_lists if results]
+    if not result_lists:
+        return []
+    best = len(result_lists) / (k + 1)
+    fused = {}
+    for results in result_lists:
+        for rank, res in enumerate(results, 1):
+            entry = fused.setdefault(res['url'], {**res, 'score': 0.0})
+            entry['score'] += 1.0 / (k + rank)
+    ranked = sorted(fused.values(), key=lambda res: -res['score'])[:top_k]
+    for res in ranked:
+        res['score'] = res['score'] / best
+    return ranked
+
+
+class FusedRetriever:
+    def __init__(self, vector_model, tfidf_engine, budget_ms=200.0, max_workers=4, rrf_k=RRF_K):
+        self.vector_model = vector_model
+        self.tfidf_engine = tfidf_engine
+        self.budget = budget_ms / 1000.0
+        self.rrf_k = rrf_k
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="retrieval")
+        self.stats = {"requests": 0, "timeouts": 0, "errors": 0}
+
+    def _collect(self, futures):
+        # Ranked lists of the retrievers that finished without an error
+        lists = []
+        for name, future in futures.items():
+            if not future.done():
+                self.stats["timeouts"] += 1
+            elif future.exception() is not None:
+                self.stats["errors"] += 1
+                print(f"{name} retrieval failed: {future.exception()!r}")
+            else:
+                lists.append(future.result())
+        return lists
+
+    def search(self, query, top_k=10):
+        # Blocking fan-out for in-process callers
+        self.stats["requests"] += 1
+        futures = {
+            "vector": self.pool.submit(self.vector_model.search, query, top_k),
+            "tfidf": self.pool.submit(self.tfidf_engine.search, query, top_k),
+        }
+        done, _ = wait(futures.values(), timeout=self.budget)
+        if not done:
+            wait(futures.values(), return_when=FIRST_COMPLETED)
+        return rrf_fuse(self._collect(futures), top_k, self.rrf_k)
+
+    async def search_async(self, query, top_k=10, vector_search=None):
+        # Event-loop fan-out; vector_search may be an async callable such as
+        # QueryBatcher.search so the dense half still gets batched
+        self.stats["requests"] += 1
+        loop = asyncio.get_running_loop()
+        if vector_search is None:
+            vector = loop.run_in_executor(self.pool, self.vector_model.search, query, top_k)
+        else:
+            vector = asyncio.ensure_future(vector_search(query, top_k))
+        futures = {
+            "vector": vector,
+            "tfidf": loop.run_in_executor(self.pool, self.tfidf_engine.search, query, top_k),
+        }
+        done, pending = await asyncio.wait(futures.values(), timeout=self.budget)
+        if not done:
+            done, pending = await asyncio.wait(futures.values(), return_when=asyncio.FIRST_COMPLETED)
+        results = self._collect(futures)
+        for future in pending:
+            future.cancel()
+        return rrf_fuse(results, top_k, self.rrf_k)
+
+    def close(self):
+        self.pool.shutdown(wait=False)
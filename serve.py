@@ -0,0 +1,136 @@
+import os
+import gc
+import sys
+import time
+import signal
+import socket
+import argparse
+import traceback
+
+# Pre-fork server for faiss_server.py:
+#
+#   python serve.py --workers 4 --port 8000 --torch-threads 2 --faiss-threads 2
+#
+# The parent imports faiss_server, which loads the encoder, the FAISS
+# index, the metadata store, the link graph and the TF-IDF postings once.
+# It then binds the listening socket and forks the workers, which all
+# accept on that socket. The workers share the parent's memory copy-on-write,
+# and none of it is written after the fork. Model weights, index codes and
+# score arrays live outside Python objects, and gc.freeze() stops the
+# collector from touching the headers of the preloaded objects. With
+# SNAPSHOT_DIR, the index files are also memory-mapped. Snapshots that the
+# workers load later are then shared through the page cache as well.
+#
+# Each worker runs its own event loop, batcher, caches and metrics (GET
+# /metrics reports the worker that answered). A worker that dies is
+# replaced; SIGTERM or SIGINT stops all of them.
+
+RESTART_DELAY = 1.0
+
+
+def default_threads(workers):
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def bind(host, port, backlog=2048):
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class Supervisor:
+    def __init__(self, workers, target):
+        self.workers = workers
+        self.target = target
+        self.children = {}
+        self.stopping = False
+
+    def spawn(self, slot):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                signal.signal(signal.SIGINT, signal.SIG_DFL)
+                self.target(slot)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        self.children[pid] = (slot, time.monotonic())
+
+    def stop(self, signum=None, frame=None):
+        self.stopping = True
+        for pid in self.children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for slot in range(self.workers):
+            self.spawn(slot)
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            slot, started = self.children.pop(pid)
+            if self.stopping:
+                continue
+            print(f"Worker {slot} (pid {pid}) exited with status {os.waitstatus_to_exitcode(status)}; restarting.",
+                  file=sys.stderr)
+            # Do not spin when a worker fails right at startup
+            if time.monotonic() - started < RESTART_DELAY:
+                time.sleep(RESTART_DELAY)
+            if not self.stopping:
+                self.spawn(slot)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve faiss_server.py from pre-forked worker processes")
+    parser.add_argument("--host", default=os.getenv("HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("SERVE_WORKERS", "2")))
+    parser.add_argument("--torch-threads", type=int, default=int(os.getenv("TORCH_THREADS", "0")) or None,
+                        help="torch threads per worker (default: cores / workers)")
+    parser.add_argument("--faiss-threads", type=int, default=int(os.getenv("FAISS_THREADS", "0")) or None,
+                        help="FAISS OpenMP threads per worker (default: cores / workers)")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    # Read by faiss_server at import, which applies them in the parent
+    # before anything runs in parallel
+    os.environ["TORCH_THREADS"] = str(args.torch_threads or default_threads(args.workers))
+    os.environ["FAISS_THREADS"] = str(args.faiss_threads or default_threads(args.workers))
+    # HuggingFace tokenizers must not start their thread pool before the fork
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+    import uvicorn
+    start = time.perf_counter()
+    import faiss_server
+    print(f"Loaded snapshot {faiss_server.live.current.name} in {time.perf_counter() - start:.1f} s; "
+          f"forking {args.workers} workers.", file=sys.stderr)
+    sock = bind(args.host, args.port)
+
+    gc.collect()
+    gc.freeze()
+
+    def worker(slot):
+        faiss_server.apply_thread_limits()
+        config = uvicorn.Config(faiss_server.app, log_level=args.log_level)
+        uvicorn.Server(config).run(sockets=[sock])
+
+    Supervisor(args.workers, worker).run()
+    sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import os
+import json
+import heapq
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+import numpy as np
+import faiss
+import ann_index
+from metadata_store import MetadataStore, MetadataStoreWriter, RESULT_FIELDS
+
+# Document-partitioned FAISS index. The corpus is split into N shards by
+# document ID, either in contiguous ID ranges or by a hash of the ID, and
+# every shard has its own index and metadata segment:
+#
+#   <path>/manifest.json          shard count, scheme and range size
+#   <path>/<i>/faiss.index        index of shard i
+#   <path>/<i>/metadata/          MetadataStore segment of shard i
+#
+# A search runs on every shard at the same time (FAISS releases the GIL, so
+# threads are enough) and the per-shard top-k lists are merged with a heap.
+# Flat shards give exactly the results of one flat index. IVF, PQ and SQ
+# shards are clones of one trained index, so they share the coarse
+# centroids and probe the same lists the unsharded index would.
+
+SHARD_VERSION = 1
+SCHEMES = ('range', 'hash')
+MANIFEST = "manifest.json"
+# Distance FAISS reports for empty result slots with inner product
+EMPTY_DISTANCE = np.finfo('float32').min
+
+
+def _mix(ids):
+    # splitmix64 finalizer: consecutive IDs spread evenly over the shards
+    x = ids.astype('uint64')
+    with np.errstate(over='ignore'):
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _shard_path(path, shard):
+    return os.path.join(path, str(shard))
+
+
+class ShardRouter:
+    # Maps document IDs to shards. Range shards hold `range_size` consecutive
+    # IDs each; IDs past the last range (pages added by incremental updates)
+    # go to the last shard.
+
+    def __init__(self, shards, scheme='range', range_size=None):
+        if scheme not in SCHEMES:
+            raise ValueError(f"Unknown shard scheme '{scheme}', expected one of {SCHEMES}")
+        if shards < 1:
+            raise ValueError("At least one shard is needed")
+        if scheme == 'range' and not range_size:
+            raise ValueError("Range sharding needs the number of documents up front")
+        self.shards = shards
+        self.scheme = scheme
+        self.range_size = range_size
+
+    @classmethod
+    def for_documents(cls, shards, scheme, documents=None):
+        range_size = max(1, -(-documents // shards)) if scheme == 'range' and documents is not None else None
+        return cls(shards, scheme, range_size)
+
+    @classmethod
+    def load(cls, path):
+        with open(os.path.join(path, MANIFEST)) as f:
+            manifest = json.load(f)
+        if manifest["version"] != SHARD_VERSION:
+            raise ValueError(f"Unsupported shard layout version {manifest['version']} in {path}")
+        return cls(manifest["shards"], manifest["scheme"], manifest["range_size"])
+
+    def save(self, path):
+        with open(os.path.join(path, MANIFEST), "w") as f:
+            json.dump({"version": SHARD_VERSION, "shards": self.shards, "scheme": self.scheme,
+                       "range_size": self.range_size}, f, indent=2)
+
+    def shard_of(self, ids):
+        ids = np.asarray(ids, dtype='int64')
+        if self.scheme == 'range':
+            return np.minimum(ids // self.range_size, self.shards - 1)
+        return (_mix(ids) % np.uint64(self.shards)).astype('int64')
+
+    def split(self, ids):
+        # Positions in `ids` that belong to each shard
+        shard = self.shard_of(ids)
+        return [np.flatnonzero(shard == s) for s in range(self.shards)]
+
+
+def merge_results(parts, k):
+    # Per-shard (distances, indices), each (nq, k) and sorted best first, to
+    # the overall top k per query
+    nq = len(parts[0][0])
+    distances = np.full((nq, k), EMPTY_DISTANCE, dtype='float32')
+    indices = np.full((nq, k), -1, dtype='int64')
+    for q in range(nq):
+        hits = heapq.merge(*(zip(d[q], i[q]) for d, i in parts), key=lambda hit: hit[0], reverse=True)
+        for rank, (dist, idx) in enumerate(islice(hits, k)):
+            distances[q, rank] = dist
+            indices[q, rank] = idx
+    return distances, indices
+
+
+class ShardedIndex:
+    # Stands in for a single FAISS index in BertFaissVectorModel: d, ntotal,
+    # add_with_ids, remove_ids and search behave the same.
+
+    def __init__(self, router, shards, workers=None):
+        if len(shards) != router.shards:
+            raise ValueError(f"Expected {router.shards} shard indexes, got {len(shards)}")
+        self.router = router
+        self.shards = shards
+        self.d = shards[0].d
+        self.pool = ThreadPoolExecutor(max_workers=workers or len(shards), thread_name_prefix="shard-search")
+
+    @classmethod
+    def build(cls, config, d, router, train_vectors=None):
+        # Trained once; every shard starts as a copy of the empty trained index
+        index, trained = ann_index.build_index(config, d, train_vectors=train_vectors)
+        data = faiss.serialize_index(index)
+        shards = [index]
+        for _ in range(router.shards - 1):
+            shard = faiss.deserialize_index(data)
+            ann_index.apply_search_params(shard, config)
+            shards.append(shard)
+        return cls(router, shards), trained
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, MANIFEST))
+
+    @classmethod
+    def read(cls, path, workers=None, mmap=False):
+        router = ShardRouter.load(path)
+        shards = [ann_index.read_index(os.path.join(_shard_path(path, s), "faiss.index"), mmap)
+                  for s in range(router.shards)]
+        return cls(router, shards, workers)
+
+    def write(self, path):
+        for s, shard in enumerate(self.shards):
+            os.makedirs(_shard_path(path, s), exist_ok=True)
+            faiss.write_index(shard, os.path.join(_shard_path(path, s), "faiss.index"))
+        # Shards left over from an earlier layout with more shards
+        for name in os.listdir(path):
+            if name.isdigit() and int(name) >= len(self.shards):
+                shutil.rmtree(os.path.join(path, name))
+        self.router.save(path)
+
+    @property
+    def ntotal(self):
+        return sum(shard.ntotal for shard in self.shards)
+
+    def apply_search_params(self, config):
+        for shard in self.shards:
+            ann_index.apply_search_params(shard, config)
+
+    def add_with_ids(self, vectors, ids):
+        ids = np.asarray(ids, dtype='int64')
+        for shard, positions in zip(self.shards, self.router.split(ids)):
+            if len(positions):
+                shard.add_with_ids(np.ascontiguousarray(vectors[positions]), ids[positions])
+
+    def remove_ids(self, ids):
+        ids = np.asarray(ids, dtype='int64')
+        removed = 0
+        for shard, positions in zip(self.shards, self.router.split(ids)):
+            if len(positions):
+                removed += shard.remove_ids(ids[positions])
+        return removed
+
+    def search(self, queries, k, make_params=None):
+        # make_params returns the search parameters (e.g. an ID selector over
+        # global IDs) and is called once per shard: IndexIDMap swaps
+        # params.sel while it searches, so concurrent shards cannot share them
+        def search_shard(shard):
+            return shard.search(queries, k, params=make_params() if make_params else None)
+        parts = list(self.pool.map(search_shard, self.shards))
+        return merge_results(parts, k)
+
+    def close(self):
+        self.pool.shutdown(wait=False)
+
+
+class ShardedMetadataWriter:
+    def __init__(self, path, router, columns=None):
+        self.path = path
+        self.router = router
+        self.writers = [MetadataStoreWriter(os.path.join(_shard_path(path, s), "metadata"), columns)
+                        for s in range(router.shards)]
+
+    def append(self, doc_id, record):
+        self.writers[int(self.router.shard_of([doc_id])[0])].append(doc_id, record)
+
+    def close(self):
+        for writer in self.writers:
+            writer.close()
+        return ShardedMetadataStore(self.path, self.router)
+
+
+class ShardedMetadataStore:
+    # The MetadataStore interface over the per-shard segments
+
+    def __init__(self, path, router):
+        self.path = path
+        self.router = router
+        self.segments = [MetadataStore(os.path.join(_shard_path(path, s), "metadata")) for s in range(router.shards)]
+        self.columns = self.segments[0].columns
+
+    @classmethod
+    def write(cls, path, router, records, columns=None):
+        # records: iterable of (doc_id, dict) in increasing doc_id order
+        writer = ShardedMetadataWriter(path, router, columns)
+        for doc_id, record in records:
+            writer.append(doc_id, record)
+        return writer.close()
+
+    def __len__(self):
+        return sum(len(segment) for segment in self.segments)
+
+    def __contains__(self, doc_id):
+        return doc_id >= 0 and doc_id in self.segments[int(self.router.shard_of([doc_id])[0])]
+
+    def get(self, doc_id, fields=RESULT_FIELDS):
+        return self.get_many([doc_id], fields)[0]
+
+    def get_many(self, doc_ids, fields=RESULT_FIELDS):
+        doc_ids = np.asarray(doc_ids, dtype='int64')
+        records = [{} for _ in range(len(doc_ids))]
+        known = doc_ids >= 0
+        shard = self.router.shard_of(np.where(known, doc_ids, 0))
+        for s in np.unique(shard[known]):
+            positions = np.flatnonzero(known & (shard == s))
+            for pos, record in zip(positions, self.segments[s].get_many(doc_ids[positions], fields)):
+                records[pos] = record
+        return records
+
+    def iter_records(self, fields=None, raw=False):
+        # All segments, merged back into ID order
+        segments = (segment.iter_records(fields, raw) for segment in self.segments)
+        return heapq.merge(*segments, key=lambda item: item[0])
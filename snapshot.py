@@ -0,0 +1,240 @@
+import os
+import sys
+import json
+import uuid
+import shutil
+import fnmatch
+import argparse
+import threading
+from datetime import datetime
+import ann_index
+
+# Immutable, versioned index snapshots for the search service:
+#
+#   <root>/CURRENT                      name of the snapshot to serve
+#   <root>/<name>/manifest.json         components, file sizes and build info
+#   <root>/<name>/faiss/                vector index, metadata and vector store
+#   <root>/<name>/link_graph/           compiled link graph with PageRank/HITS scores
+#   <root>/<name>/tfidf/                TF-IDF vectorizer, postings and documents
+#
+# A build publishes a new snapshot next to the old ones and then points
+# CURRENT at it (write + rename, so readers never see a partial pointer).
+# Servers map the snapshot files read-only, so a snapshot is never modified
+# once published; rolling back is pointing CURRENT at an older name.
+#
+#   python snapshot.py publish snapshots --faiss faiss --link-graph link_graph --tfidf cache
+#   python snapshot.py list snapshots
+#   python snapshot.py activate snapshots 20261018T120000-1a2b3c
+#   python snapshot.py prune snapshots --keep 3
+
+SNAPSHOT_VERSION = 1
+CURRENT = "CURRENT"
+MANIFEST = "manifest.json"
+# Files of each component that belong in a snapshot (None = the whole directory)
+COMPONENT_FILES = {
+    "faiss": None,
+    "link_graph": None,
+    "tfidf": ("tfidf_*",),
+}
+# Build leftovers that are never copied
+IGNORED = ("*.tmp", "embed_job")
+
+
+def _ignore(top, patterns):
+    # shutil.copytree filter: build leftovers anywhere, and at the top level
+    # everything that does not match `patterns`
+    def ignore(directory, names):
+        skipped = {n for n in names if any(fnmatch.fnmatch(n, p) for p in IGNORED)}
+        if patterns is not None and directory == top:
+            skipped |= {n for n in names if not any(fnmatch.fnmatch(n, p) for p in patterns)}
+        return skipped
+    return ignore
+
+
+def _file_sizes(path):
+    sizes = {}
+    for directory, _, files in os.walk(path):
+        for name in files:
+            full = os.path.join(directory, name)
+            sizes[os.path.relpath(full, path)] = os.path.getsize(full)
+    return sizes
+
+
+def new_name():
+    # Sorts in creation order
+    return f"{datetime.now().strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+
+def publish(root, components, info=None, activate=True, keep=None):
+    # Copies the component directories ({name: path}) into a new snapshot
+    # and returns its name. Files are copied, not linked: the builders
+    # rewrite some of them in place.
+    unknown = set(components) - set(COMPONENT_FILES)
+    if unknown:
+        raise ValueError(f"Unknown snapshot components {sorted(unknown)}, expected {sorted(COMPONENT_FILES)}")
+    name = new_name()
+    os.makedirs(root, exist_ok=True)
+    tmp_path = os.path.join(root, f".{name}.tmp")
+    manifest = {"version": SNAPSHOT_VERSION, "name": name, "created": datetime.now().isoformat(timespec="seconds"),
+                "info": info or {}, "components": {}}
+    for component, source in components.items():
+        if not os.path.isdir(source):
+            raise FileNotFoundError(f"{component} directory {source} does not exist")
+        target = os.path.join(tmp_path, component)
+        shutil.copytree(source, target, ignore=_ignore(source, COMPONENT_FILES[component]))
+        manifest["components"][component] = _file_sizes(target)
+    with open(os.path.join(tmp_path, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.rename(tmp_path, os.path.join(root, name))
+
+    if activate:
+        set_current(root, name)
+    if keep is not None:
+        prune(root, keep)
+    return name
+
+
+def read_manifest(path):
+    with open(os.path.join(path, MANIFEST)) as f:
+        manifest = json.load(f)
+    if manifest["version"] != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version {manifest['version']} in {path}")
+    return manifest
+
+
+def verify(path):
+    # The manifest of a snapshot whose files are all present with the recorded sizes
+    manifest = read_manifest(path)
+    for component, sizes in manifest["components"].items():
+        for name, size in sizes.items():
+            full = os.path.join(path, component, name)
+            if not os.path.exists(full) or os.path.getsize(full) != size:
+                raise ValueError(f"Snapshot {path} is incomplete: {component}/{name}")
+    return manifest
+
+
+def list_snapshots(root):
+    if not os.path.isdir(root):
+        return []
+    # ".<name>.tmp" directories are snapshots still being published
+    return sorted(n for n in os.listdir(root)
+                  if not n.startswith(".") and os.path.exists(os.path.join(root, n, MANIFEST)))
+
+
+def current(root):
+    try:
+        with open(os.path.join(root, CURRENT)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def set_current(root, name):
+    verify(os.path.join(root, name))
+    tmp_path = os.path.join(root, CURRENT + ".tmp")
+    with open(tmp_path, "w") as f:
+        f.write(name + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(root, CURRENT))
+
+
+def prune(root, keep):
+    # Deletes all but the newest `keep` snapshots, never the current one.
+    # Servers still mapping a deleted snapshot keep working until they swap:
+    # unlinked files stay readable while they are mapped.
+    live = current(root)
+    names = list_snapshots(root)
+    removed = [n for n in names[:max(len(names) - keep, 0)] if n != live]
+    for name in removed:
+        shutil.rmtree(os.path.join(root, name))
+    return removed
+
+
+class LiveSnapshot:
+    # The snapshot a server is serving, swapped atomically. Requests
+    # acquire() the current one and release() it when done, so a swap never
+    # changes the snapshot under a running request. A replaced snapshot is
+    # handed back for closing once its last request has released it.
+
+    def __init__(self, loaded):
+        self.current = loaded
+        self.refs = {id(loaded): 0}
+        self.retired = {}
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            loaded = self.current
+            self.refs[id(loaded)] += 1
+            return loaded
+
+    def release(self, loaded):
+        # True when `loaded` was replaced and this was its last request
+        with self.lock:
+            key = id(loaded)
+            self.refs[key] -= 1
+            if key in self.retired and self.refs[key] == 0:
+                del self.retired[key], self.refs[key]
+                return True
+            return False
+
+    def swap(self, loaded):
+        # Makes `loaded` current; returns the old snapshot if nothing uses it
+        # any more, else None (the last release() returns True for it later)
+        with self.lock:
+            old, self.current = self.current, loaded
+            self.refs[id(loaded)] = 0
+            if self.refs[id(old)] == 0:
+                del self.refs[id(old)]
+                return old
+            self.retired[id(old)] = old
+            return None
+
+    def loaded(self):
+        # Snapshots currently held in memory (current + retired but in use)
+        with self.lock:
+            return 1 + len(self.retired)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage versioned index snapshots")
+    commands = parser.add_subparsers(dest="command", required=True)
+    publish_cmd = commands.add_parser("publish", help="snapshot the built index and make it current")
+    publish_cmd.add_argument("root")
+    publish_cmd.add_argument("--faiss", required=True, help="BertFaissVectorModel cache directory")
+    publish_cmd.add_argument("--link-graph", help="compiled link graph directory")
+    publish_cmd.add_argument("--tfidf", help="TF-IDF cache directory")
+    publish_cmd.add_argument("--no-activate", action="store_true", help="publish without updating CURRENT")
+    publish_cmd.add_argument("--keep", type=int, help="delete all but the newest N snapshots")
+    list_cmd = commands.add_parser("list")
+    list_cmd.add_argument("root")
+    activate_cmd = commands.add_parser("activate", help="point CURRENT at a snapshot (e.g. to roll back)")
+    activate_cmd.add_argument("root")
+    activate_cmd.add_argument("name")
+    prune_cmd = commands.add_parser("prune")
+    prune_cmd.add_argument("root")
+    prune_cmd.add_argument("--keep", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.command == "publish":
+        components = {"faiss": args.faiss, "link_graph": args.link_graph, "tfidf": args.tfidf}
+        name = publish(args.root, {k: v for k, v in components.items() if v},
+                       info={"index": ann_index.load_config(args.faiss)},
+                       activate=not args.no_activate, keep=args.keep)
+        print(name)
+    elif args.command == "list":
+        live = current(args.root)
+        for name in list_snapshots(args.root):
+            manifest = read_manifest(os.path.join(args.root, name))
+            marker = "*" if name == live else " "
+            print(f"{marker} {name}  {manifest['created']}  {json.dumps(manifest['info'])}")
+    elif args.command == "activate":
+        set_current(args.root, args.name)
+    else:
+        for name in prune(args.root, args.keep):
+            print(f"removed {name}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
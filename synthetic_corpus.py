@@ -0,0 +1,190 @@
+import os
+import sys
+import argparse
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+
+# Synthetic crawl CSVs in the schema of datasets/data*.csv, for benchmarks:
+#   python synthetic_corpus.py bench_data --pages 100000 --files 4
+#
+# Pages belong to sites (domains) and topics. Words are drawn from a
+# Zipfian vocabulary with a topic-specific head. Out-degrees are
+# heavy-tailed, and link targets are chosen by power-law popularity,
+# mostly within the same site, with a share of external, uncrawled URLs.
+# Some pages are re-crawled later, so the files contain duplicate URLs
+# like a real crawl. With mirror_rate, some pages also get a print view
+# (same page, different query string) and a copy on a mirror host with a
+# slightly different footer. The same seed always gives the same files.
+
+COLUMNS = ['url', 'title', 'meta_description', 'body_text', 'depth', 'last_crawled', 'out_links', 'anchor_texts']
+SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'ru', 'ta', 'vo', 'shi', 'an', 'el', 'or', 'ub', 'tri', 'sen', 'dar', 'gul']
+START_TIME = datetime(2024, 1, 1)
+CHUNK_SIZE = 10000
+
+
+def make_vocabulary(size, rng):
+    words = set()
+    while len(words) < size:
+        n = rng.integers(2, 5)
+        words.add(''.join(rng.choice(SYLLABLES, size=n)))
+    return np.array(sorted(words))
+
+
+def _cdf(weights):
+    cdf = np.cumsum(weights, dtype='float64')
+    return cdf / cdf[-1]
+
+
+def _sample(cdf, rng, n):
+    # Weighted draws with replacement from a precomputed CDF
+    return np.minimum(np.searchsorted(cdf, rng.random(n), side='right'), len(cdf) - 1)
+
+
+class CorpusGenerator:
+    def __init__(self, pages, sites=50, topics=20, vocab_size=20000, recrawl_rate=0.05,
+                 external_rate=0.1, same_site_rate=0.8, mean_out_degree=12, mirror_rate=0.0, seed=0):
+        self.pages = pages
+        self.sites = max(1, min(sites, pages))
+        self.recrawl_rate = recrawl_rate
+        self.mirror_rate = mirror_rate
+        self.external_rate = external_rate
+        self.same_site_rate = same_site_rate
+        self.mean_out_degree = mean_out_degree
+        self.seed = seed
+
+        rng = np.random.default_rng(seed)
+        self.vocab = make_vocabulary(vocab_size, rng)
+        # Global Zipf weights, and a reshuffled head of 200 words per topic
+        self.word_cdf = _cdf(1.0 / np.arange(1, vocab_size + 1))
+        self.topic_words = [rng.choice(vocab_size, size=200, replace=False) for _ in range(topics)]
+        self.page_site = rng.integers(0, self.sites, size=pages)
+        self.page_topic = rng.integers(0, topics, size=pages)
+        # Popularity of each page as a link target (power law)
+        self.popularity = rng.pareto(1.2, size=pages) + 1
+        self.site_pages = [np.flatnonzero(self.page_site == s) for s in range(self.sites)]
+        self.site_cdf = [_cdf(self.popularity[p]) for p in self.site_pages]
+        self.global_cdf = _cdf(self.popularity)
+
+    def url(self, page):
+        site = self.page_site[page]
+        return f"https://site{site}.example.com/topic{self.page_topic[page]}/page-{page}"
+
+    def _words(self, rng, topic, n):
+        # Half topic vocabulary, half the global Zipf distribution
+        from_topic = rng.random(n) < 0.5
+        words = _sample(self.word_cdf, rng, n)
+        head = self.topic_words[topic]
+        words[from_topic] = head[rng.integers(0, len(head), size=from_topic.sum())]
+        return ' '.join(self.vocab[words])
+
+    def _links(self, rng, page):
+        degree = min(int(rng.lognormal(np.log(self.mean_out_degree), 0.8)), 200)
+        site = self.page_site[page]
+        rolls = rng.random(degree)
+        same_site = self.site_pages[site][_sample(self.site_cdf[site], rng, degree)]
+        anywhere = _sample(self.global_cdf, rng, degree)
+        targets = []
+        for roll, local, remote in zip(rolls, same_site, anywhere):
+            if roll < self.external_rate:
+                targets.append(f"https://external{rng.integers(0, 1000)}.example.org/{rng.integers(0, 100000)}")
+                continue
+            target = local if roll < self.external_rate + self.same_site_rate else remote
+            if target != page:
+                targets.append(self.url(target))
+        return targets
+
+    def rows(self, first, last, rng):
+        records = []
+        for page in range(first, last):
+            topic = self.page_topic[page]
+            links = self._links(rng, page)
+            roll = rng.random()
+            if roll < 0.15:
+                description = 'No Description'
+            elif roll < 0.2:
+                description = ''
+            else:
+                description = self._words(rng, topic, int(rng.integers(10, 25)))
+            body_length = int(min(rng.lognormal(np.log(250), 0.7), 3000))
+            crawled = START_TIME + timedelta(seconds=int(page * 3 + rng.integers(0, 3)))
+            records.append({
+                'url': self.url(page),
+                'title': self._words(rng, topic, int(rng.integers(3, 9))).title(),
+                'meta_description': description,
+                'body_text': self._words(rng, topic, max(body_length, 5)),
+                'depth': int(min(rng.geometric(0.4) - 1, 6)),
+                'last_crawled': str(crawled),
+                'out_links': repr(links),
+                'anchor_texts': repr([self._words(rng, topic, int(rng.integers(1, 4))) for _ in links[:10]]),
+            })
+        return records
+
+    def _recrawls(self, records, rng):
+        # Later re-crawls of some pages: same URL, updated text, later timestamp
+        again = []
+        for record in records:
+            if rng.random() < self.recrawl_rate:
+                again.append({
+                    **record,
+                    'body_text': record['body_text'] + ' ' + self._words(rng, 0, 20),
+                    'last_crawled': str(datetime.fromisoformat(record['last_crawled']) + timedelta(days=7)),
+                })
+        return again
+
+    def _mirrors(self, records, rng):
+        # Print views and mirror-host copies of some pages (near-duplicates)
+        copies = []
+        for record in records:
+            if rng.random() < self.mirror_rate:
+                copies.append({**record, 'url': record['url'] + '?view=print', 'out_links': '[]', 'anchor_texts': '[]'})
+                copies.append({
+                    **record,
+                    'url': record['url'].replace('.example.com/', '-mirror.example.net/'),
+                    'body_text': record['body_text'] + ' ' + self._words(rng, 0, 3),
+                })
+        return copies
+
+    def write(self, out_dir, files=1, chunk_size=CHUNK_SIZE):
+        os.makedirs(out_dir, exist_ok=True)
+        bounds = np.linspace(0, self.pages, files + 1).astype(int)
+        paths = []
+        for i in range(files):
+            path = os.path.join(out_dir, f"data{i + 1}.csv")
+            header = True
+            for first in range(bounds[i], bounds[i + 1], chunk_size):
+                last = min(first + chunk_size, bounds[i + 1])
+                # One generator per chunk keeps the output independent of file boundaries
+                rng = np.random.default_rng([self.seed, first])
+                records = self.rows(first, last, rng)
+                records += self._recrawls(records, rng)
+                if self.mirror_rate:
+                    records += self._mirrors(records, rng)
+                pd.DataFrame(records, columns=COLUMNS).to_csv(
+                    path, index=False, escapechar='\\', mode='w' if header else 'a', header=header)
+                header = False
+            paths.append(path)
+        return paths
+
+    def queries(self, n, seed=None):
+        rng = np.random.default_rng(self.seed if seed is None else seed)
+        topics = rng.integers(0, len(self.topic_words), size=n)
+        return [self._words(rng, topic, int(rng.integers(2, 5))) for topic in topics]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic crawl CSVs")
+    parser.add_argument("out_dir")
+    parser.add_argument("--pages", type=int, default=10000)
+    parser.add_argument("--files", type=int, default=1)
+    parser.add_argument("--sites", type=int, default=50)
+    parser.add_argument("--mirror-rate", type=float, default=0.0, help="share of pages with near-duplicate copies")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    paths = CorpusGenerator(args.pages, sites=args.sites, mirror_rate=args.mirror_rate,
+                            seed=args.seed).write(args.out_dir, args.files)
+    print('\n'.join(paths), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
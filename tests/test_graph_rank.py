@@ -0,0 +1,42 @@
+import networkx as nx
+import numpy as np
+import graph_rank
+
+
+def _csr(graph):
+    links = nx.to_scipy_sparse_array(graph, nodelist=range(len(graph)), format='csr')
+    return links.indptr, links.indices
+
+
+def _nx_hits(graph):
+    hubs, authorities = nx.hits(graph)
+    return (np.array([hubs[i] for i in range(len(graph))]),
+            np.array([authorities[i] for i in range(len(graph))]))
+
+
+def test_hits_matches_networkx():
+    graph = nx.gnp_random_graph(500, 0.01, seed=3, directed=True)
+    hubs, authorities = graph_rank.hits(*_csr(graph))
+    nx_hubs, nx_authorities = _nx_hits(graph)
+    np.testing.assert_allclose(hubs, nx_hubs, atol=1e-8)
+    np.testing.assert_allclose(authorities, nx_authorities, atol=1e-8)
+
+
+def test_hits_matches_networkx_with_nearly_tied_singular_values():
+    # Two copies of one site, one with an extra link: the top two singular
+    # values almost tie and power iteration alone does not converge
+    site = nx.gnp_random_graph(500, 0.01, seed=1, directed=True)
+    graph = nx.disjoint_union(site, site)
+    graph.add_edge(*next((u, v) for u in range(500, 1000) for v in range(500, 1000)
+                         if u != v and not graph.has_edge(u, v)))
+    hubs, authorities = graph_rank.hits(*_csr(graph))
+    nx_hubs, nx_authorities = _nx_hits(graph)
+    np.testing.assert_allclose(hubs, nx_hubs, atol=1e-8)
+    np.testing.assert_allclose(authorities, nx_authorities, atol=1e-8)
+
+
+def test_pagerank_matches_networkx():
+    graph = nx.gnp_random_graph(500, 0.01, seed=2, directed=True)
+    scores = graph_rank.pagerank(*_csr(graph))
+    expected = nx.pagerank(graph)
+    np.testing.assert_allclose(scores, [expected[i] for i in range(len(graph))], atol=1e-6)
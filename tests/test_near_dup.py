@@ -0,0 +1,42 @@
+import numpy as np
+import near_dup
+
+
+def _signatures(seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.integers(1, 2**16, size=(3, near_dup.NUM_PERM), dtype='uint16')
+
+
+def test_duplicates_sharing_a_bucket_with_a_third_page_are_paired():
+    # A, B and C share band 0 only. B and C differ in one value per other
+    # band (similarity ~0.88); A differs from both everywhere else. The
+    # A-B and A-C pairs fail the threshold, so B-C must be compared too.
+    rows = near_dup.NUM_PERM // near_dup.BANDS
+    signatures = _signatures()
+    signatures[1] = signatures[0]
+    signatures[1, rows:] ^= 0x5555
+    signatures[2] = signatures[1]
+    signatures[2, rows::rows] ^= 0x0F0F
+    assert near_dup.similarity(signatures, [1], [2])[0] >= near_dup.THRESHOLD
+    assert near_dup.similarity(signatures, [0], [1])[0] < near_dup.THRESHOLD
+
+    labels, best = near_dup.lsh_clusters(signatures)
+    assert labels[1] == labels[2] != labels[0]
+    assert best[0] == 0 and best[1] >= near_dup.THRESHOLD
+
+
+def test_large_buckets_pair_neighbours():
+    signatures = np.repeat(_signatures()[:1], near_dup.BUCKET_PAIRS_MAX + 5, axis=0)
+    left, right = near_dup.lsh_pairs(signatures)
+    labels, _ = near_dup.lsh_clusters(signatures)
+    assert len(left) < len(signatures) * (len(signatures) - 1) // 2
+    assert len(set(labels)) == 1
+
+
+def test_signatures_of_near_copies():
+    hasher = near_dup.MinHasher()
+    text = " ".join(f"word{i}" for i in range(400))
+    signatures = hasher.signatures([text, text.replace("word200", "other"), "unrelated page text " * 50, ""])
+    labels, _ = near_dup.lsh_clusters(signatures)
+    assert labels[0] == labels[1]
+    assert len({labels[0], labels[2], labels[3]}) == 3
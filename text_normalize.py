@@ -0,0 +1,86 @@
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+import pandas as pd
+
+# Text normalization for ingestion (ingest.py). Output is identical to the
+# original per-row functions; lemmas are memoized per token and large inputs
+# are split across processes.
+
+LEMMA_CACHE_SIZE = 1_000_000
+CHUNK_SIZE = 5000
+
+NON_ALPHA = re.compile(r'[^a-z\s]')
+
+stop_words = None
+_lemmatize = None
+
+def _load_text_tools():
+    global stop_words, _lemmatize
+    import nltk
+    from nltk.corpus import stopwords
+    from nltk.stem import WordNetLemmatizer
+
+    # Download NLTK resources (only when missing)
+    for resource, package in (('corpora/stopwords', 'stopwords'),
+                              ('corpora/wordnet', 'wordnet'),
+                              ('corpora/omw-1.4', 'omw-1.4')):
+        try:
+            nltk.data.find(resource)
+        except LookupError:
+            nltk.download(package)
+    stop_words = set(stopwords.words('english'))
+    # Bounded token -> lemma memo; a crawl has far fewer distinct tokens than occurrences
+    _lemmatize = lru_cache(maxsize=LEMMA_CACHE_SIZE)(WordNetLemmatizer().lemmatize)
+
+def clean_text(text):
+    if pd.isna(text):
+        return ""
+    if _lemmatize is None:
+        _load_text_tools()
+    text = text.lower()
+    text = NON_ALPHA.sub('', text)
+    words = text.split()
+    words = [_lemmatize(w) for w in words if w not in stop_words]
+    return ' '.join(words)
+
+def _clean_chunk(texts):
+    return [clean_text(text) for text in texts]
+
+def clean_texts(texts, workers=None, chunk_size=CHUNK_SIZE):
+    # clean_text over a sequence, in parallel chunks when there is enough work
+    texts = list(texts)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(texts) <= chunk_size:
+        return _clean_chunk(texts)
+    chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_load_text_tools) as pool:
+        return [text for chunk in pool.map(_clean_chunk, chunks) for text in chunk]
+
+def resolve_description(row):
+    desc = row['meta_description']
+    if (
+        pd.isna(desc) or
+        not desc or
+        desc.strip().lower() == 'no description' or
+        re.match(r'^https?://', str(desc).strip())
+    ):
+        tokens = row['body_text'].split()
+        return ' '.join(tokens[:30])
+    return desc
+
+def resolve_descriptions(df):
+    # Vectorized resolve_description over a whole frame
+    desc = df['meta_description']
+    text = desc.where(desc.notna(), '').astype(str)
+    stripped = text.str.strip()
+    fallback = (
+        desc.isna() |
+        (text == '') |
+        (stripped.str.lower() == 'no description') |
+        stripped.str.match(r'https?://')
+    )
+    resolved = desc.astype(object).copy()
+    resolved[fallback] = df.loc[fallback, 'body_text'].str.split().str[:30].str.join(' ')
+    return resolved
@@ -2,57 +2,132 @@ import os
 import pandas as pd
 import numpy as np
 import pickle
+import scipy.sparse as sp
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from metadata_store import MetadataStore
 
 class TfidfSearchEngine:
     def __init__(self, data_path, cache_dir="cache"):
         self.data_path = data_path
         self.cache_dir = cache_dir
-        self.df = pd.read_csv(data_path)
+        self._df = None
         self.vectorizer = None
-        self.tfidf_matrix = None
-        self.indexed_df = pd.DataFrame()
+        # Term-major CSR: row t holds the posting list of term t (doc ids sorted)
+        self.postings = None
+        # Largest weight in each posting list, the per-term score upper bound
+        self.term_max = None
+        self.docs = None
         os.makedirs(cache_dir, exist_ok=True)
+
+        self.vectorizer_path = os.path.join(cache_dir, "tfidf_vectorizer.pkl")
+        self.postings_path = os.path.join(cache_dir, "tfidf_postings.npz")
+        self.term_max_path = os.path.join(cache_dir, "tfidf_term_max.npy")
+        self.docs_path = os.path.join(cache_dir, "tfidf_docs")
         self._load_cache()
 
+    @property
+    def df(self):
+        # Only needed to build the index; searching uses the cached postings
+        if self._df is None:
+            self._df = pd.read_csv(self.data_path)
+        return self._df
+
     def _load_cache(self):
-        try:
-            self.vectorizer = pickle.load(open(f"{self.cache_dir}/tfidf_vectorizer.pkl", "rb"))
-            self.tfidf_matrix = np.load(f"{self.cache_dir}/tfidf_matrix.npy")
-            self.indexed_df = pd.read_csv(f"{self.cache_dir}/indexed_df.csv")
-        except:
-            pass
+        paths = (self.vectorizer_path, self.postings_path, self.term_max_path)
+        if not all(os.path.exists(p) for p in paths) or not MetadataStore.exists(self.docs_path):
+            return
+        with open(self.vectorizer_path, "rb") as f:
+            self.vectorizer = pickle.load(f)
+        self.postings = sp.load_npz(self.postings_path).tocsr()
+        self.term_max = np.load(self.term_max_path)
+        self.docs = MetadataStore(self.docs_path)
+
+    def reload(self):
+        self.vectorizer = self.postings = self.term_max = self.docs = None
+        self._load_cache()
 
     def _save_cache(self):
-        pickle.dump(self.vectorizer, open(f"{self.cache_dir}/tfidf_vectorizer.pkl", "wb"))
-        np.save(f"{self.cache_dir}/tfidf_matrix.npy", self.tfidf_matrix)
-        self.indexed_df.to_csv(f"{self.cache_dir}/indexed_df.csv", index=False)
+        with open(self.vectorizer_path, "wb") as f:
+            pickle.dump(self.vectorizer, f)
+        sp.save_npz(self.postings_path, self.postings)
+        np.save(self.term_max_path, self.term_max)
 
     def preprocess_and_index(self):
-        self.df['full_text'] = self.df[['title', 'meta_description', 'body_text']].fillna('').agg(' '.join, axis=1)
+        df = self.df
+        df['full_text'] = df[['title', 'meta_description', 'body_text']].fillna('').agg(' '.join, axis=1)
         self.vectorizer = TfidfVectorizer(stop_words='english', max_features=10000)
-        self.tfidf_matrix = self.vectorizer.fit_transform(self.df['full_text'])
-        self.indexed_df = self.df.copy()
+        # Rows are L2-normalized by the vectorizer, so cosine similarity is a plain dot product
+        doc_term = self.vectorizer.fit_transform(df['full_text'])
+
+        self.postings = doc_term.T.tocsr()
+        self.postings.sort_indices()
+        self.term_max = np.zeros(self.postings.shape[0])
+        nonempty = np.diff(self.postings.indptr) > 0
+        self.term_max[nonempty] = np.maximum.reduceat(self.postings.data, self.postings.indptr[:-1][nonempty])
+
+        def resolve_description(row):
+            if pd.isna(row['meta_description']) or not row['meta_description'] or row['meta_description'] == 'No Description':
+                return ' '.join(str(row['body_text']).split()[:30])
+            return row['meta_description']
+
+        records = (
+            (doc_id, {'url': row['url'], 'title': row['title'], 'meta_description': resolve_description(row)})
+            for doc_id, (_, row) in enumerate(df.iterrows())
+        )
+        columns = {'url': 'str', 'title': 'str', 'meta_description': 'str'}
+        self.docs = MetadataStore.write(self.docs_path, records, columns)
         self._save_cache()
 
+    def _score(self, terms, weights, top_k):
+        # Term-at-a-time MaxScore: process query terms by decreasing upper bound.
+        # Once the k-th best partial score beats the bound of all remaining terms,
+        # no unseen document can reach the top-k, so later posting lists only
+        # update existing candidates and hopeless candidates are dropped.
+        upper = weights * self.term_max[terms]
+        order = np.argsort(-upper)
+        terms, weights, upper = terms[order], weights[order], upper[order]
+        rest = np.append(np.cumsum(upper[::-1])[::-1], 0.0)
+
+        indptr, indices, data = self.postings.indptr, self.postings.indices, self.postings.data
+        cand = np.empty(0, dtype=indices.dtype)
+        acc = np.empty(0)
+        open_set = True
+        for i, (term, weight) in enumerate(zip(terms, weights)):
+            ids = indices[indptr[term]:indptr[term + 1]]
+            contrib = data[indptr[term]:indptr[term + 1]] * weight
+
+            if open_set and len(cand) >= top_k:
+                threshold = np.partition(acc, -top_k)[-top_k]
+                if threshold >= rest[i]:
+                    open_set = False
+                    keep = acc + rest[i] >= threshold
+                    cand, acc = cand[keep], acc[keep]
+
+            if open_set:
+                cand, inverse = np.unique(np.concatenate([cand, ids]), return_inverse=True)
+                acc = np.bincount(inverse, weights=np.concatenate([acc, contrib]), minlength=len(cand))
+            elif len(ids) and len(cand):
+                pos = np.minimum(np.searchsorted(ids, cand), len(ids) - 1)
+                match = ids[pos] == cand
+                acc[match] += contrib[pos[match]]
+
+        if len(cand) > top_k:
+            top = np.argpartition(-acc, top_k - 1)[:top_k]
+            cand, acc = cand[top], acc[top]
+        order = np.argsort(-acc, kind='stable')
+        return cand[order], acc[order]
+
     def search(self, query, top_k=10):
-        if self.tfidf_matrix is None or self.indexed_df.empty or self.vectorizer is None:
+        if self.postings is None or self.docs is None or self.vectorizer is None:
             print("No index available. Run preprocess_and_index() first.")
             return []
 
         query_vec = self.vectorizer.transform([query])
-        similarities = cosine_similarity(query_vec, self.tfidf_matrix).flatten()
-
-        top_indices = similarities.argsort()[::-1][:top_k]
-        results = self.indexed_df.iloc[top_indices].copy()
-        results['score'] = similarities[top_indices]
-
-        def resolve_description(row):
-            if pd.isna(row['meta_description']) or not row['meta_description'] or row['meta_description'] == 'No Description':
-                return ' '.join(row['body_text'].split()[:30])
-            return row['meta_description']
-
-        results['meta_description'] = results.apply(resolve_description, axis=1)
+        if query_vec.nnz == 0:
+            return []
+        doc_ids, scores = self._score(query_vec.indices, query_vec.data, top_k)
 
-        return results[['url', 'title', 'meta_description', 'score']].to_dict(orient='records')
\ No newline at end of file
+        results = self.docs.get_many(doc_ids)
+        for result, score in zip(results, scores):
+            result['score'] = float(score)
+        return results
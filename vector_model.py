@@ -99,84 +99,499 @@ import pandas as pd
 import numpy as np
 import faiss
 import pickle
+import shutil
 from urllib.parse import urlparse
-from sentence_transformers import SentenceTransformer
 import hashlib
+import ann_index
+import id_filters
+from encoders import load_encoder
+from embed_job import EmbeddingJob
+from metadata_store import MetadataStore, MetadataStoreWriter, RESULT_FIELDS, merge_records
+from vector_store import VectorStore, VectorStoreWriter, rerank
+from sharded_index import ShardRouter, ShardedIndex, ShardedMetadataStore, ShardedMetadataWriter
+
+ADD_BLOCK_SIZE = 65536
 
 class BertFaissVectorModel:
-    def __init__(self, data_path, cache_dir, model_name='all-MiniLM-L6-v2'):
+    def __init__(self, data_path, cache_dir, model_name='all-MiniLM-L6-v2', index_type=None, index_params=None,
+                 embed_workers=None, shards=None, shard_by=None, encoder=None, mmap=False):
         self.data_path = data_path
         self.cache_dir = cache_dir
-        self.df = pd.read_csv(data_path)
+        self._df = None
         os.makedirs(cache_dir, exist_ok=True)
 
-        self.model = SentenceTransformer(model_name)
+        self.model_name = model_name
+        # A loaded encoder can be shared, e.g. by the models of two index snapshots
+        self.model = encoder if encoder is not None else load_encoder(model_name)
+        # Memory-mapped, read-only index (serving a published snapshot)
+        self.mmap = mmap
+        # Encoder processes used by full rebuilds (1 = encode in this process)
+        self.embed_workers = embed_workers or int(os.getenv("EMBED_WORKERS", "1"))
+        # Index shards searched in parallel, split by doc ID 'range' or 'hash'
+        # (None keeps the layout the cache was built with)
+        self.shards = shards or int(os.getenv("INDEX_SHARDS", "0")) or None
+        self.shard_by = shard_by or os.getenv("INDEX_SHARD_BY", "range")
         self.index = None
-        self.id_to_metadata = {}
+        self.metadata = None
+        # Full-precision vectors for exact rerank, kept for compressed index types
+        self.vectors = None
+        # Optional query_cache.EmbeddingCache shared by every search entry point
+        self.embedding_cache = None
+        # Attribute filters (id_filters.FilterIndex) and the largest filtered
+        # subset that is scanned exactly instead of searched through the index
+        self.filters = None
+        self.exact_scan_max = id_filters.EXACT_SCAN_MAX
+        # url -> (doc_id, content hash) of everything currently in the index
+        self.doc_hashes = {}
 
         self.index_path = os.path.join(cache_dir, "faiss.index")
-        self.meta_path = os.path.join(cache_dir, "metadata.pkl")
+        self.meta_path = os.path.join(cache_dir, "metadata")
+        self.legacy_meta_path = os.path.join(cache_dir, "metadata.pkl")
+        self.hash_path = os.path.join(cache_dir, "doc_hashes.pkl")
+        self.embed_job_path = os.path.join(cache_dir, "embed_job")
+        self.vectors_path = os.path.join(cache_dir, "vectors")
+        self.shards_path = os.path.join(cache_dir, "shards")
+        self.filters_path = os.path.join(cache_dir, "filters")
+
+        # index_type=None keeps whatever the cache was built with (flat by default)
+        self.index_config = ann_index.resolve_config(index_type, index_params) if index_type else None
+        self.built_config = None
+        # State of a chunked rebuild between start_bulk_index() and finish_bulk_index()
+        self._bulk = None
+        # State of a chunked update between start_update() and finish_update()
+        self._delta = None
 
         self._load_index()
 
+    @property
+    def df(self):
+        # The corpus CSV is only needed to (re)build the index, not to serve queries
+        if self._df is None:
+            self._df = pd.read_csv(self.data_path)
+        return self._df
+
     def _load_index(self):
-        if os.path.exists(self.index_path) and os.path.exists(self.meta_path):
+        has_metadata = MetadataStore.exists(self.meta_path) or os.path.exists(self.legacy_meta_path)
+        if ShardedIndex.exists(self.shards_path):
+            print("Loading sharded FAISS index and metadata...")
+            self.index = ShardedIndex.read(self.shards_path, mmap=self.mmap)
+            self.metadata = ShardedMetadataStore(self.shards_path, self.index.router)
+        elif os.path.exists(self.index_path) and has_metadata:
             print("Loading FAISS index and metadata...")
-            self.index = faiss.read_index(self.index_path)
-            with open(self.meta_path, "rb") as f:
-                self.id_to_metadata = pickle.load(f)
-
-    def _save_index(self):
-        faiss.write_index(self.index, self.index_path)
-        with open(self.meta_path, "wb") as f:
-            pickle.dump(self.id_to_metadata, f)
+            self.index = ann_index.read_index(self.index_path, self.mmap)
+            if not MetadataStore.exists(self.meta_path):
+                self._convert_legacy_metadata()
+            self.metadata = MetadataStore(self.meta_path)
+        if self.index is not None:
+            # Content hashes are only needed to update the index, which a
+            # memory-mapped (read-only) model never does
+            if os.path.exists(self.hash_path) and not self.mmap:
+                with open(self.hash_path, "rb") as f:
+                    self.doc_hashes = pickle.load(f)
+            self.built_config = ann_index.load_config(self.cache_dir) or ann_index.resolve_config('flat')
+            if ann_index.keeps_full_vectors(self.built_config) and VectorStore.exists(self.vectors_path):
+                self.vectors = VectorStore(self.vectors_path)
+            if id_filters.FilterIndex.exists(self.filters_path):
+                self.filters = id_filters.FilterIndex(self.filters_path)
+            if self.index_config is None:
+                self.index_config = self.built_config
+            if not ann_index.needs_rebuild(self.built_config, self.index_config):
+                self._apply_search_params()
+        if self.index_config is None:
+            self.index_config = ann_index.resolve_config('flat')
+        if self.shards is None:
+            sharded = isinstance(self.index, ShardedIndex)
+            self.shards = self.index.router.shards if sharded else 1
+            self.shard_by = self.index.router.scheme if sharded else self.shard_by
+
+    def _apply_search_params(self):
+        if isinstance(self.index, ShardedIndex):
+            self.index.apply_search_params(self.index_config)
+        else:
+            ann_index.apply_search_params(self.index, self.index_config)
+
+    def _shard_layout(self):
+        # (shards, scheme) of the built index, or None when it is a single index
+        if isinstance(self.index, ShardedIndex):
+            return self.index.router.shards, self.index.router.scheme
+        return None
+
+    def _new_router(self, documents=None):
+        if self.shards <= 1:
+            return None
+        return ShardRouter.for_documents(self.shards, self.shard_by, documents)
+
+    def _new_index(self, d, train_vectors, router):
+        if router is None:
+            return ann_index.build_index(self.index_config, d, train_vectors=train_vectors)
+        return ShardedIndex.build(self.index_config, d, router, train_vectors=train_vectors)
+
+    def _convert_legacy_metadata(self):
+        print("Converting metadata.pkl to the columnar metadata store...")
+        with open(self.legacy_meta_path, "rb") as f:
+            id_to_metadata = pickle.load(f)
+        MetadataStore.write(self.meta_path, sorted((int(i), m) for i, m in id_to_metadata.items()))
+        os.remove(self.legacy_meta_path)
+
+    def _check_writable(self):
+        if self.mmap:
+            raise ValueError(f"The index in {self.cache_dir} is memory-mapped read-only and cannot be rebuilt")
+
+    def _save_index(self, trained=None, records=None):
+        sharded = isinstance(self.index, ShardedIndex)
+        if sharded:
+            os.makedirs(self.shards_path, exist_ok=True)
+            self.index.write(self.shards_path)
+        else:
+            faiss.write_index(self.index, self.index_path)
+        if trained is None:
+            trained = (self.built_config or {}).get('trained', {})
+        ann_index.save_config(self.cache_dir, self.index_config, trained)
+        self.built_config = {**self.index_config, 'trained': trained}
+        if records is not None:
+            if sharded:
+                self.metadata = ShardedMetadataStore.write(self.shards_path, self.index.router, records)
+            else:
+                self.metadata = MetadataStore.write(self.meta_path, records)
+        # Only one layout is kept: drop the files of the other one
+        for path in ([self.index_path, self.meta_path] if sharded else [self.shards_path]):
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            elif os.path.exists(path):
+                os.remove(path)
+        with open(self.hash_path, "wb") as f:
+            pickle.dump(self.doc_hashes, f)
 
     def _text_hash(self, url, full_text):
         return hashlib.md5(f"{url}::{full_text}".encode('utf-8')).hexdigest()
 
-    def preprocess_and_index(self):
-        self.df['full_text'] = self.df[['title', 'meta_description', 'body_text']].fillna('').agg(' '.join, axis=1)
-
-        texts = self.df['full_text'].tolist()
+    def _can_update_incrementally(self):
+        # Indexes built before doc IDs were introduced are plain IndexFlatIP
+        # and have no hash table, so they can only be rebuilt from scratch.
+        if self.index is None or not self.doc_hashes:
+            return False
+        if ann_index.needs_rebuild(self.built_config, self.index_config):
+            return False
+        wanted = (self.shards, self.shard_by) if self.shards > 1 else None
+        if self._shard_layout() != wanted:
+            return False
+        return self.built_config['index_type'] != 'flat' or isinstance(self.index, (faiss.IndexIDMap2, ShardedIndex))
+
+    def _encode(self, texts):
         embeddings = self.model.encode(texts, convert_to_numpy=True, show_progress_bar=True)
-
-        d = embeddings.shape[1]  
-        self.index = faiss.IndexFlatIP(d)  
-
+        embeddings = np.ascontiguousarray(embeddings, dtype='float32')
         faiss.normalize_L2(embeddings)
-        self.index.add(embeddings)
-
-        for idx, row in self.df.iterrows():
-            self.id_to_metadata[idx] = {
-                "url": row['url'],
-                "title": row['title'],
-                "meta_description": row['meta_description'],
-                "body_text": row['body_text'],
-                "depth": row['depth'],
-                "last_crawled": row['last_crawled']
-            }
-
-        self._save_index()
-        print(f"✅ Indexed {len(texts)} documents.")
+        return embeddings
+
+    def _row_metadata(self, row):
+        return {
+            "url": row['url'],
+            "title": row['title'],
+            "meta_description": row['meta_description'],
+            "body_text": row['body_text'],
+            "depth": row['depth'],
+            "last_crawled": row['last_crawled']
+        }
+
+    @staticmethod
+    def _full_text(df):
+        return df[['title', 'meta_description', 'body_text']].fillna('').agg(' '.join, axis=1)
+
+    def preprocess_and_index(self, incremental=True):
+        self._check_writable()
+        df = self.df.drop_duplicates(subset='url', keep='first').reset_index(drop=True)
+        df['full_text'] = self._full_text(df)
+        hashes = [self._text_hash(url, text) for url, text in zip(df['url'], df['full_text'])]
+
+        if incremental and self._can_update_incrementally():
+            self._update_index(df, hashes)
+        else:
+            self._rebuild_index(df, hashes)
+
+    def _rebuild_index(self, df, hashes):
+        texts = df['full_text'].tolist()
+        # Checkpointed into a memmap: an interrupted rebuild resumes where it stopped
+        job = EmbeddingJob(self.embed_job_path, self.model_name, self.model.get_sentence_embedding_dimension())
+        embeddings = job.run(texts, workers=self.embed_workers, encoder=self.model)
+        ids = np.arange(len(df), dtype='int64')
+
+        d = embeddings.shape[1]
+        self.index, trained = self._new_index(d, embeddings, self._new_router(len(ids)))
+        # Add straight from the memmap, one block of pages at a time
+        for start in range(0, len(ids), ADD_BLOCK_SIZE):
+            self.index.add_with_ids(embeddings[start:start + ADD_BLOCK_SIZE], ids[start:start + ADD_BLOCK_SIZE])
+        self._save_vectors(ids, embeddings)
+
+        self.doc_hashes = {url: (int(doc_id), doc_hash) for doc_id, url, doc_hash in zip(ids, df['url'], hashes)}
+        records = ((int(doc_id), self._row_metadata(row)) for doc_id, (_, row) in zip(ids, df.iterrows()))
+
+        self._save_index(trained, records)
+        self.filters = id_filters.FilterIndex.build(self.filters_path, ids, df['url'], df['depth'], df['last_crawled'])
+        job.cleanup()
+        print(f"✅ Indexed {len(texts)} documents ({ann_index.describe(self.index_config)}).")
+
+    def _save_vectors(self, ids, embeddings):
+        if ann_index.keeps_full_vectors(self.index_config):
+            self.vectors = VectorStore.write(self.vectors_path, ids, embeddings)
+        else:
+            self.vectors = None
+            if os.path.exists(self.vectors_path):
+                shutil.rmtree(self.vectors_path)
+
+    def _update_index(self, df, hashes):
+        if not ann_index.supports_remove(self.index_config):
+            current = dict(zip(df['url'], hashes))
+            if any(current.get(url) != doc_hash for url, (_, doc_hash) in self.doc_hashes.items()):
+                print(f"{self.index_config['index_type']} index cannot remove vectors, rebuilding...")
+                self._rebuild_index(df, hashes)
+                return
+        self._start_update()
+        changed = self.changed_documents(df)
+        if len(changed):
+            self.update_documents(changed, self.embed_documents(changed))
+        self.finish_update()
+
+    def start_update(self):
+        # Incremental counterpart of start_bulk_index: every chunk of the new
+        # corpus goes through changed_documents(), and only the rows it
+        # returns are embedded and passed to update_documents(). Pages not
+        # seen by finish_update() are deleted. Returns False when the index
+        # has to be rebuilt instead (no content hashes, another index type or
+        # shard layout, or HNSW, which cannot drop the vectors of changed pages).
+        self._check_writable()
+        if not self._can_update_incrementally() or not ann_index.supports_remove(self.index_config):
+            return False
+        self._start_update()
+        return True
+
+    def _start_update(self):
+        next_id = max((doc_id for doc_id, _ in self.doc_hashes.values()), default=-1) + 1
+        self._delta = {"next_id": next_id, "seen": set(), "stale_ids": [], "ids": [], "embeddings": [],
+                       "records": [], "filter_columns": []}
+
+    def changed_documents(self, df):
+        # Rows of df that are new or whose content changed since the last build
+        if self._delta is None:
+            raise ValueError("Call start_update() before changed_documents()")
+        changed = []
+        for pos, (url, text) in enumerate(zip(df['url'], self._full_text(df))):
+            self._delta["seen"].add(url)
+            known = self.doc_hashes.get(url)
+            if known is None or known[1] != self._text_hash(url, text):
+                changed.append(pos)
+        return df.iloc[changed]
+
+    def update_documents(self, df, embeddings):
+        # Changed pages keep their document ID and replace their old vector;
+        # new pages get the next free IDs
+        delta = self._delta
+        if delta is None:
+            raise ValueError("Call start_update() before update_documents()")
+        ids, stale = [], []
+        for url in df['url']:
+            known = self.doc_hashes.get(url)
+            if known is not None:
+                stale.append(known[0])
+                ids.append(known[0])
+            else:
+                ids.append(delta["next_id"])
+                delta["next_id"] += 1
+        ids = np.array(ids, dtype='int64')
+        if stale:
+            self.index.remove_ids(np.array(stale, dtype='int64'))
+        self.index.add_with_ids(embeddings, ids)
+
+        for doc_id, (_, row), text in zip(ids, df.iterrows(), self._full_text(df)):
+            delta["records"].append((int(doc_id), self._row_metadata(row)))
+            self.doc_hashes[row['url']] = (int(doc_id), self._text_hash(row['url'], text))
+        delta["stale_ids"].extend(stale)
+        delta["ids"].append(ids)
+        if self.vectors is not None:
+            delta["embeddings"].append(embeddings)
+        delta["filter_columns"].append((df['url'].to_numpy(dtype=object), df['depth'].to_numpy(dtype=object),
+                                        df['last_crawled'].to_numpy(dtype=object)))
+
+    def finish_update(self):
+        delta, self._delta = self._delta, None
+        if delta is None:
+            raise ValueError("Call start_update() before finish_update()")
+        removed_urls = [url for url in self.doc_hashes if url not in delta["seen"]]
+        removed_ids = [self.doc_hashes.pop(url)[0] for url in removed_urls]
+        changed_ids = np.concatenate(delta["ids"]) if delta["ids"] else np.zeros(0, dtype='int64')
+        n_changed = len(delta["stale_ids"])
+        if not len(changed_ids) and not removed_ids:
+            print("No new, changed or deleted documents to index.")
+            return
+        if removed_ids:
+            self.index.remove_ids(np.array(removed_ids, dtype='int64'))
+        stale_ids = delta["stale_ids"] + removed_ids
+
+        if self.vectors is not None:
+            embeddings = np.concatenate([np.zeros((0, self.index.d), dtype='float32')] + delta["embeddings"])
+            self.vectors = self.vectors.merge(stale_ids, changed_ids, embeddings)
+        self._save_index(records=merge_records(self.metadata, stale_ids, delta["records"]))
+        if self.filters is None:
+            # Index built before filter data existed: read it all once
+            self.filters = id_filters.FilterIndex.from_records(
+                self.filters_path, self.metadata.iter_records(id_filters.FILTER_FIELDS))
+        else:
+            columns = [np.concatenate(c) for c in zip(*delta["filter_columns"])] or [[], [], []]
+            self.filters = self.filters.update(stale_ids, changed_ids, *columns)
+        print(f"✅ Re-indexed {len(changed_ids)} documents "
+              f"({n_changed} changed, {len(changed_ids) - n_changed} new), removed {len(removed_ids)}.")
+
+    def start_bulk_index(self, expected_documents=None):
+        # Full rebuild fed chunk by chunk (see ingest.py), so only one chunk of
+        # rows and embeddings is in memory at a time. IVF/PQ indexes are
+        # trained on the first chunk. Range sharding needs expected_documents.
+        self._check_writable()
+        self.index = None
+        self.doc_hashes = {}
+        router = self._new_router(expected_documents)
+        writer = MetadataStoreWriter(self.meta_path) if router is None else ShardedMetadataWriter(self.shards_path, router)
+        self._bulk = {"writer": writer, "router": router, "vectors": None, "trained": {}, "next_id": 0,
+                      "filter_columns": []}
+
+    def embed_documents(self, df):
+        return self._encode(self._full_text(df).tolist())
+
+    def append_documents(self, df, embeddings):
+        # Rows must not repeat URLs already appended in this rebuild
+        if self._bulk is None:
+            raise ValueError("Call start_bulk_index() before append_documents()")
+        if self.index is None:
+            self.index, self._bulk["trained"] = self._new_index(embeddings.shape[1], embeddings, self._bulk["router"])
+            if ann_index.keeps_full_vectors(self.index_config):
+                self._bulk["vectors"] = VectorStoreWriter(self.vectors_path, embeddings.shape[1])
+
+        start = self._bulk["next_id"]
+        ids = np.arange(start, start + len(df), dtype='int64')
+        self.index.add_with_ids(embeddings, ids)
+        if self._bulk["vectors"] is not None:
+            self._bulk["vectors"].append(ids, embeddings)
+
+        writer = self._bulk["writer"]
+        for doc_id, (_, row), text in zip(ids, df.iterrows(), self._full_text(df)):
+            writer.append(doc_id, self._row_metadata(row))
+            self.doc_hashes[row['url']] = (int(doc_id), self._text_hash(row['url'], text))
+        self._bulk["filter_columns"].append((ids, df['url'].to_numpy(dtype=object), df['depth'].to_numpy(dtype=object),
+                                             df['last_crawled'].to_numpy(dtype=object)))
+        self._bulk["next_id"] = start + len(df)
+
+    def finish_bulk_index(self):
+        bulk, self._bulk = self._bulk, None
+        if self.index is None:
+            raise ValueError("No documents were appended to the index")
+        self.metadata = bulk["writer"].close()
+        if bulk["vectors"] is not None:
+            self.vectors = bulk["vectors"].close()
+        else:
+            self._save_vectors(None, None)
+        self._save_index(bulk["trained"])
+        self.filters = id_filters.FilterIndex.build(self.filters_path,
+                                                    *(np.concatenate(c) for c in zip(*bulk["filter_columns"])))
+        print(f"✅ Indexed {bulk['next_id']} documents ({ann_index.describe(self.index_config)}).")
+
+    def close(self):
+        if isinstance(self.index, ShardedIndex):
+            self.index.close()
+
+    def reload(self):
+        self.index = None
+        self.metadata = None
+        self.vectors = None
+        self._load_index()
 
-    def search(self, query, top_k=10):
+    def _encode_queries(self, queries):
+        query_embeddings = self.model.encode(queries, convert_to_numpy=True, batch_size=max(len(queries), 1))
+        query_embeddings = np.ascontiguousarray(query_embeddings, dtype='float32')
+        faiss.normalize_L2(query_embeddings)
+        return query_embeddings
+
+    def encode_queries(self, queries):
+        if self.embedding_cache is None:
+            return self._encode_queries(queries)
+        return self.embedding_cache.encode(queries, self._encode_queries)
+
+    def _reconstruct(self, ids):
+        # Stored vectors of `ids` for an exact scan, or None when the index
+        # cannot return them by ID (IVF keeps no ID -> vector map)
+        if self.vectors is not None:
+            return self.vectors.vectors_for(ids)[0]
+        shards = self.index.shards if isinstance(self.index, ShardedIndex) else [self.index]
+        if not all(isinstance(shard, faiss.IndexIDMap2) for shard in shards):
+            return None
+        if isinstance(self.index, ShardedIndex):
+            vectors = np.empty((len(ids), self.index.d), dtype='float32')
+            for shard, positions in zip(shards, self.index.router.split(ids)):
+                if len(positions):
+                    vectors[positions] = shard.reconstruct_batch(ids[positions])
+            return vectors
+        return self.index.reconstruct_batch(ids)
+
+    def _search_index(self, query_embeddings, k, sel=None, selectivity=1.0):
+        # index.search, restricted to the IDs of the IDSelector `sel` if given
+        if sel is None:
+            return self.index.search(query_embeddings, k)
+
+        def make_params():
+            return id_filters.search_parameters(self.index_config, sel, selectivity, k)
+        if isinstance(self.index, ShardedIndex):
+            return self.index.search(query_embeddings, k, make_params=make_params)
+        return self.index.search(query_embeddings, k, params=make_params())
+
+    def search_vectors(self, query_embeddings, top_k=10, search_filter=None):
+        # search_filter (id_filters.SearchFilter) restricts the results to
+        # matching documents
         if self.index is None:
             raise ValueError("Index not loaded. Run preprocess_and_index() first.")
-
-        query_embedding = self.model.encode([query], convert_to_numpy=True)
-        faiss.normalize_L2(query_embedding)
-
-        distances, indices = self.index.search(query_embedding, top_k)
+        sel, selectivity = None, 1.0
+        if search_filter:
+            if self.filters is None:
+                raise ValueError(f"The index in {self.cache_dir} has no filter data; rebuild it to filter searches")
+            ids = self.filters.select(search_filter)
+            if not len(ids):
+                return id_filters.empty_result(len(query_embeddings), top_k)
+            if len(ids) <= self.exact_scan_max:
+                vectors = self._reconstruct(ids)
+                if vectors is not None:
+                    return id_filters.exact_search(query_embeddings, ids, vectors, top_k)
+            sel = id_filters.selector(ids, self.filters.id_bound)
+            selectivity = len(ids) / len(self.filters)
+        factor = ann_index.rerank_factor(self.index_config)
+        if factor < 1 or self.vectors is None:
+            return self._search_index(query_embeddings, top_k, sel, selectivity)
+        # Over-fetch from the compressed index, then rescore at full precision
+        _, candidates = self._search_index(query_embeddings, top_k * factor, sel, selectivity)
+        return rerank(query_embeddings, candidates, self.vectors.vectors_for, top_k)
+
+    def hydrate(self, distances, indices, include_body=False):
+        # Only the top-k rows are read from the memory-mapped store
+        fields = RESULT_FIELDS + ("body_text",) if include_body else RESULT_FIELDS
         hits = []
-        for dist, idx in zip(distances[0], indices[0]):
+        for dist, idx, meta in zip(distances, indices, self.metadata.get_many(indices, fields)):
             if idx == -1:
                 continue
-            meta = self.id_to_metadata.get(idx, {})
-            hits.append({
+            hit = {
                 "url": meta.get("url", ""),
                 "title": meta.get("title", ""),
                 "meta_description": meta.get("meta_description", ""),
-                "score": dist
-            })
-
+                "score": float(dist)
+            }
+            if include_body:
+                hit["body_text"] = meta.get("body_text", "")
+            hits.append(hit)
         return hits
+
+    def search_batch(self, queries, top_k=10, include_body=False, search_filter=None):
+        # One encode call and one index.search for the whole batch. top_k may be
+        # a single value or one value per query.
+        top_ks = top_k if isinstance(top_k, (list, tuple)) else [top_k] * len(queries)
+        distances, indices = self.search_vectors(self.encode_queries(queries), max(top_ks), search_filter)
+        return [
+            self.hydrate(distances[i][:k], indices[i][:k], include_body)
+            for i, k in enumerate(top_ks)
+        ]
+
+    def search(self, query, top_k=10, include_body=False, search_filter=None):
+        return self.search_batch([query], top_k, include_body, search_filter)[0]
@@ -0,0 +1,132 @@
+import os
+import json
+import shutil
+import numpy as np
+
+# Full-precision copy of the indexed embeddings, keyed by FAISS ID, used to
+# rescore candidates returned by a compressed (quantized) index.
+#
+#   <path>/manifest.json    row count and dimension
+#   <path>/ids.npy          sorted int64 document IDs (row i <-> ids[i])
+#   <path>/vectors.f32      (count, dim) row-major float32
+#
+# Both files are memory-mapped, so a rerank only reads the candidate rows and
+# server processes share the pages instead of each holding the vectors.
+
+STORE_VERSION = 1
+WRITE_BLOCK_SIZE = 65536
+
+
+class VectorStoreWriter:
+    def __init__(self, path, dim):
+        self.path = path
+        self.dim = dim
+        self.tmp_path = path.rstrip(os.sep) + ".tmp"
+        if os.path.exists(self.tmp_path):
+            shutil.rmtree(self.tmp_path)
+        os.makedirs(self.tmp_path)
+        self.ids = []
+        self.last_id = -1
+        self.vectors = open(os.path.join(self.tmp_path, "vectors.f32"), "wb")
+
+    def append(self, ids, vectors):
+        ids = np.asarray(ids, dtype='int64')
+        if len(ids) == 0:
+            return
+        if ids[0] <= self.last_id or np.any(np.diff(ids) <= 0):
+            raise ValueError("Document IDs must be written in increasing order")
+        self.ids.append(ids)
+        self.last_id = int(ids[-1])
+        self.vectors.write(np.ascontiguousarray(vectors, dtype='float32').tobytes())
+
+    def close(self):
+        self.vectors.close()
+        ids = np.concatenate(self.ids) if self.ids else np.zeros(0, dtype='int64')
+        np.save(os.path.join(self.tmp_path, "ids.npy"), ids)
+        with open(os.path.join(self.tmp_path, "manifest.json"), "w") as f:
+            json.dump({"version": STORE_VERSION, "count": len(ids), "dim": self.dim}, f, indent=2)
+
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
+        os.replace(self.tmp_path, self.path)
+        return VectorStore(self.path)
+
+
+class VectorStore:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "manifest.json")) as f:
+            manifest = json.load(f)
+        if manifest["version"] != STORE_VERSION:
+            raise ValueError(f"Unsupported vector store version {manifest['version']} in {path}")
+        self.dim = manifest["dim"]
+        self.ids = np.load(os.path.join(path, "ids.npy"), mmap_mode="r")
+        vectors_path = os.path.join(path, "vectors.f32")
+        # np.memmap cannot map an empty file
+        self.vectors = (np.memmap(vectors_path, dtype='float32', mode='r', shape=(len(self.ids), self.dim))
+                        if len(self.ids) else np.zeros((0, self.dim), dtype='float32'))
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, "manifest.json"))
+
+    @classmethod
+    def write(cls, path, ids, vectors):
+        # ids in increasing order; vectors may be a memmap, it is copied in blocks
+        writer = VectorStoreWriter(path, vectors.shape[1])
+        for start in range(0, len(ids), WRITE_BLOCK_SIZE):
+            writer.append(ids[start:start + WRITE_BLOCK_SIZE], vectors[start:start + WRITE_BLOCK_SIZE])
+        return writer.close()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def rows_for(self, doc_ids):
+        doc_ids = np.asarray(doc_ids, dtype='int64')
+        if len(self.ids) == 0:
+            return np.full(len(doc_ids), -1, dtype='int64')
+        rows = np.minimum(np.searchsorted(self.ids, doc_ids), len(self.ids) - 1)
+        return np.where(self.ids[rows] == doc_ids, rows, -1)
+
+    def vectors_for(self, doc_ids):
+        # (vectors, found); rows of unknown IDs are zero
+        rows = self.rows_for(doc_ids)
+        found = rows >= 0
+        vectors = np.zeros((len(rows), self.dim), dtype='float32')
+        vectors[found] = self.vectors[rows[found]]
+        return vectors, found
+
+    def merge(self, drop_ids, new_ids, new_vectors):
+        # Rewrites the store without drop_ids and with the new rows, in ID order
+        keep = np.flatnonzero(~np.isin(self.ids, np.asarray(drop_ids, dtype='int64')))
+        new_ids = np.asarray(new_ids, dtype='int64')
+        ids = np.concatenate([np.asarray(self.ids)[keep], new_ids])
+        order = np.argsort(ids, kind='stable')
+
+        writer = VectorStoreWriter(self.path, self.dim)
+        for start in range(0, len(order), WRITE_BLOCK_SIZE):
+            block = order[start:start + WRITE_BLOCK_SIZE]
+            vectors = np.empty((len(block), self.dim), dtype='float32')
+            old = block < len(keep)
+            vectors[old] = self.vectors[keep[block[old]]]
+            vectors[~old] = new_vectors[block[~old] - len(keep)]
+            writer.append(ids[block], vectors)
+        return writer.close()
+
+
+def rerank(queries, candidates, vectors_for, top_k):
+    # Exact inner-product rescoring of ANN candidates. candidates is the
+    # (nq, c) ID array from index.search (-1 = empty slot) and vectors_for
+    # maps an ID array to (vectors, found). Returns (distances, indices)
+    # shaped (nq, top_k) like index.search.
+    nq, c = candidates.shape
+    vectors, found = vectors_for(candidates.ravel())
+    scores = np.einsum('qcd,qd->qc', vectors.reshape(nq, c, -1), queries)
+    valid = (candidates >= 0) & found.reshape(nq, c)
+    scores[~valid] = -np.inf
+
+    order = np.argsort(-scores, axis=1, kind='stable')[:, :top_k]
+    distances = np.take_along_axis(scores, order, axis=1).astype('float32')
+    indices = np.take_along_axis(candidates, order, axis=1)
+    indices[~np.isfinite(distances)] = -1
+    return distances, indices